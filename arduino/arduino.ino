@@ -22,6 +22,13 @@
 #define GATE_CLOSE 52       // Servo close position
 #define GATE_NEUTRAL 92     // Servo neutral position
 
+// 1: compact binary frames (seq + CRC), 0: legacy "S1,S2,S3,UPDATE" CSV lines
+#define SERIAL_BINARY 0
+#define FRAME_SYNC1 0xA5
+#define FRAME_SYNC2 0x5A
+#define FRAME_VERSION 1
+#define FRAME_STATUS 0x01
+
 // Системийг дахин эхлүүлэх функц
 void(* resetFunc) (void) = 0; 
 
@@ -41,6 +48,8 @@ void handleCarEntering();
 void handleCarExiting();
 void Read_Sensor();
 bool sendStatusToSerial();
+void sendStatusFrame();
+uint16_t crc16(const uint8_t *data, uint8_t len);
 bool rfunc();
 void smoothOpenGate();
 void smoothCloseGate();
@@ -298,7 +307,10 @@ void smoothCloseGate() {
 // Serial мэдээлэл илгээх функцийг сайжруулах
 bool sendStatusToSerial() {
   if (!Serial) return false;
-  
+
+#if SERIAL_BINARY
+  sendStatusFrame();
+#else
   Serial.print(S1);
   Serial.print(",");
   Serial.print(S2);
@@ -306,9 +318,49 @@ bool sendStatusToSerial() {
   Serial.print(S3);
   Serial.print(",");
   Serial.println("UPDATE");  // Статус шинэчлэгдсэн тэмдэг
+#endif
   return true;
 }
 
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), bridge талын crc16-тай ижил
+uint16_t crc16(const uint8_t *data, uint8_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// A5 5A | len | version | type | seq (LE) | slot count | slot bitfield | crc (LE)
+void sendStatusFrame() {
+  static uint16_t seq = 0;
+  const uint8_t slotBytes = (MaxSlots + 7) / 8;
+  uint8_t frame[8 + slotBytes];
+
+  frame[0] = 5 + slotBytes;
+  frame[1] = FRAME_VERSION;
+  frame[2] = FRAME_STATUS;
+  frame[3] = seq & 0xFF;
+  frame[4] = seq >> 8;
+  frame[5] = MaxSlots;
+  int slots[MaxSlots] = {S1, S2, S3};
+  for (uint8_t i = 0; i < slotBytes; i++) frame[6 + i] = 0;
+  for (uint8_t i = 0; i < MaxSlots; i++) {
+    if (slots[i]) frame[6 + i / 8] |= 1 << (i % 8);
+  }
+  uint16_t crc = crc16(frame, 6 + slotBytes);
+  frame[6 + slotBytes] = crc & 0xFF;
+  frame[7 + slotBytes] = crc >> 8;
+
+  Serial.write(FRAME_SYNC1);
+  Serial.write(FRAME_SYNC2);
+  Serial.write(frame, 8 + slotBytes);
+  seq++;
+}
+
 // Хуучин rfunc() функцийг өөрчлөх
 bool rfunc() {
   if (!rfid.PICC_IsNewCardPresent()) return false;
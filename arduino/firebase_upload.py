@@ -1,11 +1,38 @@
 import serial
+import base64
+import queue
 import time
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions as google_exceptions
+from google.auth import exceptions as auth_exceptions
 import traceback
 import os
+import socket
 import sys
-import serial.tools.list_ports
+import threading
+from datetime import datetime, timezone
+
+from frame_protocol import StatusFrame
+from parking_registry import DeviceRegistry
+from serial_ingest import SerialIngestor
+from sessions import DEFAULT_PRICE_PER_HOUR, SessionLedger, decode_sessions, encode_sessions
+from slot_state import DEBOUNCE_SECONDS, HEARTBEAT_INTERVAL, SlotStateDebouncer
+from write_behind import (PERMANENT, TRANSIENT, ReadingSpool, WriteBehindUploader,
+                          classify_error)
+
+# Debounce/heartbeat settings (секундээр), heartbeat бичих төхөөрөмжийн нэр
+DEBOUNCE = float(os.environ.get('ARDUINO_DEBOUNCE', DEBOUNCE_SECONDS))
+HEARTBEAT = float(os.environ.get('ARDUINO_HEARTBEAT', HEARTBEAT_INTERVAL))
+DEVICE_ID = os.environ.get('ARDUINO_DEVICE_ID', socket.gethostname())
+# devices/{самбар} бүртгэлгүй самбаруудын очих зогсоол
+PARKING_ID = os.environ.get('ARDUINO_PARKING_ID')
+# Тогтмол портууд (таслалаар, жишээ нь "COM7,COM8") ба USB-ээр автоматаар хайх эсэх
+SERIAL_PORTS = [port.strip() for port in os.environ.get('ARDUINO_PORTS', '').split(',') if port.strip()]
+SERIAL_SCAN = os.environ.get('ARDUINO_SCAN', '1') != '0'
+# Зогсоолд 'price' байхгүй үеийн session-ий цагийн үнэ, хаагдсан session-уудыг нэг batch болгож илгээх тоо
+PRICE_PER_HOUR = float(os.environ.get('ARDUINO_PRICE', DEFAULT_PRICE_PER_HOUR))
+SESSION_BATCH = int(os.environ.get('ARDUINO_SESSION_BATCH', 200))
 
 def test_firebase_connection():
     try:
@@ -34,57 +61,6 @@ def test_serial_connection(port='COM7'):
         return False
     return False
 
-def is_port_in_use(port):
-    """COM порт ашиглагдаж байгаа эсэхийг шалгах"""
-    try:
-        # Түр зуур нээж үзэх
-        test_serial = serial.Serial(port, 9600)
-        test_serial.close()
-        return False
-    except serial.SerialException:
-        return True
-
-def wait_for_port(port='COM7', timeout=30):
-    """COM порт боломжтой болохыг хүлээх"""
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if not is_port_in_use(port):
-            return True
-        print(f"[WAIT] COM порт {port} ашиглагдаж байна, хүлээж байна...")
-        time.sleep(2)
-    return False
-
-def find_arduino_port():
-    """Arduino холбогдсон COM портыг хайх"""
-    ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        if 'Arduino' in port.description:
-            return port.device
-    return 'COM7'  # Default port if Arduino not found
-
-def connect_to_arduino(port='COM7', max_attempts=3):
-    """Arduino-тай холбогдох"""
-    attempt = 0
-    while attempt < max_attempts:
-        try:
-            if not wait_for_port(port, timeout=5):  # Reduce timeout to 5 seconds
-                attempt += 1
-                print(f"[RETRY] Холболтын оролдлого {attempt}/{max_attempts}")
-                continue
-
-            ser = serial.Serial(port, 9600, timeout=1)
-            print(f"[OK] {port} порттой холбогдлоо")
-            return ser
-        except KeyboardInterrupt:
-            print("\n[INFO] Хэрэглэгч програмыг зогсоолоо")
-            raise
-        except Exception as e:
-            print(f"[ERROR] Холболтын алдаа: {e}")
-            attempt += 1
-            if attempt < max_attempts:
-                time.sleep(2)
-    return None
-
 # Get absolute path to config file
 current_dir = os.path.dirname(os.path.abspath(__file__))
 config_path = os.path.join(current_dir, "firebase_config.json")
@@ -105,49 +81,9 @@ def initialize_firebase():
         print(f"[ERROR] Firebase initialization failed: {e}")
         return False
 
-def update_slots_available(db, total_occupied: int):
-    try:
-        batch = db.batch()
-        success = False
-        
-        parking_docs = db.collection('parkings').stream()
-        for doc in parking_docs:
-            try:
-                parking_data = doc.to_dict()
-                if not parking_data or 'slots_available' not in parking_data:
-                    continue
-                
-                slots_data = parking_data['slots_available']
-                total_slots = int(slots_data.split('/')[1])
-                price = float(parking_data.get('price', '500'))  # Default price 500
-                
-                updates = {
-                    'slots_available': f"{total_slots - total_occupied}/{total_slots}",
-                    'last_updated': firestore.SERVER_TIMESTAMP,
-                    'arduino_status': {
-                        'slot_1': 'Full' if total_occupied > 0 else 'Empty',
-                        'slot_2': 'Full' if total_occupied > 1 else 'Empty', 
-                        'slot_3': 'Full' if total_occupied > 2 else 'Empty',
-                    },
-                    'current_amount': total_occupied * price  # Calculate total amount
-                }
-                
-                batch.update(doc.reference, updates)
-                success = True
-                
-            except Exception as e:
-                print(f"[ERROR] Failed to update parking {doc.id}: {e}")
-                continue
-        
-        if success:
-            batch.commit()
-            return True
-            
-        return False
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to update parkings: {e}")
-        return False
+def sensor_fields(reading):
+    """Уншилтын s1..sN сенсорын талбарууд"""
+    return {key: value for key, value in reading.items() if key[:1] == 's' and key[1:].isdigit()}
 
 # Initialize Firebase and test connection
 try:
@@ -157,69 +93,191 @@ except Exception as e:
     print(f"[ERROR] Setup failed: {e}")
     exit(1)
 
-# Test and initialize serial connection
-try:
-    arduino_port = find_arduino_port()
-    print(f"[INFO] Arduino порт: {arduino_port}")
-    ser = connect_to_arduino(arduino_port)
-    if not ser:
-        print("[ERROR] Arduino-тай холбогдож чадсангүй")
-        exit(1)
-except KeyboardInterrupt:
-    print("\n[INFO] Программ зогссон")
-    sys.exit(0)
+# Самбар бүрийн төхөөрөмж -> зогсоол -> слот бүртгэл, debounce төлөв
+registries = {}
+debouncers = {}
+# Writer thread болон үндсэн loop зэрэг бүртгэл үүсгэж болно
+registries_lock = threading.Lock()
 
-def upload_to_firebase(s1: int, s2: int, s3: int, user_id: str) -> bool:
-    max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            db = firestore.client()
-            total_occupied = s1 + s2 + s3
-            
-            # Update arduino_data collection
-            status_data = {
-                's1': s1,
-                's2': s2,
-                's3': s3,
-                'user_id': user_id,
-                'timestamp': firestore.SERVER_TIMESTAMP,
-                'total_occupied': total_occupied,
-                'parking_id': None  # Will be updated by Cloud Functions
-            }
-            
-            # Add to arduino_data to trigger Cloud Function
-            db.collection('arduino_data').add(status_data)
-            
-            # Update parking slots
-            update_slots_available(db, total_occupied)
-            
-            print(f"[OK] Arduino data uploaded and slots updated")
-            return True
-            
-        except Exception as e:
-            retry_count += 1
-            print(f"[ERROR] Firebase алдаа (оролдлого {retry_count}/{max_retries}):", str(e))
-            if retry_count < max_retries:
-                time.sleep(2)
-                continue
-            return False
-    return False
+def board_id(tag):
+    """Firestore document id болгож болох самбарын нэр"""
+    return tag.strip('/').replace('/', '_') or DEVICE_ID
 
-def check_connections():
-    """Бүх холболтуудыг шалгах"""
-    if not test_firebase_connection():
-        print("[ERROR] Firebase холболт тасарсан")
-        print("[ERROR] Arduino холболт тасарсан")
-        return False
+def board_registry(tag):
+    """Самбарын бүртгэлийг (анх удаа бол snapshot listener эхлүүлж) авах"""
+    with registries_lock:
+        if tag not in registries:
+            registries[tag] = DeviceRegistry(firestore.client(), board_id(tag),
+                                             fallback_parking_id=PARKING_ID).start(timeout=5)
+        return registries[tag]
+
+def board_debouncer(tag):
+    if tag not in debouncers:
+        board_registry(tag)
+        debouncers[tag] = SlotStateDebouncer(debounce=DEBOUNCE, heartbeat_interval=HEARTBEAT)
+    return debouncers[tag]
+
+def write_readings(db, rows) -> None:
+    """Spool-ийн уншилтуудыг нэг batch-аар arduino_data-д бичих
+
+    Зогсоолын document-ийг энд бичихгүй: process_arduino_data слот бүрийн
+    төлөв, counter shard-ийг шинэчилж aggregate_occupancy нэгтгэнэ.
+    """
+    batch = db.batch()
+    for spool_id, reading in rows:
+        if reading.get('kind') == 'sessions':
+            # Хаагдсан session-ууд нэг document-д кодлогдсон binary хэлбэрээр
+            batch.set(db.collection('session_batches').document(f"{DEVICE_ID}-{spool_id}"), {
+                'gateway_id': DEVICE_ID,
+                'count': reading['count'],
+                'amount': reading['amount'],
+                'sessions': base64.b64decode(reading['blob']),
+                'captured_at': datetime.fromtimestamp(reading['captured_at'], timezone.utc),
+                'timestamp': firestore.SERVER_TIMESTAMP
+            })
+            continue
+        # Хуучин spool-д самбарын нэргүй уншилт үлдсэн байж болно
+        reading.setdefault('device', DEVICE_ID)
+        device = board_id(reading['device'])
+        sensors = sensor_fields(reading)
+        resolved = board_registry(reading['device']).resolve(len(sensors))
+        # Тогтмол document id-тай тул дахин илгээхэд давхардахгүй
+        doc_id = f"{device}-{int(reading['captured_at'] * 1000)}-{spool_id}"
+        batch.set(db.collection('arduino_data').document(doc_id), {
+            **sensors,
+            'user_id': reading['user_id'],
+            'timestamp': firestore.SERVER_TIMESTAMP,
+            'captured_at': datetime.fromtimestamp(reading['captured_at'], timezone.utc),
+            'total_occupied': reading['total_occupied'],
+            'device_id': device,
+            'gateway_id': DEVICE_ID,
+            'parking_id': resolved[0] if resolved else None
+        })
+    batch.commit()
+    print(f"[OK] {len(rows)} Arduino data uploaded")
+
+# Уншилтаас үл хамаарах (сүлжээ, квот, сервер) Firestore-ийн алдаанууд
+TRANSIENT_ERRORS = (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+                    google_exceptions.InternalServerError, google_exceptions.TooManyRequests,
+                    google_exceptions.Aborted, google_exceptions.GatewayTimeout,
+                    google_exceptions.RetryError, auth_exceptions.TransportError)
+
+def classify_write_error(error):
+    """Writer-ийн дахин оролдох бодлогод Firestore-ийн алдааг ангилах"""
+    if isinstance(error, TRANSIENT_ERRORS):
+        return TRANSIENT
+    if isinstance(error, google_exceptions.BadRequest):
+        # InvalidArgument гэх мэт: уншилт өөрөө бичигдэх боломжгүй
+        return PERMANENT
+    return classify_error(error)
+
+def write_heartbeat(db, payload) -> None:
+    """Төлөв өөрчлөгдөөгүй үед gateway амьд байгааг батлах бичилт"""
+    # arduino_data-д бичихгүй тул Cloud Function дуудагдахгүй
+    db.collection('arduino_heartbeats').document(DEVICE_ID).set({
+        'last_seen': firestore.SERVER_TIMESTAMP,
+        **payload
+    }, merge=True)
+    print(f"[OK] Heartbeat илгээлээ ({payload['uploads']} бичилт, {payload['suppressed']} алгассан)")
+
+def upload_to_firebase(slots, user_id: str, device: str) -> bool:
+    """Уншилтыг background writer-т дамжуулах (сүлжээ хүлээхгүй)"""
+    return uploader.submit({
+        'device': device,
+        **{f's{i}': occupied for i, occupied in enumerate(slots, 1)},
+        'user_id': user_id,
+        'total_occupied': sum(slots),
+        'captured_at': time.time()
+    })
+
+def slot_keys(tag, count):
+    """Самбарын сенсор бүрийн session-ий слотын нэр ("<зогсоол>/<слот>")"""
+    resolved = board_registry(tag).resolve(count)
+    if resolved is None:
+        return [f"{board_id(tag)}/s{i}" for i in range(1, count + 1)]
+    parking_id, slots = resolved
+    return [f"{parking_id}/{slots.get(f's{i}', f'slot_{i}')}" for i in range(1, count + 1)]
+
+def parking_price(slot_id):
+    """Session-ий слотын ("<зогсоол>/<слот>") зогсоолын цагийн үнэ эсвэл None"""
+    parking_id = slot_id.partition('/')[0]
+    with registries_lock:
+        boards = list(registries.values())
+    for board_reg in boards:
+        price = board_reg.price(parking_id)
+        if price is not None:
+            return price
+    return None
+
+def flush_sessions() -> int:
+    """Хаагдсан session-уудыг кодлоод writer-ийн spool-оор илгээлгэх"""
+    closed = ledger.closed_sessions()
+    if not closed:
+        return 0
+    if not uploader.submit({
+            'kind': 'sessions',
+            'blob': base64.b64encode(encode_sessions(closed)).decode('ascii'),
+            'count': len(closed),
+            'amount': round(sum(session.amount for session in closed), 2),
+            'captured_at': time.time()
+    }):
+        # Ledger-д үлдэж дараагийн flush-аар дахин илгээгдэнэ
+        print(f"[ERROR] {len(closed)} хаагдсан session-ийг илгээх дараалалд хийж чадсангүй")
+        return 0
+    ledger.drain_closed(len(closed))
+    return len(closed)
+
+def save_active_sessions() -> None:
+    """Нээлттэй session-уудыг дахин эхлэхэд сэргээхээр файлд хадгалах"""
+    tmp_path = SESSIONS_PATH + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_sessions(ledger.active_sessions()))
+    os.replace(tmp_path, SESSIONS_PATH)
+
+def send_heartbeat() -> bool:
+    """Бүх самбарын heartbeat-ийг writer thread-ээр нэг бичилтээр илгээлгэх"""
+    flush_sessions()
+    boards = {
+        board_id(tag): {
+            'state': list(debouncer.committed[:-1]) if debouncer.committed else None,
+            **debouncer.stats()
+        }
+        for tag, debouncer in list(debouncers.items())
+    }
+    uploader.submit_heartbeat({
+        'boards': boards,
+        'ports': ingestor.status(),
+        'sessions': ledger.stats(),
+        'uploads': sum(board['uploads'] for board in boards.values()),
+        'suppressed': sum(board['suppressed'] for board in boards.values()),
+        **{f'writer_{k}': v for k, v in uploader.stats().items()}
+    })
+    for debouncer in list(debouncers.values()):
+        debouncer.mark_heartbeat()
     return True
 
+def flush_state(tag, state) -> None:
+    """Debounce-оос гарсан төлөвийг writer-т өгч commit хийх"""
+    *slots, user_id = state
+    if upload_to_firebase(slots, user_id, tag):
+        debouncers[tag].commit(state)
+        print("[OK] Илгээх дараалалд орлоо")
+        # Слот дүүрэхэд session нээгдэж, суларахад хугацаагаар нь төлбөр бодогдоно
+        keys = slot_keys(tag, len(slots))
+        for session in ledger.observe(
+                {key: 'Full' if occupied else 'Empty' for key, occupied in zip(keys, slots)}, time.time()):
+            print(f"[INFO] {session.slot_id} session хаагдлаа: "
+                  f"{session.duration_seconds / 60:.0f} мин, {session.amount}₮")
+        if ledger.pending_closed() >= SESSION_BATCH:
+            flush_sessions()
+    else:
+        print("[ERROR] Хадгалж чадсангүй")
+
 def reset_arduino():
     """Arduino-г дахин ачаалах"""
     try:
-        if ser.is_open:
-            ser.write(b'RESET\n')  # Arduino рүү reset команд илгээх
+        # Холбогдсон бүх Arduino рүү reset команд илгээх
+        if ingestor.write_all(b'RESET\n'):
             time.sleep(2)  # Arduino-г дахин ачаалахыг хүлээх
             print("[OK] Arduino дахин ачаалав")
     except Exception as e:
@@ -229,50 +287,102 @@ def cleanup():
     """Холболтуудыг аюулгүй хаах"""
     print("\n[INFO] Программыг зогсоож байна...")
     try:
-        if 'ser' in globals() and ser.is_open:
-            ser.write(b'RESET\n')  # Reset команд илгээх
-            time.sleep(1)
-            ser.close()
-            print("[OK] Serial port хаагдлаа")
+        flush_sessions()
+        save_active_sessions()
+        print(f"[OK] {len(ledger)} нээлттэй session хадгалагдлаа")
+    except Exception as e:
+        print("[ERROR] Session хадгалахад алдаа гарлаа:", e)
+    
+    try:
+        # Илгээгээгүй уншилтууд spool-д үлдэж дараагийн эхлэлд илгээгдэнэ
+        uploader.stop()
+        print(f"[OK] Writer зогслоо: {uploader.stats()}")
+    except Exception as e:
+        print("[ERROR] Writer зогсооход алдаа гарлаа:", e)
+    
+    try:
+        if 'ingestor' in globals():
+            if ingestor.write_all(b'RESET\n'):  # Reset команд илгээх
+                time.sleep(1)
+            ingestor.stop()
+            print("[OK] Serial portууд хаагдлаа")
     except Exception as e:
         print("[ERROR] Serial port хаахад алдаа гарлаа:", e)
     
+    try:
+        for board_reg in list(registries.values()):
+            board_reg.stop()
+    except Exception as e:
+        print("[ERROR] Бүртгэлийн listener зогсооход алдаа гарлаа:", e)
+    
     try:
         firebase_admin.delete_app(firebase_admin.get_app())
         print("[OK] Firebase холболт хаагдлаа")
     except Exception as e:
         print("[ERROR] Firebase хаахад алдаа гарлаа:", e)
 
+# Serial уншилтыг Firestore бичилтээс салгах writer, restart-д тэсвэртэй spool
+SPOOL_PATH = os.environ.get('ARDUINO_SPOOL', os.path.join(current_dir, "spool.sqlite3"))
+uploader = WriteBehindUploader(firestore.client, write_readings, ReadingSpool(SPOOL_PATH),
+                               write_heartbeat=write_heartbeat, classify=classify_write_error)
+uploader.start()
+
+# Слотын session-ууд; өмнөх ажиллагааны нээлттэй session-уудыг сэргээнэ.
+# Уншилтын user_id нь firmware-ийн "UPDATE" тул session-д хэрэглэгч холбохгүй
+SESSIONS_PATH = os.environ.get('ARDUINO_SESSIONS', os.path.join(current_dir, "sessions.bin"))
+ledger = SessionLedger(price_per_hour=PRICE_PER_HOUR, price_for=parking_price)
+if os.path.exists(SESSIONS_PATH):
+    try:
+        with open(SESSIONS_PATH, 'rb') as f:
+            ledger.restore(decode_sessions(f.read()))
+        print(f"[OK] {len(ledger)} нээлттэй session сэргээгдлээ")
+    except Exception as e:
+        print(f"[ERROR] Session сэргээж чадсангүй: {e}")
+
+# Бүх Arduino-гийн мөрүүд эх төхөөрөмжийн нэртэйгээ энэ дараалалд ирнэ
+lines = queue.Queue()
+ingestor = SerialIngestor(lambda tag, line: lines.put((tag, line)), ports=SERIAL_PORTS,
+                          scan=SERIAL_SCAN)
+ingestor.start()
+
 try:
     while True:
         try:
-            # 1 минут тутамд холболтуудыг шалгах
-            if time.time() % 60 == 0:
-                if not check_connections():
-                    print("[INFO] Холболтуудыг дахин тохируулж байна...")
-                    time.sleep(5)
-                    continue
-                
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8').strip()
-                # Зөвхөн зогсоолын төлөв агуулсан мөрийг шалгах
+            try:
+                # Мөр ирэх хүртэл блоклоно (сул үед CPU ашиглахгүй)
+                tag, line = lines.get(timeout=1.0)
+            except queue.Empty:
+                tag, line = None, None
+            
+            if isinstance(line, StatusFrame):
+                # Binary frame: CRC, дугаарлалт шалгагдаж давхардал хасагдсан
+                state = board_debouncer(tag).observe((*line.slots, 'UPDATE'))
+                if state is not None:
+                    flush_state(tag, state)
+            elif line is not None:
+                # Хуучин firmware-ийн CSV: зөвхөн зогсоолын төлөв агуулсан мөрийг шалгах
                 if ',' in line and len(line.split(',')) == 4:
                     parts = line.split(',')
                     try:
                         s1, s2, s3 = map(int, parts[0:3])
                         user_id = parts[3].strip()
-                        if upload_to_firebase(s1, s2, s3, user_id):
-                            print("[OK] Амжилттай хадгаллаа")
-                        else:
-                            print("[ERROR] Хадгалж чадсангүй")
+                        state = board_debouncer(tag).observe((s1, s2, s3, user_id))
+                        if state is not None:
+                            flush_state(tag, state)
                     except ValueError:
-                        print("[ERROR] Тоон утга буруу байна:", line)
+                        print(f"[ERROR] Тоон утга буруу байна ({tag}):", line)
                 else:
-                    print("[INFO] Лог мэдээлэл:", line)
+                    print(f"[INFO] Лог мэдээлэл ({tag}):", line)
+            
+            # Мөр ирээгүй ч debounce хугацаа дууссан төлөвийг бичнэ
+            for board, debouncer in list(debouncers.items()):
+                state = debouncer.poll()
+                if state is not None:
+                    flush_state(board, state)
+            
+            if any(debouncer.heartbeat_due() for debouncer in debouncers.values()):
+                send_heartbeat()
                 
-        except serial.SerialException as e:
-            print("[ERROR] Serial port алдаа:", e)
-            time.sleep(5)
         except Exception as e:
             print("[ERROR] Ерөнхий алдаа:", e)
             traceback.print_exc()
@@ -285,4 +395,4 @@ except Exception as e:
     traceback.print_exc()
 finally:
     cleanup()
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
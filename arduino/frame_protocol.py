@@ -0,0 +1,163 @@
+import binascii
+import struct
+from collections import namedtuple
+
+# Binary frame (little-endian):
+#   A5 5A | len u8 | version u8 | type u8 | seq u16 | slot_count u8 | bitfield | crc u16
+# len нь version-оос bitfield-ийн төгсгөл хүртэлх байт. CRC-16/CCITT-FALSE
+# (poly 0x1021, init 0xFFFF) нь len-ээс bitfield хүртэлх хэсгийг хамарна.
+SYNC = b'\xA5\x5A'
+VERSION = 1
+MSG_STATUS = 0x01
+MAX_SLOTS = 64
+MAX_LINE = 1024         # Newline-гүй урт хог мөрийг хаях
+
+_HEADER = struct.Struct('<BBBHB')   # len, version, type, seq, slot_count
+_CRC = struct.Struct('<H')
+_MIN_LEN = _HEADER.size - 1
+_MAX_LEN = _MIN_LEN + (MAX_SLOTS + 7) // 8
+
+StatusFrame = namedtuple('StatusFrame', ['seq', 'slots'])
+
+
+def crc16(data, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE (Arduino талын crc16-тай ижил)"""
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_status(seq, slots):
+    """Слотын төлөвийг frame болгох (туршилт, simulator-т)"""
+    bitfield = sum(1 << i for i, occupied in enumerate(slots) if occupied)
+    nbytes = (len(slots) + 7) // 8
+    body = _HEADER.pack(_MIN_LEN + nbytes, VERSION, MSG_STATUS, seq & 0xFFFF, len(slots))
+    body += bitfield.to_bytes(nbytes, 'little')
+    return SYNC + body + _CRC.pack(crc16(body))
+
+
+class SequenceTracker:
+    """Frame-ийн дугаараас алдагдсан болон давхардсан frame-ийг илрүүлэх
+
+    Дугаар 16 бит тул 0xFFFF-ээс 0 руу эргэлдэнэ. Хойшоо үсэрсэн дугаарыг
+    (самбар дахин ачаалагдсан) шинэ эхлэл гэж үзнэ.
+    """
+
+    def __init__(self):
+        self.last = None
+        self.gaps = 0
+        self.missing = 0
+        self.duplicates = 0
+        self.restarts = 0
+
+    def observe(self, seq):
+        """'ok', 'gap', 'duplicate' эсвэл 'restart' буцаана"""
+        last, self.last = self.last, seq
+        if last is None:
+            return 'ok'
+        delta = (seq - last) & 0xFFFF
+        if delta == 0:
+            self.duplicates += 1
+            return 'duplicate'
+        if delta == 1:
+            return 'ok'
+        if delta < 0x8000:
+            self.gaps += 1
+            self.missing += delta - 1
+            return 'gap'
+        self.restarts += 1
+        return 'restart'
+
+    def stats(self):
+        return {
+            'gaps': self.gaps,
+            'missing': self.missing,
+            'duplicates': self.duplicates,
+            'restarts': self.restarts,
+        }
+
+
+class FrameDecoder:
+    """Нэг serial урсгал дахь binary frame болон хуучин CSV/лог мөрүүдийг салгах
+
+    feed() нь ирсэн байтуудыг нэг bytearray-д нэмээд frame-ийг memoryview
+    дээрээс шууд (хуулбаргүй) задална. Буцаах утга нь str (мөр) эсвэл
+    StatusFrame-ийн жагсаалт; давхардсан frame буцаагдахгүй. CRC таарахгүй
+    бол sync байтыг текст гэж үзээд цааш хайна.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        # Өмнөх feed-д шалгагдсан байтуудыг дахин шалгахгүй
+        self._scan = 0
+        self.sequence = SequenceTracker()
+        self.frames = 0
+        self.lines = 0
+        self.crc_errors = 0
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        out = []
+        pos, scan = 0, self._scan
+        with memoryview(buf) as view:
+            while True:
+                newline = buf.find(b'\n', scan)
+                sync = buf.find(SYNC, scan)
+                if newline != -1 and (sync == -1 or newline < sync):
+                    self._emit_line(view[pos:newline], out)
+                    pos = scan = newline + 1
+                    continue
+                if sync == -1:
+                    break
+
+                header_end = sync + len(SYNC) + _HEADER.size
+                if header_end > len(buf):
+                    break
+                length, version, kind, seq, count = _HEADER.unpack_from(buf, sync + len(SYNC))
+                if (length < _MIN_LEN or length > _MAX_LEN or version != VERSION
+                        or length != _MIN_LEN + (count + 7) // 8):
+                    scan = sync + 1
+                    continue
+                body_start = sync + len(SYNC)
+                crc_at = body_start + 1 + length
+                if crc_at + _CRC.size > len(buf):
+                    break
+                if crc16(view[body_start:crc_at]) != _CRC.unpack_from(buf, crc_at)[0]:
+                    self.crc_errors += 1
+                    scan = sync + 1
+                    continue
+
+                # Frame-ийн өмнөх дуусаагүй текст эвдэрсэн мөр
+                if sync > pos:
+                    self._emit_line(view[pos:sync], out)
+                pos = scan = crc_at + _CRC.size
+                if kind != MSG_STATUS:
+                    continue
+                self.frames += 1
+                if self.sequence.observe(seq) == 'duplicate':
+                    continue
+                bits = int.from_bytes(view[header_end:crc_at], 'little')
+                out.append(StatusFrame(seq, tuple((bits >> i) & 1 for i in range(count))))
+
+        del buf[:pos]
+        self._scan = scan - pos
+        if len(buf) > MAX_LINE and buf.find(SYNC, self._scan) == -1:
+            self.dropped_bytes += len(buf)
+            buf.clear()
+            self._scan = 0
+        return out
+
+    def _emit_line(self, raw, out):
+        line = str(raw, 'utf-8', errors='replace').strip()
+        if line:
+            self.lines += 1
+            out.append(line)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'lines': self.lines,
+            'crc_errors': self.crc_errors,
+            'dropped_bytes': self.dropped_bytes,
+            **self.sequence.stats(),
+        }
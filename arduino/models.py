@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+@dataclass(slots=True)
+class ParkingSession:
+    user_id: str
+    slot_id: str
+    vehicle_id: Optional[str]
+    start_time: datetime
+    is_active: bool
+    end_time: Optional[datetime] = None
+    amount: float = 0.0
+
+    @property
+    def duration_seconds(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time).total_seconds()
@@ -0,0 +1,98 @@
+import threading
+
+
+def default_slots(count):
+    """Төхөөрөмжийн document-д "slots" map байхгүй үеийн сенсорын талбар -> слотын нэр"""
+    return {f's{i}': f'slot_{i}' for i in range(1, count + 1)}
+
+
+DEFAULT_SLOTS = default_slots(3)
+
+
+class DeviceRegistry:
+    """devices/{device_id} -> parking -> slot бүртгэлийг local cache-д байлгах
+
+    Төхөөрөмжийн document-ийг snapshot listener-ээр сонсдог тул уншилт бүрт
+    Firestore-оос унших шаардлагагүй. Зогсоолын document-ийг gateway
+    бичихгүй (Cloud Function нэгтгэнэ), зөвхөн session-ий төлбөрт хэрэгтэй
+    цагийн үнийг ('price') нь сонсоно.
+    devices/{device_id}: {'parking_id': ..., 'slots': {'s1': 'slot_1', ...}}
+    """
+
+    def __init__(self, db, device_id, fallback_parking_id=None):
+        self._db = db
+        self.device_id = device_id
+        self._fallback_parking_id = fallback_parking_id
+        self._lock = threading.Lock()
+        self._device = None
+        self._parking_id = None
+        self._price = None
+        self._device_watch = None
+        self._parking_watch = None
+        self._ready = threading.Event()
+
+    def start(self, timeout=10):
+        """Listener-ийг эхлүүлж эхний snapshot-ийг хүлээх"""
+        ref = self._db.collection('devices').document(self.device_id)
+        self._device_watch = ref.on_snapshot(self._on_device)
+        if not self._ready.wait(timeout):
+            print(f"[ERROR] {self.device_id} төхөөрөмжийн бүртгэлийг уншиж чадсангүй")
+        return self
+
+    def _on_device(self, snapshots, changes, read_time):
+        snapshot = snapshots[0] if snapshots else None
+        device = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+        parking_id = (device or {}).get('parking_id') or self._fallback_parking_id
+        with self._lock:
+            self._device = device
+            changed = parking_id != self._parking_id
+            self._parking_id = parking_id
+            if changed:
+                self._price = None
+        if changed:
+            self._watch_parking(parking_id)
+        if not parking_id:
+            print(f"[ERROR] {self.device_id} төхөөрөмж аль ч зогсоолд бүртгэгдээгүй байна")
+        elif changed:
+            print(f"[INFO] {self.device_id} төхөөрөмж {parking_id} зогсоолд харьяалагдана")
+        self._ready.set()
+
+    def _watch_parking(self, parking_id):
+        """Харьяалагдах зогсоолын document-ийн listener-ийг солих"""
+        if self._parking_watch is not None:
+            self._parking_watch.unsubscribe()
+            self._parking_watch = None
+        if parking_id:
+            ref = self._db.collection('parkings').document(parking_id)
+            self._parking_watch = ref.on_snapshot(
+                lambda snapshots, changes, read_time: self._on_parking(parking_id, snapshots))
+
+    def _on_parking(self, parking_id, snapshots):
+        snapshot = snapshots[0] if snapshots else None
+        price = (snapshot.to_dict() or {}).get('price') if snapshot is not None and snapshot.exists else None
+        with self._lock:
+            if parking_id == self._parking_id:
+                self._price = float(price) if price is not None else None
+
+    def resolve(self, sensors=None):
+        """(parking_id, {sensor: slot}) эсвэл None
+
+        sensors: бүртгэлд slots map байхгүй үед самбарын сенсорын тоо
+        """
+        with self._lock:
+            if not self._parking_id:
+                return None
+            slots = (self._device or {}).get('slots') or (
+                default_slots(sensors) if sensors else DEFAULT_SLOTS)
+            return self._parking_id, dict(slots)
+
+    def price(self, parking_id):
+        """parking_id зогсоолын цагийн үнэ, энэ төхөөрөмжийнх биш эсвэл үнэгүй бол None"""
+        with self._lock:
+            return self._price if parking_id == self._parking_id else None
+
+    def stop(self):
+        if self._device_watch is not None:
+            self._device_watch.unsubscribe()
+        if self._parking_watch is not None:
+            self._parking_watch.unsubscribe()
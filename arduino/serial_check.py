@@ -0,0 +1,149 @@
+"""SerialIngestor-ийг Arduino-гүйгээр pseudo-terminal (pty)-ээр шалгах
+
+Самбар бүрийн оронд os.openpty() хос үүсгэж, master талаас нь CSV мөр
+бичнэ. Дараа нь мөр бүр эх самбарынхаа нэртэй ирсэн, салгаж шинэ pty
+залгахад порт дахин холбогдсон, сул үед CPU бараг ашиглаагүйг шалгана.
+
+    python serial_check.py
+    python serial_check.py --boards 16 --lines 200 --idle 5
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import serial
+
+from serial_ingest import MIN_BACKOFF, SerialIngestor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--boards', type=int, default=8, help='зэрэг уншигдах pty-ийн тоо')
+    parser.add_argument('--lines', type=int, default=50, help='самбар бүрийн бичих мөр')
+    parser.add_argument('--idle', type=float, default=3.0, help='сул үеийн CPU хэмжих секунд')
+    parser.add_argument('--max-idle-cpu', type=float, default=2.0, help='зөвшөөрөх сул үеийн CPU (%%)')
+    return parser.parse_args()
+
+
+class PtyBoards:
+    """Самбарын нэр -> одоогийн pty хос; unplug() нь кабель сугалахтай адил"""
+
+    def __init__(self, names):
+        self._lock = threading.Lock()
+        self._pairs = {}
+        for name in names:
+            self.plug(name)
+
+    def plug(self, name):
+        master, slave = os.openpty()
+        with self._lock:
+            self._pairs[name] = (master, slave, os.ttyname(slave))
+
+    def unplug(self, name):
+        """Master-ийг хаавал slave-ийг уншиж буй порт EIO алдаа авна"""
+        with self._lock:
+            master, slave, _ = self._pairs.pop(name)
+        os.close(master)
+        os.close(slave)
+
+    def open_serial(self, device, baudrate, timeout=None):
+        with self._lock:
+            pair = self._pairs.get(device)
+        if pair is None:
+            raise serial.SerialException(f'{device} залгаагүй байна')
+        return serial.Serial(pair[2], baudrate, timeout=timeout)
+
+    def write(self, name, text):
+        with self._lock:
+            master = self._pairs[name][0]
+        os.write(master, text.encode('ascii'))
+
+    def close(self):
+        for name in list(self._pairs):
+            self.unplug(name)
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def main():
+    args = parse_args()
+    names = [f'board-{i}' for i in range(args.boards)]
+    boards = PtyBoards(names)
+    lines = queue.Queue()
+    ingestor = SerialIngestor(lambda tag, line: lines.put((tag, line)), ports=names, scan=False,
+                              scan_interval=0.2, open_serial=boards.open_serial)
+    ingestor.start()
+    failures = 0
+
+    def connected():
+        return {reader.tag for reader in ingestor.readers() if reader.connected}
+
+    if not wait_for(lambda: connected() == set(names), 5):
+        print(f"[ERROR] Холбогдоогүй портууд: {sorted(set(names) - connected())}")
+        return 1
+
+    # Самбар бүр өөрийн нэр, дугаартай мөр бичнэ
+    for i in range(args.lines):
+        for name in names:
+            boards.write(name, f'{i % 2},{(i + 1) % 2},0,{name}:{i}\n')
+    expected = args.lines * args.boards
+    received = []
+    deadline = time.monotonic() + 10
+    while len(received) < expected and time.monotonic() < deadline:
+        try:
+            received.append(lines.get(timeout=0.5))
+        except queue.Empty:
+            pass
+    mistagged = [(tag, line) for tag, line in received if line.rsplit(',', 1)[-1].split(':')[0] != tag]
+    per_board = {name: [int(line.rsplit(':', 1)[1]) for tag, line in received if tag == name] for name in names}
+    in_order = all(numbers == list(range(args.lines)) for numbers in per_board.values())
+    ok = len(received) == expected and not mistagged and in_order
+    failures += not ok
+    print(f"{'[OK]' if ok else '[ERROR]'} {len(received)}/{expected} мөр, буруу нэртэй {len(mistagged)}, "
+          f"самбар бүрд дарааллаараа: {in_order}")
+
+    # Нэг самбарыг салгаж шинэ pty залгана: порт дахин нээгдэж уншилт үргэлжлэх ёстой
+    victim = names[0]
+    reader = next(reader for reader in ingestor.readers() if reader.tag == victim)
+    boards.unplug(victim)
+    dropped = wait_for(lambda: not reader.connected, 5)
+    boards.plug(victim)
+    reconnected = wait_for(lambda: reader.connected, MIN_BACKOFF * 4 + 2)
+    if reconnected:
+        boards.write(victim, f'1,1,1,{victim}:again\n')
+    try:
+        tag, line = lines.get(timeout=3)
+        resumed = tag == victim and line.endswith(':again')
+    except queue.Empty:
+        resumed = False
+    ok = dropped and reconnected and resumed and reader.reconnects >= 1
+    failures += not ok
+    print(f"{'[OK]' if ok else '[ERROR]'} {victim}: тасарсан {dropped}, дахин холбогдсон {reconnected} "
+          f"({reader.reconnects} удаа), уншилт үргэлжилсэн {resumed}")
+
+    # Сул үед порт бүрийн thread kernel-д хүлээх ёстой
+    cpu_started, wall_started = time.process_time(), time.monotonic()
+    time.sleep(args.idle)
+    cpu = (time.process_time() - cpu_started) / (time.monotonic() - wall_started) * 100
+    ok = cpu <= args.max_idle_cpu
+    failures += not ok
+    print(f"{'[OK]' if ok else '[ERROR]'} {args.boards} порт сул үед CPU {cpu:.2f}% "
+          f"(хязгаар {args.max_idle_cpu}%)")
+
+    ingestor.stop()
+    boards.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import threading
+
+import serial
+import serial.tools.list_ports
+
+from frame_protocol import FrameDecoder
+
+BAUDRATE = 9600
+SCAN_INTERVAL = 5.0     # Шинээр залгагдсан порт хайх хоорондын секунд
+READ_TIMEOUT = 1.0      # Блоклох уншилтын хугацаа; зөвхөн stop()-ийг хэр хурдан анзаарахыг тогтооно
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+# Arduino самбар болон түгээмэл USB-serial хуулбаруудын (CH340) USB vendor id
+ARDUINO_VIDS = {0x2341, 0x2A03, 0x1A86}
+
+
+def is_arduino(port_info):
+    """list_ports-ийн порт Arduino мөн эсэх"""
+    return 'Arduino' in (port_info.description or '') or port_info.vid in ARDUINO_VIDS
+
+
+def port_tag(port_info):
+    """Порт солигдсон ч тогтвортой байх төхөөрөмжийн нэр (serial number, эсвэл порт)"""
+    return port_info.serial_number or port_info.device
+
+
+class PortReader(threading.Thread):
+    """Нэг serial портыг блоклож уншиж, мөр/frame бүрийг эх төхөөрөмжийн нэртэй нь дамжуулах
+
+    on_line(tag, item)-ийн item нь CSV/лог мөр (str) эсвэл binary
+    StatusFrame байна.
+
+    Уншилт нь өгөгдөл ирэх хүртэл kernel-д хүлээдэг тул сул үед CPU
+    ашиглахгүй. Холболт тасарвал backoff-оор дахин нээнэ; порт системээс
+    алга болсон бол (hot-unplug) зогсоно.
+    """
+
+    def __init__(self, device, tag, on_line, baudrate=BAUDRATE, still_present=None,
+                 open_serial=serial.Serial):
+        super().__init__(name=f'serial-{tag}', daemon=True)
+        self.device = device
+        self.tag = tag
+        self._on_line = on_line
+        self._baudrate = baudrate
+        self._still_present = still_present or (lambda: True)
+        self._open_serial = open_serial
+        self._stop_event = threading.Event()
+        self._ser = None
+        self._write_lock = threading.Lock()
+        self.connected = False
+        self.decoder = None
+        self.reconnects = 0
+        self.last_error = None
+
+    def _read_lines(self, ser):
+        # Шинэ холболт бүр дугаарлалтыг шинээр эхлүүлнэ
+        decoder = self.decoder = FrameDecoder()
+        while not self._stop_event.is_set():
+            # Дор хаяж 1 байт ирэх хүртэл (эсвэл timeout) блоклоно
+            chunk = ser.read(ser.in_waiting or 1)
+            if not chunk:
+                continue
+            missing = decoder.sequence.missing
+            for item in decoder.feed(chunk):
+                self._on_line(self.tag, item)
+            if decoder.sequence.missing != missing:
+                print(f"[ERROR] {self.tag}: {decoder.sequence.missing - missing} frame алдагдлаа")
+
+    def run(self):
+        backoff = MIN_BACKOFF
+        while not self._stop_event.is_set():
+            try:
+                ser = self._open_serial(self.device, self._baudrate, timeout=READ_TIMEOUT)
+            except (serial.SerialException, OSError) as e:
+                self.last_error = str(e)
+                if not self._still_present():
+                    break
+                print(f"[RETRY] {self.device} порт {backoff:.0f}с дараа дахин нээгдэнэ: {e}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            backoff = MIN_BACKOFF
+            self._ser = ser
+            self.connected = True
+            self.last_error = None
+            print(f"[OK] {self.device} ({self.tag}) порттой холбогдлоо")
+            try:
+                self._read_lines(ser)
+            except (serial.SerialException, OSError) as e:
+                self.last_error = str(e)
+                print(f"[ERROR] {self.device} портын холболт тасарлаа: {e}")
+            finally:
+                self.connected = False
+                self._ser = None
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+
+            if not self._stop_event.is_set():
+                if not self._still_present():
+                    print(f"[INFO] {self.device} порт салгагдлаа")
+                    break
+                self.reconnects += 1
+                self._stop_event.wait(backoff)
+
+    def write(self, data):
+        with self._write_lock:
+            if self._ser is None:
+                return False
+            self._ser.write(data)
+            return True
+
+    def stop(self):
+        self._stop_event.set()
+
+    def status(self):
+        return {
+            'device': self.device,
+            'tag': self.tag,
+            'connected': self.connected,
+            'reconnects': self.reconnects,
+            **(self.decoder.stats() if self.decoder else {}),
+            'last_error': self.last_error,
+        }
+
+
+class SerialIngestor(threading.Thread):
+    """Олон Arduino-г зэрэг уншиж, шинээр залгагдсан портыг автоматаар нэмэх
+
+    on_line(tag, line) нь порт бүрийн thread-ээс дуудагдана. ports-д заасан
+    портууд (жишээ нь COM7, pty) жагсаалтад харагдахгүй ч байнга уншигдана.
+    Техник хангамжгүйгээр serial_check.py pty-ээр шалгана.
+    """
+
+    def __init__(self, on_line, ports=(), scan=True, baudrate=BAUDRATE,
+                 scan_interval=SCAN_INTERVAL, list_ports=serial.tools.list_ports.comports,
+                 open_serial=serial.Serial):
+        super().__init__(name='serial-discovery', daemon=True)
+        self._on_line = on_line
+        self._explicit = list(ports)
+        self._scan = scan
+        self._baudrate = baudrate
+        self._scan_interval = scan_interval
+        self._list_ports = list_ports
+        self._open_serial = open_serial
+        self._readers = {}
+        self._present = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def _discover(self):
+        """Одоо байгаа портууд: {device: tag}"""
+        found = {}
+        if self._scan:
+            for port_info in self._list_ports():
+                if is_arduino(port_info):
+                    found[port_info.device] = port_tag(port_info)
+        for device in self._explicit:
+            found.setdefault(device, device)
+        return found
+
+    def scan_once(self):
+        found = self._discover()
+        with self._lock:
+            self._present = set(found)
+            for device, reader in list(self._readers.items()):
+                if not reader.is_alive():
+                    del self._readers[device]
+            for device, tag in found.items():
+                if device in self._readers:
+                    continue
+                reader = PortReader(
+                    device, tag, self._on_line, self._baudrate,
+                    still_present=lambda device=device: self._is_present(device),
+                    open_serial=self._open_serial)
+                print(f"[INFO] Шинэ Arduino порт илэрлээ: {device} ({tag})")
+                reader.start()
+                self._readers[device] = reader
+
+    def _is_present(self, device):
+        with self._lock:
+            return device in self._present
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.scan_once()
+            except Exception as e:
+                print(f"[ERROR] Порт хайхад алдаа гарлаа: {e}")
+            self._stop_event.wait(self._scan_interval)
+
+    def readers(self):
+        with self._lock:
+            return list(self._readers.values())
+
+    def write_all(self, data):
+        """Холбогдсон бүх Arduino руу команд илгээх"""
+        return sum(1 for reader in self.readers() if reader.write(data))
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        for reader in self.readers():
+            reader.stop()
+        for reader in self.readers():
+            reader.join(timeout)
+
+    def status(self):
+        return [reader.status() for reader in self.readers()]
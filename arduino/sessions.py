@@ -0,0 +1,295 @@
+import math
+import struct
+from array import array
+from datetime import datetime, timezone
+
+from models import ParkingSession
+
+DEFAULT_PRICE_PER_HOUR = 500.0
+GRACE_SECONDS = 300          # Богино зогсолт (маневр, сенсорын хэлбэлзэл) үнэгүй
+BILLING_INCREMENT = 900      # Эхэлсэн 15 минут бүрт төлбөр бодно
+
+
+def charge(duration_seconds, price_per_hour, grace=GRACE_SECONDS, increment=BILLING_INCREMENT):
+    """Session-ий төлбөр: grace хугацаанд үнэгүй, түүнээс хойш эхэлсэн increment бүрээр"""
+    if duration_seconds <= grace:
+        return 0.0
+    units = math.ceil(duration_seconds / increment)
+    return round(units * increment / 3600 * price_per_hour, 2)
+
+
+def _timestamp(moment):
+    if moment is None:
+        return math.nan
+    if isinstance(moment, datetime):
+        return moment.timestamp()
+    return float(moment)
+
+
+def _datetime(seconds):
+    return None if math.isnan(seconds) else datetime.fromtimestamp(seconds, timezone.utc)
+
+
+class SessionLedger:
+    """Слотын төлөвийн өөрчлөлтөөр ParkingSession нээж, хааж төлбөр бодох
+
+    Session-уудыг typed array-д багана хэлбэрээр (session бүр нэг мөр,
+    мөрүүдийг нэг л удаа intern хийж) хадгалдаг тул хэдэн арван мянган
+    нээлттэй session тус бүр Python объект биш, хэдэн арван byte эзэлнэ.
+    Хаагдсан session-ий мөрийг drain_closed() хадгалуулахаар гаргаж өгсний
+    дараа дахин ашиглана. Слот, хэрэглэгчээр болон бүх нээлттэй session-ийг
+    dict/set-ээр шууд олно. Хэрэглэгчийн индекс зөвхөн assign_user()-ээр
+    дүүрнэ: gateway одоогоор дууддаггүй (firmware хэрэглэгч биш "UPDATE"
+    илгээдэг, захиалгад слот байхгүй) тул active_for_user() API-д л зориулагдсан.
+
+    price_for(slot_id) нь слотын зогсоолын цагийн үнийг, эсвэл
+    price_per_hour-аар бодуулах бол None буцаана. Session хаагдах үед
+    асуудаг тул snapshot-аас сэргээсэн session-д ч адил үнэ бодогдоно.
+    """
+
+    def __init__(self, price_per_hour=DEFAULT_PRICE_PER_HOUR, grace=GRACE_SECONDS,
+                 increment=BILLING_INCREMENT, price_for=None):
+        self.price_per_hour = float(price_per_hour)
+        self.price_for = price_for
+        self.grace = grace
+        self.increment = increment
+        self._start = array('d')
+        self._end = array('d')
+        self._amount = array('d')
+        self._slot = array('l')
+        self._user = array('l')
+        self._vehicle = array('l')
+        self._strings = []
+        self._string_ids = {}
+        self._free = []
+        self._by_slot = {}      # Слотын string id -> нээлттэй мөр
+        self._by_user = {}      # Хэрэглэгчийн string id -> нээлттэй мөрүүдийн set
+        self._active = set()
+        self._closed = []
+        self.opened = 0
+        self.closed = 0
+        self.dropped = 0
+        self.billed = 0.0
+
+    def _intern(self, value):
+        if value is None:
+            return -1
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def _string(self, string_id):
+        return None if string_id < 0 else self._strings[string_id]
+
+    def _row(self):
+        if self._free:
+            return self._free.pop()
+        for column in (self._start, self._end, self._amount):
+            column.append(math.nan)
+        for column in (self._slot, self._user, self._vehicle):
+            column.append(-1)
+        return len(self._start) - 1
+
+    def open(self, slot_id, at, user_id=None, vehicle_id=None):
+        """slot_id дээр session нээж мөрийг нь буцаах (нээлттэй байвал байгаа мөрийг)"""
+        slot = self._intern(slot_id)
+        row = self._by_slot.get(slot)
+        if row is not None:
+            return row
+        row = self._row()
+        self._start[row] = _timestamp(at)
+        self._end[row] = math.nan
+        self._amount[row] = 0.0
+        self._slot[row] = slot
+        self._user[row] = self._intern(user_id)
+        self._vehicle[row] = self._intern(vehicle_id)
+        self._by_slot[slot] = row
+        self._active.add(row)
+        if user_id is not None:
+            self._by_user.setdefault(self._user[row], set()).add(row)
+        self.opened += 1
+        return row
+
+    def close(self, slot_id, at):
+        """slot_id-ийн нээлттэй session-ийг хааж төлбөр бодох; ParkingSession эсвэл None"""
+        row = self._by_slot.pop(self._string_ids.get(slot_id, -1), None)
+        if row is None:
+            return None
+        self._active.discard(row)
+        user_rows = self._by_user.get(self._user[row])
+        if user_rows is not None:
+            user_rows.discard(row)
+            if not user_rows:
+                del self._by_user[self._user[row]]
+        if math.isnan(self._start[row]):
+            # Эхлэх цаггүй session-ийн хугацааг бодох боломжгүй: төлбөргүйгээр хаяна
+            self._free.append(row)
+            self.dropped += 1
+            return None
+        end = max(_timestamp(at), self._start[row])
+        self._end[row] = end
+        price = self.price_for(slot_id) if self.price_for is not None else None
+        if price is None:
+            price = self.price_per_hour
+        self._amount[row] = charge(end - self._start[row], price, self.grace, self.increment)
+        self._closed.append(row)
+        self.closed += 1
+        self.billed += self._amount[row]
+        return self.session(row)
+
+    def observe(self, slot_status, at):
+        """{'slot': 'Full'|'Empty'} хэрэглэх: Full session нээж, Empty хаана
+
+        Энэ уншилтаар хаагдсан session-уудыг буцаана.
+        """
+        closed = []
+        for slot_id, status in slot_status.items():
+            if status == 'Full':
+                self.open(slot_id, at)
+            else:
+                session = self.close(slot_id, at)
+                if session is not None:
+                    closed.append(session)
+        return closed
+
+    def assign_user(self, slot_id, user_id, vehicle_id=None):
+        """slot_id-ийн нээлттэй session-д хэрэглэгч (болон машин) холбох"""
+        row = self._by_slot.get(self._string_ids.get(slot_id, -1))
+        if row is None:
+            return False
+        previous = self._by_user.get(self._user[row])
+        if previous is not None:
+            previous.discard(row)
+            if not previous:
+                del self._by_user[self._user[row]]
+        self._user[row] = self._intern(user_id)
+        if vehicle_id is not None:
+            self._vehicle[row] = self._intern(vehicle_id)
+        self._by_user.setdefault(self._user[row], set()).add(row)
+        return True
+
+    def session(self, row):
+        return ParkingSession(
+            user_id=self._string(self._user[row]) or '',
+            slot_id=self._string(self._slot[row]),
+            vehicle_id=self._string(self._vehicle[row]),
+            start_time=_datetime(self._start[row]),
+            is_active=row in self._active,
+            end_time=_datetime(self._end[row]),
+            amount=self._amount[row],
+        )
+
+    def active_session(self, slot_id):
+        row = self._by_slot.get(self._string_ids.get(slot_id, -1))
+        return None if row is None else self.session(row)
+
+    def active_for_user(self, user_id):
+        rows = self._by_user.get(self._string_ids.get(user_id, -1), ())
+        return [self.session(row) for row in rows]
+
+    def active_sessions(self):
+        return [self.session(row) for row in self._active]
+
+    def __len__(self):
+        return len(self._active)
+
+    def pending_closed(self):
+        return len(self._closed)
+
+    def closed_sessions(self):
+        """Хадгалаагүй хаагдсан session-ууд (ledger-ээс гаргахгүй)"""
+        return [self.session(row) for row in self._closed]
+
+    def drain_closed(self, count=None):
+        """Хадгалаагүй хаагдсан session-ууд (count бол эхний count); мөрүүд нь дараа нь дахин ашиглагдана"""
+        count = len(self._closed) if count is None else count
+        rows, self._closed = self._closed[:count], self._closed[count:]
+        sessions = [self.session(row) for row in rows]
+        self._free.extend(rows)
+        return sessions
+
+    def restore(self, sessions):
+        """Нээлттэй session-уудыг (жишээ нь encode_sessions()-ийн snapshot-аас) дахин нээх"""
+        for session in sessions:
+            # Эхлэх цаггүй бичлэгийн төлбөрийг бодох боломжгүй
+            if session.is_active and session.start_time is not None:
+                self.open(session.slot_id, session.start_time, session.user_id or None, session.vehicle_id)
+
+    def stats(self):
+        return {
+            'active': len(self._active),
+            'opened': self.opened,
+            'closed': self.closed,
+            'dropped': self.dropped,
+            'pending_closed': len(self._closed),
+            'billed': round(self.billed, 2),
+            'rows': len(self._start),
+        }
+
+
+# Batch codec: толгой, string хүснэгт, дараа нь тогтмол хэмжээтэй бичлэгүүд
+#   b'PSB1' | count u32 | strings u32 | (len u16, utf-8)* | record*
+_MAGIC = b'PSB1'
+_HEADER = struct.Struct('<4sII')
+_STRING_LEN = struct.Struct('<H')
+_RECORD = struct.Struct('<iiidddB')     # slot, user, vehicle, start, end, amount, active
+
+
+def encode_sessions(sessions):
+    """ParkingSession-уудыг bytes болгох (session бүр 37 byte, давтагдашгүй мөрүүд нэмэгдэнэ)"""
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return -1
+        return strings.setdefault(value, len(strings))
+
+    records = [(intern(s.slot_id), intern(s.user_id or None), intern(s.vehicle_id),
+                _timestamp(s.start_time), _timestamp(s.end_time), s.amount, s.is_active)
+               for s in sessions]
+    table = bytearray()
+    for value in strings:
+        encoded = value.encode('utf-8')
+        table += _STRING_LEN.pack(len(encoded)) + encoded
+    out = bytearray(_HEADER.size + len(table) + _RECORD.size * len(records))
+    _HEADER.pack_into(out, 0, _MAGIC, len(records), len(strings))
+    out[_HEADER.size:_HEADER.size + len(table)] = table
+    offset = _HEADER.size + len(table)
+    for record in records:
+        _RECORD.pack_into(out, offset, *record)
+        offset += _RECORD.size
+    return bytes(out)
+
+
+def decode_sessions(data):
+    """encode_sessions()-ийн урвуу"""
+    view = memoryview(data)
+    magic, count, string_count = _HEADER.unpack_from(view)
+    if magic != _MAGIC:
+        raise ValueError('Not a parking session batch')
+    offset = _HEADER.size
+    strings = []
+    for _ in range(string_count):
+        (length,) = _STRING_LEN.unpack_from(view, offset)
+        offset += _STRING_LEN.size
+        strings.append(str(view[offset:offset + length], 'utf-8'))
+        offset += length
+
+    def lookup(index):
+        return None if index < 0 else strings[index]
+
+    end = offset + _RECORD.size * count
+    return [
+        ParkingSession(
+            user_id=lookup(user) or '',
+            slot_id=lookup(slot),
+            vehicle_id=lookup(vehicle),
+            start_time=_datetime(start),
+            is_active=bool(active),
+            end_time=_datetime(finish),
+            amount=amount,
+        )
+        for slot, user, vehicle, start, finish, amount, active in _RECORD.iter_unpack(view[offset:end])
+    ]
@@ -0,0 +1,79 @@
+import time
+
+# Шинэ уншилт бичигдэхээс өмнө өөрчлөгдөлгүй байх ёстой секунд
+DEBOUNCE_SECONDS = 2.0
+# Өөрчлөлтгүй үед gateway амьд байгааг бичих хоорондын секунд
+HEARTBEAT_INTERVAL = 300.0
+
+
+class SlotStateDebouncer:
+    """Сенсорын давтагдсан, хэлбэлзсэн төлөвийг шүүж зөвхөн бодит өөрчлөлтийг гаргах
+
+    observe() нь бичих шаардлагатай төлөвийг буцаана. Firestore-д амжилттай
+    бичсэний дараа commit() дуудна; бичилт амжилтгүй бол дараагийн
+    уншилтаар дахин буцаагдана.
+    """
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 clock=time.monotonic):
+        self.debounce = debounce
+        self.heartbeat_interval = heartbeat_interval
+        self._clock = clock
+        self.committed = None
+        self._pending = None
+        self._pending_since = None
+        self._last_write = None
+        self.readings = 0
+        self.uploads = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+
+    def observe(self, state):
+        """Шинэ уншилт бүртгэх; бичих төлөв эсвэл None буцаана"""
+        self.readings += 1
+        if state == self.committed:
+            # Хэлбэлзэл анхны төлөвтөө буцсан
+            self._pending = None
+            self.suppressed += 1
+            return None
+        if state != self._pending:
+            self._pending = state
+            self._pending_since = self._clock()
+        candidate = self.poll()
+        if candidate is None:
+            self.suppressed += 1
+        return candidate
+
+    def poll(self):
+        """Шинэ уншилт ирээгүй ч debounce хугацаа өнгөрсөн төлөвийг буцаах"""
+        if self._pending is None:
+            return None
+        # Анхны төлөвийг хүлээлгүйгээр шууд бичнэ
+        if self.committed is None or self._clock() - self._pending_since >= self.debounce:
+            return self._pending
+        return None
+
+    def commit(self, state):
+        """Төлөв Firestore-д бичигдсэнийг тэмдэглэх"""
+        self.committed = state
+        if self._pending == state:
+            self._pending = None
+        self._last_write = self._clock()
+        self.uploads += 1
+
+    def heartbeat_due(self):
+        if self._last_write is None:
+            return False
+        return self._clock() - self._last_write >= self.heartbeat_interval
+
+    def mark_heartbeat(self):
+        self._last_write = self._clock()
+        self.heartbeats += 1
+
+    def stats(self):
+        return {
+            'readings': self.readings,
+            'uploads': self.uploads,
+            'suppressed': self.suppressed,
+            'heartbeats': self.heartbeats,
+        }
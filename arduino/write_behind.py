@@ -0,0 +1,316 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+QUEUE_SIZE = 1000       # Serial thread-ээс writer рүү дамжих санах ойн дараалал
+BATCH_SIZE = 100        # Нэг Firestore batch-д орох уншилт (batch-ийн дээд хязгаар 500)
+FLUSH_INTERVAL = 1.0
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+MAX_ATTEMPTS = 5        # Тодорхойгүй алдаагаар энэ тоо бүтэлгүйтсэн уншилтыг dead letter болгоно
+
+# Бичилтийн алдааны ангилал
+TRANSIENT = 'transient'     # Сүлжээ/сервер: уншилтаас үл хамаарна, хязгааргүй дахин оролдоно
+PERMANENT = 'permanent'     # Уншилт өөрөө буруу: дахин оролдохгүй, шууд dead letter
+UNKNOWN = 'unknown'         # MAX_ATTEMPTS удаа оролдоод dead letter
+
+
+def classify_error(error):
+    """Ерөнхий Python алдааг ангилах (Firestore-ийн алдааг дуудагч нэмж ангилна)"""
+    if isinstance(error, (ConnectionError, TimeoutError, OSError)):
+        return TRANSIENT
+    if isinstance(error, (KeyError, TypeError, ValueError)):
+        return PERMANENT
+    return UNKNOWN
+
+
+class ReadingSpool:
+    """Илгээгээгүй уншилтуудыг restart-аас хамгаалж хадгалах SQLite (WAL) spool"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS readings ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created REAL NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0)')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(readings)')}
+        if 'attempts' not in columns:
+            # Өмнөх хувилбарын spool
+            self._conn.execute('ALTER TABLE readings ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+        # Бичиж чадаагүй уншилтууд: бусдыгаа хаахгүйн тулд энд шилжинэ
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letters ('
+            'id INTEGER PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL, '
+            'attempts INTEGER NOT NULL, error TEXT, failed REAL NOT NULL)')
+        self._conn.commit()
+
+    def append(self, readings):
+        """Уншилтуудыг нэг transaction-аар нэмэх"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO readings (payload, created) VALUES (?, ?)',
+                [(json.dumps(reading), now) for reading in readings])
+
+    def pending(self, limit=BATCH_SIZE):
+        """Хамгийн эртний илгээгээгүй уншилтууд [(id, reading), ...]"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, payload FROM readings ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids):
+        """Firestore-д бичигдсэн уншилтуудыг устгах"""
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM readings WHERE id = ?', [(i,) for i in ids])
+
+    def fail(self, row_id):
+        """Уншилтын бүтэлгүйтсэн оролдлогыг тоолж, нийт тоог буцаах"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE readings SET attempts = attempts + 1 WHERE id = ?', (row_id,))
+            row = self._conn.execute('SELECT attempts FROM readings WHERE id = ?', (row_id,)).fetchone()
+        return row[0] if row else 0
+
+    def dead_letter(self, row_id, error):
+        """Уншилтыг dead_letters хүснэгт рүү шилжүүлэх"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO dead_letters (id, payload, created, attempts, error, failed) '
+                'SELECT id, payload, created, attempts, ?, ? FROM readings WHERE id = ?',
+                (error, time.time(), row_id))
+            self._conn.execute('DELETE FROM readings WHERE id = ?', (row_id,))
+
+    def dead_letters(self):
+        """Dead letter болсон уншилтууд [(id, reading, attempts, error), ...]"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, payload, attempts, error FROM dead_letters ORDER BY id').fetchall()
+        return [(row_id, json.loads(payload), attempts, error) for row_id, payload, attempts, error in rows]
+
+    def requeue_dead_letters(self):
+        """Алдааг зассаны дараа dead letter-уудыг дахин илгээх дараалалд буцаах"""
+        with self._lock, self._conn:
+            moved = self._conn.execute(
+                'INSERT INTO readings (payload, created) '
+                'SELECT payload, created FROM dead_letters ORDER BY id').rowcount
+            self._conn.execute('DELETE FROM dead_letters')
+        return moved
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+
+    def dead_letter_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindUploader(threading.Thread):
+    """Serial уншилтыг Firestore бичилтээс салгах background writer
+
+    submit() нь хэзээ ч сүлжээ хүлээхгүй: уншилт санах ойн дараалалд, дүүрсэн
+    бол шууд spool-д орно. Writer thread дарааллыг spool руу шилжүүлж,
+    spool-оос batch_size ширхгээр write_batch(db, rows)-оор бичээд
+    амжилттай бол устгана. Firestore холбогдохгүй үед backoff-оор хүлээж,
+    холболт сэргэхэд spool автоматаар цэвэрлэгдэнэ.
+
+    Batch сүлжээний бус алдаагаар бүтэлгүйтвэл мөр бүрийг тусад нь бичиж
+    буруу уншилтыг ялгана. Буруу нь тодорхой (PERMANENT) уншилт шууд,
+    тодорхойгүй алдаатай нь max_attempts оролдлогын дараа dead_letters
+    хүснэгт рүү шилжиж, ард нь хүлээж буй уншилтуудыг хаахгүй.
+
+    client_factory() -> Firestore client (туршилтад fake client өгч болно)
+    write_batch(db, [(spool_id, reading), ...]) -> нэг batch бичилт
+    write_heartbeat(db, payload) -> heartbeat бичилт (заавал биш)
+    classify(error) -> TRANSIENT / PERMANENT / UNKNOWN
+    """
+
+    def __init__(self, client_factory, write_batch, spool, write_heartbeat=None,
+                 queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 classify=classify_error, max_attempts=MAX_ATTEMPTS):
+        super().__init__(name='firestore-writer', daemon=True)
+        self._client_factory = client_factory
+        self._write_batch = write_batch
+        self._write_heartbeat = write_heartbeat
+        self._classify = classify
+        self.max_attempts = max_attempts
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        # Дарааллаас spool руу шилжүүлэхэд уншилтын дараалал алдагдахгүй байх
+        self._transfer_lock = threading.Lock()
+        self._heartbeat = None
+        self._heartbeat_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.overflows = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_error = None
+
+    def submit(self, reading):
+        """Уншилтыг илгээх дараалалд хийх (serial thread-ийг саатуулахгүй)
+
+        Spool-д бичиж чадаагүй (диск дүүрсэн, I/O алдаа) бол False буцаана;
+        тэр үед уншилтыг дуудагч дахин өгөх ёстой.
+        """
+        try:
+            self._queue.put_nowait(reading)
+        except queue.Full:
+            # Дараалал дүүрсэн ч уншилт алдагдахгүй: эхлээд өмнөхүүдийг spool-д хийнэ
+            with self._transfer_lock:
+                queued = self._take_queued()
+                try:
+                    self.spool.append(queued + [reading])
+                except (sqlite3.Error, OSError) as e:
+                    # Өмнөх уншилтууд дараалалдаа буцна
+                    for item in queued:
+                        self._queue.put_nowait(item)
+                    self.last_error = str(e)
+                    print(f"[ERROR] Spool-д бичиж чадсангүй: {e}")
+                    return False
+            self.overflows += 1
+        return True
+
+    def submit_heartbeat(self, payload):
+        """Хамгийн сүүлийн heartbeat-ийг writer thread-ээр бичүүлэх"""
+        with self._heartbeat_lock:
+            self._heartbeat = payload
+
+    def _take_queued(self, timeout=None):
+        readings = []
+        try:
+            if timeout:
+                readings.append(self._queue.get(timeout=timeout))
+            while True:
+                readings.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return readings
+
+    def _spool_queued(self, timeout):
+        """Дараалал дахь уншилтуудыг spool руу шилжүүлэх"""
+        with self._transfer_lock:
+            readings = self._take_queued(timeout)
+            if readings:
+                self.spool.append(readings)
+
+    def _write_each(self, db, rows):
+        """Бүтэлгүйтсэн batch-ийн мөр бүрийг тусад нь бичиж буруу уншилтыг ялгах"""
+        suspects = []
+        written = 0
+        for row_id, reading in rows:
+            try:
+                self._write_batch(db, [(row_id, reading)])
+            except Exception as e:
+                kind = self._classify(e)
+                if kind == TRANSIENT:
+                    raise
+                if kind == PERMANENT:
+                    self._dead_letter(row_id, self.spool.fail(row_id), e)
+                else:
+                    suspects.append((row_id, e))
+                continue
+            self.spool.ack([row_id])
+            self.written += 1
+            written += 1
+        if not suspects:
+            return
+        if not written:
+            # Нэг ч мөр бичигдээгүй бол уншилтын бус асуудал байж болзошгүй: оролдлого тоолохгүй
+            raise suspects[0][1]
+        retry = None
+        for row_id, error in suspects:
+            attempts = self.spool.fail(row_id)
+            if attempts >= self.max_attempts:
+                self._dead_letter(row_id, attempts, error)
+            else:
+                retry = retry or error
+        if retry is not None:
+            # Үлдсэн сэжигтэй мөрүүдийг backoff-ын дараа дахин оролдоно
+            raise retry
+
+    def _dead_letter(self, row_id, attempts, error):
+        self.spool.dead_letter(row_id, f'{type(error).__name__}: {error}')
+        self.dead_lettered += 1
+        print(f"[ERROR] {row_id} уншилтыг бичиж чадсангүй ({error}), "
+              f"{attempts} оролдлогын дараа dead letter боллоо")
+
+    def _drain(self):
+        db = None
+        while True:
+            rows = self.spool.pending(self.batch_size)
+            if not rows:
+                break
+            db = db or self._client_factory()
+            try:
+                self._write_batch(db, rows)
+            except Exception as e:
+                if self._classify(e) == TRANSIENT:
+                    raise
+                self._write_each(db, rows)
+            else:
+                self.spool.ack([row_id for row_id, _ in rows])
+                self.written += len(rows)
+            self.batches += 1
+            if len(rows) < self.batch_size:
+                break
+
+        with self._heartbeat_lock:
+            payload, self._heartbeat = self._heartbeat, None
+        if payload is not None and self._write_heartbeat is not None:
+            try:
+                self._write_heartbeat(db or self._client_factory(), payload)
+            except Exception:
+                with self._heartbeat_lock:
+                    self._heartbeat = self._heartbeat or payload
+                raise
+
+    def run(self):
+        backoff = MIN_BACKOFF
+        while True:
+            stopping = self._stop_event.is_set()
+            self._spool_queued(0 if stopping else self.flush_interval)
+            try:
+                self._drain()
+                backoff = MIN_BACKOFF
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                if not stopping:
+                    print(f"[RETRY] Firestore бичилт амжилтгүй ({e}), {backoff:.0f}с дараа "
+                          f"дахин оролдоно ({self.spool.count()} уншилт spool-д)")
+                    self._stop_event.wait(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+            if stopping:
+                break
+
+    def stop(self, timeout=10):
+        """Дарааллыг spool-д хадгалж, боломжтой бол сүүлийн удаа бичээд зогсох"""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'spooled': self.spool.count(),
+            'written': self.written,
+            'batches': self.batches,
+            'overflows': self.overflows,
+            'failures': self.failures,
+            'dead_letters': self.spool.dead_letter_count(),
+            'last_error': self.last_error,
+        }
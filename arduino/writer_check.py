@@ -0,0 +1,162 @@
+"""WriteBehindUploader-ийг Firestore-гүйгээр, санах ойн fake client-ээр шалгах
+
+Fake client batch-ийг бүхэлд нь бичих эсвэл бүхэлд нь алдаа өгөх (Firestore
+batch шиг) бөгөөд заасан хэдэн бичилтэд сүлжээний алдаа, буруу
+уншилтуудад PERMANENT эсвэл тодорхойгүй алдаа өгнө. Шалгах зүйлс:
+
+    - сүлжээ тасарсан үед уншилт алдагдахгүй, сэргэхэд дарааллаараа бичигдэнэ
+    - PERMANENT уншилт шууд, тодорхойгүй нь max_attempts-ийн дараа dead letter
+      болж, ард нь хүлээж буй уншилтуудыг хаахгүй
+    - requeue_dead_letters() засварын дараа тэднийг дахин илгээнэ
+    - зогсоход spool-д үлдсэн уншилтыг дараагийн writer бичнэ
+
+    python writer_check.py
+    python writer_check.py --readings 2000 --outage 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import write_behind
+from write_behind import ReadingSpool, WriteBehindUploader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--readings', type=int, default=500)
+    parser.add_argument('--outage', type=int, default=3, help='эхний хэдэн бичилт сүлжээний алдаа өгөх')
+    parser.add_argument('--permanent', type=int, default=5, help='PERMANENT алдаатай уншилтын тоо')
+    parser.add_argument('--unknown', type=int, default=3, help='тодорхойгүй алдаатай уншилтын тоо')
+    parser.add_argument('--batch-size', type=int, default=50)
+    return parser.parse_args()
+
+
+class FakeClient:
+    """Бичигдсэн уншилтуудыг seq-ээр нь тоолох; алдааг outage, accept_all-аар удирдана"""
+
+    def __init__(self, outage=0):
+        self._lock = threading.Lock()
+        self.outage = outage
+        self.accept_all = False
+        self.documents = {}
+        self.order = []
+        self.calls = 0
+
+    def write_batch(self, db, rows):
+        with self._lock:
+            self.calls += 1
+            if self.outage:
+                self.outage -= 1
+                raise ConnectionError('fake network down')
+            if not self.accept_all:
+                for _, reading in rows:
+                    if reading.get('bad') == 'permanent':
+                        raise ValueError(f"invalid reading {reading['seq']}")
+                    if reading.get('bad') == 'unknown':
+                        raise RuntimeError(f"rejected reading {reading['seq']}")
+            # Batch бүхэлдээ бичигдэнэ
+            for _, reading in rows:
+                self.documents.setdefault(reading['seq'], 0)
+                self.documents[reading['seq']] += 1
+                self.order.append(reading['seq'])
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def report(ok, message):
+    print(f"{'[OK]' if ok else '[ERROR]'} {message}")
+    return not ok
+
+
+def main():
+    args = parse_args()
+    # Шалгалтыг удаашруулахгүйн тулд backoff-ийг богиносгоно
+    write_behind.MIN_BACKOFF = 0.01
+    write_behind.MAX_BACKOFF = 0.05
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'spool.sqlite3')
+        client = FakeClient(outage=args.outage)
+        bad = {}
+        step = max(1, args.readings // (args.permanent + args.unknown + 1))
+        for i in range(args.permanent + args.unknown):
+            bad[step * (i + 1)] = 'permanent' if i < args.permanent else 'unknown'
+
+        spool = ReadingSpool(path)
+        uploader = WriteBehindUploader(lambda: client, client.write_batch, spool,
+                                       batch_size=args.batch_size, flush_interval=0.02,
+                                       queue_size=64)
+        uploader.start()
+        for seq in range(args.readings):
+            reading = {'seq': seq}
+            if seq in bad:
+                reading['bad'] = bad[seq]
+            uploader.submit(reading)
+        # Тодорхойгүй алдааны оролдлого зөвхөн бусад уншилт бичигдсэн үед тоологдоно
+        seq = args.readings
+        while not wait_for(lambda: spool.count() == 0, 0.05):
+            uploader.submit({'seq': seq})
+            seq += 1
+            if seq > args.readings * 10:
+                break
+        good = [s for s in range(seq) if s not in bad]
+
+        failures += report(spool.count() == 0, f"spool хоослогдлоо ({spool.count()} үлдсэн)")
+        failures += report(uploader.failures >= args.outage,
+                           f"{args.outage} сүлжээний алдааг даван туулсан ({uploader.failures} алдаа)")
+        duplicates = [s for s, count in client.documents.items() if count != 1]
+        missing = [s for s in good if s not in client.documents]
+        in_order = client.order == sorted(client.order)
+        failures += report(not missing and not duplicates and set(client.documents) == set(good) and in_order,
+                           f"{len(client.documents)}/{len(good)} зөв уншилт нэг удаа бичигдсэн "
+                           f"(дутуу {len(missing)}, давхар {len(duplicates)}, дарааллаараа: {in_order})")
+        lettered = {reading['seq']: attempts for _, reading, attempts, _ in spool.dead_letters()}
+        permanent_ok = all(lettered.get(s) == 1 for s, kind in bad.items() if kind == 'permanent')
+        unknown_ok = all(lettered.get(s) == uploader.max_attempts for s, kind in bad.items() if kind == 'unknown')
+        failures += report(set(lettered) == set(bad) and permanent_ok and unknown_ok,
+                           f"{len(lettered)}/{len(bad)} dead letter (PERMANENT 1 оролдлогоор: {permanent_ok}, "
+                           f"тодорхойгүй {uploader.max_attempts} оролдлогоор: {unknown_ok})")
+
+        # Алдааг зассаны дараа dead letter-уудыг дахин илгээх
+        client.accept_all = True
+        moved = spool.requeue_dead_letters()
+        uploader.submit({'seq': seq})
+        wait_for(lambda: spool.count() == 0, 5)
+        failures += report(moved == len(bad) and all(s in client.documents for s in bad)
+                           and spool.dead_letter_count() == 0,
+                           f"{moved} dead letter дахин илгээгдлээ")
+
+        # Сүлжээгүй үед зогсоход уншилтууд spool-д үлдэж дараагийн writer бичнэ
+        client.outage = 10 ** 9
+        for extra in range(seq + 1, seq + 21):
+            uploader.submit({'seq': extra})
+        uploader.stop()
+        left = spool.count()
+        spool.close()
+        client.outage = 0
+        spool = ReadingSpool(path)
+        uploader = WriteBehindUploader(lambda: client, client.write_batch, spool, flush_interval=0.02)
+        uploader.start()
+        drained = wait_for(lambda: spool.count() == 0, 5)
+        uploader.stop()
+        failures += report(left == 20 and drained and all(s in client.documents for s in range(seq + 1, seq + 21)),
+                           f"зогсоход spool-д {left} уншилт үлдэж, дахин эхлэхэд бичигдлээ")
+        spool.close()
+
+    print(f"Fake client-д {client.calls} бичилт")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
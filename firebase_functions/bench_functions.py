@@ -0,0 +1,243 @@
+"""Measure cold-start and warm-invocation latency of every function in main.py.
+
+Each function gets its own fresh interpreter, where fakes.py stands in for
+Firestore and FCM. The cold time is made up of importing main plus the first
+invocation, which creates the clients and loads the helper modules the function
+needs. After that come warm invocations against the same instance, each
+preceded by an untimed setup that gives it work to do.
+
+    python bench_functions.py
+    python bench_functions.py --warm 50 --bookings 2000 check_and_send_notifications
+
+The report also lists which clients and helper modules each function
+loaded, and, when the Admin SDK is installed, what importing its Firestore
+and messaging modules costs. Those imports are what lazy loading saves the
+functions that do not use them.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+FUNCTIONS = (
+    'log_notification_created',
+    'process_arduino_data',
+    'aggregate_occupancy',
+    'reconcile_occupancy',
+    'flush_parking_notifications',
+    'check_and_send_notifications',
+    'send_parking_reminder',
+    'rollup_arduino_data',
+    'prune_arduino_data',
+)
+HELPER_MODULES = ('occupancy', 'rollups')
+SDK_MODULES = ('firebase_admin.firestore', 'firebase_admin.messaging')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('functions', nargs='*', default=FUNCTIONS, help='functions to measure (default: all)')
+    parser.add_argument('--cold', type=int, default=3, help='fresh interpreters per function')
+    parser.add_argument('--warm', type=int, default=20, help='warm invocations per interpreter')
+    parser.add_argument('--parkings', type=int, default=20)
+    parser.add_argument('--slots', type=int, default=12, help='slots per parking')
+    parser.add_argument('--bookings', type=int, default=1000, help='due bookings per reminder run')
+    parser.add_argument('--readings', type=int, default=2000, help='arduino_data readings per rollup run')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def event(data=None, **params):
+    snapshot = types.SimpleNamespace(to_dict=lambda: data)
+    return types.SimpleNamespace(data=snapshot, params=params)
+
+
+def sensors(args, iteration, parking):
+    return {f's{i}': (iteration + i + parking) % 2 for i in range(1, args.slots + 1)}
+
+
+def seed(db, args):
+    for p in range(args.parkings):
+        parking_id = f'bench-parking-{p}'
+        db.collection('parkings').document(parking_id).set({
+            'name': parking_id, 'price': 500, 'total_slots': args.slots})
+        db.collection('devices').document(f'bench-device-{p}').set({
+            'parking_id': parking_id,
+            'slots': {f's{i}': f'slot_{i}' for i in range(1, args.slots + 1)},
+        })
+
+
+def scenario(name, db, args):
+    """(setup(iteration), invoke(iteration)) for one function; setup is not timed."""
+    import main
+    now = lambda: datetime.now(timezone.utc)
+    fn = getattr(main, name)
+
+    def nothing(iteration):
+        pass
+
+    def add_bookings(iteration):
+        batch = db.batch()
+        for b in range(args.bookings):
+            batch.set(db.collection('bookings').document(f'bench-{iteration}-{b}'), {
+                'sent': False, 'notificationTime': now() - timedelta(minutes=1),
+                'fcmToken': f'token-{b}', 'time': f'{8 + b % 10}:00', 'address': 'Bench street 1',
+                'userId': f'user-{b}', 'zone': 'A', 'level': '1', 'row': str(b % 20),
+            })
+            if len(batch._ops) == 500:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+
+    def pend_notifications(iteration):
+        for p in range(args.parkings):
+            db.collection('parking_notifications').document(f'bench-parking-{p}').set({
+                'available': iteration % args.slots, 'total_slots': args.slots, 'pending': True,
+                'last_sent': now() - timedelta(minutes=5), 'sent_available': None})
+
+    start = now() - timedelta(hours=1)
+
+    def add_readings(iteration):
+        # Rewound watermarks, so every run folds the same readings
+        db.collection('rollup_watermarks').document('arduino_data').set(
+            {'watermark': start - timedelta(seconds=1)})
+        for p in range(args.parkings):
+            db.collection('rollup_state').document(f'bench-parking-{p}').delete()
+        if iteration:
+            return
+        batch = db.batch()
+        for r in range(args.readings):
+            p = r % args.parkings
+            batch.set(db.collection('arduino_data').document(f'bench-{r}'), {
+                'device_id': f'bench-device-{p}', 'timestamp': start + timedelta(seconds=r),
+                **sensors(args, r, p)})
+            if len(batch._ops) == 500:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+
+    def add_old_readings(iteration):
+        db.collection('rollup_watermarks').document('arduino_data').set({'watermark': now()})
+        batch = db.batch()
+        for r in range(args.readings // 4):
+            batch.set(db.collection('arduino_data').document(f'old-{iteration}-{r}'), {
+                'device_id': 'bench-device-0', 'timestamp': now() - timedelta(days=40, seconds=r)})
+            if len(batch._ops) == 500:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+
+    def move_shards(iteration):
+        db.collection('parkings').document('bench-parking-0').collection('occupancy_shards').document('0').set(
+            {'occupied': iteration % args.slots})
+
+    scenarios = {
+        'log_notification_created': (nothing, lambda i: fn(event(notificationId=f'n{i}'))),
+        'process_arduino_data': (nothing, lambda i: fn(event({
+            'device_id': f'bench-device-{i % args.parkings}', **sensors(args, i, i % args.parkings)}))),
+        'aggregate_occupancy': (move_shards, lambda i: fn(event(parkingId='bench-parking-0'))),
+        'reconcile_occupancy': (nothing, lambda i: fn(None)),
+        'flush_parking_notifications': (pend_notifications, lambda i: fn(None)),
+        'check_and_send_notifications': (add_bookings, lambda i: fn(None)),
+        'send_parking_reminder': (nothing, lambda i: fn(None)),
+        'rollup_arduino_data': (add_readings, lambda i: fn(None)),
+        'prune_arduino_data': (add_old_readings, lambda i: fn(None)),
+    }
+    return scenarios[name]
+
+
+def child(args):
+    """Run one function in this (fresh) interpreter and print its timings as JSON."""
+    import contextlib
+    import io
+    import fakes
+    db = fakes.install()
+    seed(db, args)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    setup, invoke = scenario(args.child, db, args)
+    setup(0)
+    first_started = time.perf_counter()
+    with quiet:
+        invoke(0)
+    first = time.perf_counter() - first_started
+
+    warm = []
+    for iteration in range(1, args.warm + 1):
+        setup(iteration)
+        call_started = time.perf_counter()
+        with quiet:
+            invoke(iteration)
+        warm.append(time.perf_counter() - call_started)
+
+    print(json.dumps({
+        'import': imported - started,
+        'first': first,
+        'warm': warm,
+        'clients': sorted(name for name in main._clients if name != 'app'),
+        'modules': [name for name in HELPER_MODULES if name in sys.modules],
+    }))
+
+
+def run_child(name, args):
+    command = [sys.executable, __file__, '--child', name, '--warm', str(args.warm),
+               '--parkings', str(args.parkings), '--slots', str(args.slots),
+               '--bookings', str(args.bookings), '--readings', str(args.readings)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{name} failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def sdk_import_cost():
+    """Seconds to import each Admin SDK module in a fresh interpreter, or None if not installed."""
+    costs = {}
+    for module in SDK_MODULES:
+        code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        costs[module] = float(result.stdout) if result.returncode == 0 else None
+    return costs
+
+
+def ms(seconds):
+    return f'{seconds * 1000:8.2f}'
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(args)
+        return 0
+
+    unknown = set(args.functions) - set(FUNCTIONS)
+    if unknown:
+        print(f"[ERROR] Unknown functions: {', '.join(sorted(unknown))}")
+        return 1
+
+    print(f"{'function':30} {'import':>8} {'first':>8} {'cold':>8} {'warm p50':>8} {'warm p95':>8}  loads")
+    for name in args.functions:
+        runs = [run_child(name, args) for _ in range(args.cold)]
+        imports = statistics.median(run['import'] for run in runs)
+        first = statistics.median(run['first'] for run in runs)
+        cold = statistics.median(run['import'] + run['first'] for run in runs)
+        warm = sorted(sample for run in runs for sample in run['warm'])
+        p50 = statistics.median(warm) if warm else 0.0
+        p95 = warm[min(len(warm) - 1, int(len(warm) * 0.95))] if warm else 0.0
+        loads = ', '.join(runs[0]['clients'] + runs[0]['modules']) or '-'
+        print(f"{name:30} {ms(imports)} {ms(first)} {ms(cold)} {ms(p50)} {ms(p95)}  {loads}")
+    print("Times in ms (medians over cold runs); cold = import + first invocation")
+
+    for module, cost in sdk_import_cost().items():
+        print(f"{module}: " + (f"{cost * 1000:.0f} ms to import" if cost is not None else "not installed"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
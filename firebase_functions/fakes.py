@@ -0,0 +1,377 @@
+"""In-memory Firestore and FCM fakes for running main.py locally.
+
+install() registers fake firebase_admin / firebase_functions modules, so it
+must run before main (or occupancy) is imported:
+
+    import fakes
+    db = fakes.install()
+    import main
+
+Only the API surface used by this package is implemented. Transactions are
+serialized with one lock instead of optimistic retries, so concurrent callers
+see the same outcome as against Firestore, without the retry traffic.
+"""
+import copy
+import itertools
+import sys
+import threading
+import types
+from datetime import datetime, timezone
+
+_auto_ids = itertools.count(1)
+
+
+class _ServerTimestamp:
+    def __repr__(self):
+        return 'SERVER_TIMESTAMP'
+
+
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+def _resolve(current, value):
+    if value is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    return copy.deepcopy(value)
+
+
+def _merge(current, data, dotted):
+    for key, value in data.items():
+        target = current
+        parts = key.split('.') if dotted else [key]
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        if isinstance(value, dict) and not dotted:
+            if not isinstance(target.get(parts[-1]), dict):
+                target[parts[-1]] = {}
+            _merge(target[parts[-1]], value, False)
+        else:
+            target[parts[-1]] = _resolve(target.get(parts[-1]), value)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        value = self._data
+        for part in field.split('.'):
+            value = value[part]
+        return value
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return CollectionReference(self._client, f'{self.path}/{name}')
+
+    def get(self, transaction=None):
+        return self._client._read(self)
+
+    def set(self, data, merge=False):
+        self._client._write([('set', self, data, merge)])
+
+    def update(self, data):
+        self._client._write([('update', self, data, False)])
+
+    def delete(self):
+        self._client._write([('delete', self, None, False)])
+
+
+_OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+}
+
+
+class Query:
+    def __init__(self, client, path, group=False, filters=(), orders=(), limit=None, cursor=None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(client=self._client, path=self._path, group=self._group, filters=self._filters,
+                     orders=self._orders, limit=self._limit, cursor=self._cursor)
+        state.update(changes)
+        return Query(**state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def _key(self, path, data):
+        return tuple((data or {}).get(field) for field, _ in self._orders) + (path,)
+
+    def stream(self, transaction=None):
+        rows = []
+        for path, data in self._client._scan(self._path, self._group):
+            if all(_OPS[op](data.get(field), value) for field, op, value in self._filters):
+                rows.append((path, data))
+        rows.sort(key=lambda row: self._key(*row))
+        if any(direction == 'DESCENDING' for _, direction in self._orders):
+            rows.reverse()
+        if self._cursor is not None:
+            after = self._key(self._cursor.reference.path, self._cursor._data)
+            rows = [row for row in rows if self._key(*row) > after]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        self._client.reads += len(rows)
+        for path, data in rows:
+            yield DocumentSnapshot(DocumentReference(self._client, path), copy.deepcopy(data))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        if '/' not in self._path:
+            return None
+        return DocumentReference(self._client, self._path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f'{self._path}/{document_id or f"auto{next(_auto_ids)}"}')
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference, data, False))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError('maximum 500 writes allowed per request')
+        self._client._write(self._ops)
+        self._client.commits += 1
+        self._ops = []
+
+
+class Transaction(WriteBatch):
+    pass
+
+
+def transactional(fn):
+    """Run fn(transaction, ...) under the client's lock and commit its writes."""
+    def run(transaction, *args, **kwargs):
+        with transaction._client._lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.documents = {}
+        self._lock = threading.RLock()
+        # Called with (path, before, after) after every write, e.g. to emulate triggers
+        self.listeners = []
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, path):
+        return CollectionReference(self, path)
+
+    def document(self, path):
+        return DocumentReference(self, path)
+
+    def collection_group(self, collection_id):
+        return Query(self, collection_id, group=True)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self):
+        return Transaction(self)
+
+    def _read(self, reference):
+        with self._lock:
+            self.reads += 1
+            return DocumentSnapshot(reference, copy.deepcopy(self.documents.get(reference.path)))
+
+    def _scan(self, path, group):
+        with self._lock:
+            items = list(self.documents.items())
+        depth = path.count('/') + 1
+        for doc_path, data in items:
+            parts = doc_path.split('/')
+            if group:
+                if len(parts) >= 2 and parts[-2] == path:
+                    yield doc_path, data
+            elif doc_path.startswith(path + '/') and len(parts) == depth + 1:
+                yield doc_path, data
+
+    def _write(self, ops):
+        changes = []
+        with self._lock:
+            for kind, reference, data, merge in ops:
+                if kind == 'update' and reference.path not in self.documents:
+                    raise KeyError(f'No document to update: {reference.path}')
+            for kind, reference, data, merge in ops:
+                before = self.documents.get(reference.path)
+                if kind == 'delete':
+                    self.documents.pop(reference.path, None)
+                else:
+                    current = copy.deepcopy(before) if (merge or kind == 'update') and before else {}
+                    _merge(current, data, kind == 'update')
+                    self.documents[reference.path] = current
+                self.writes += 1
+                changes.append((reference.path, before, self.documents.get(reference.path)))
+        for change in changes:
+            for listener in self.listeners:
+                listener(*change)
+
+
+class SendResponse:
+    def __init__(self, message_id=None, exception=None):
+        self.message_id = message_id
+        self.exception = exception
+        self.success = exception is None
+
+
+class FakeMessaging(types.ModuleType):
+    """firebase_admin.messaging replacement that records messages instead of sending them."""
+
+    class Message:
+        def __init__(self, data=None, notification=None, token=None, topic=None, **kwargs):
+            self.data = data
+            self.notification = notification
+            self.token = token
+            self.topic = topic
+
+    class Notification:
+        def __init__(self, title=None, body=None, image=None):
+            self.title = title
+            self.body = body
+            self.image = image
+
+    class UnregisteredError(Exception):
+        code = 'NOT_FOUND'
+
+    class SenderIdMismatchError(Exception):
+        code = 'PERMISSION_DENIED'
+
+    def __init__(self):
+        super().__init__('firebase_admin.messaging')
+        self.sent = []
+        # Tokens that fail with UnregisteredError
+        self.unregistered = set()
+
+    def send(self, message, dry_run=False):
+        self.sent.append(message)
+        return f'projects/fake/messages/{len(self.sent)}'
+
+    def send_each(self, messages, dry_run=False):
+        if len(messages) > 500:
+            raise ValueError('messages must not contain more than 500 elements')
+        responses = []
+        for message in messages:
+            if message.token in self.unregistered:
+                responses.append(SendResponse(exception=self.UnregisteredError(message.token)))
+            else:
+                responses.append(SendResponse(self.send(message)))
+        return types.SimpleNamespace(responses=responses,
+                                     success_count=sum(r.success for r in responses),
+                                     failure_count=sum(not r.success for r in responses))
+
+
+def _decorator(*args, **kwargs):
+    return lambda fn: fn
+
+
+class _Event:
+    def __class_getitem__(cls, item):
+        return cls
+
+
+def install(db=None):
+    """Register the fakes as firebase_admin / firebase_functions; returns the fake client."""
+    db = db or FakeFirestore()
+    admin = types.ModuleType('firebase_admin')
+    admin.initialize_app = lambda *args, **kwargs: None
+
+    firestore = types.ModuleType('firebase_admin.firestore')
+    firestore.client = lambda app=None: db
+    firestore.transactional = transactional
+    firestore.Increment = Increment
+    firestore.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+
+    exceptions = types.ModuleType('firebase_admin.exceptions')
+    exceptions.InvalidArgumentError = type('InvalidArgumentError', (Exception,), {'code': 'INVALID_ARGUMENT'})
+
+    messaging = FakeMessaging()
+    admin.firestore, admin.messaging, admin.exceptions = firestore, messaging, exceptions
+
+    functions = types.ModuleType('firebase_functions')
+    functions.scheduler_fn = types.SimpleNamespace(on_schedule=_decorator, ScheduledEvent=object)
+    functions.firestore_fn = types.SimpleNamespace(
+        on_document_created=_decorator, on_document_written=_decorator,
+        Event=_Event, Change=_Event, DocumentSnapshot=DocumentSnapshot)
+
+    sys.modules.update({
+        'firebase_admin': admin,
+        'firebase_admin.firestore': firestore,
+        'firebase_admin.messaging': messaging,
+        'firebase_admin.exceptions': exceptions,
+        'firebase_functions': functions,
+    })
+    return db
@@ -1,11 +1,58 @@
 from firebase_functions import scheduler_fn, firestore_fn
-from firebase_admin import initialize_app, firestore, messaging
 from datetime import datetime, timedelta, timezone
+import functools
+import threading
+import time
 
-initialize_app()
+# The Admin SDK, its clients and the helper modules are loaded on first use
+# and kept for the life of the instance. Importing this module therefore only
+# registers the functions, and a trigger like log_notification_created never
+# loads Firestore or FCM.
+MAX_WORKERS = 8  # concurrent document operations per instance
+_clients = {}
+_clients_lock = threading.RLock()
+
+def _client(name, create):
+    if name not in _clients:
+        with _clients_lock:
+            if name not in _clients:
+                _clients[name] = create()
+    return _clients[name]
+
+def _initialize_app():
+    import firebase_admin
+    return firebase_admin.initialize_app()
+
+def get_app():
+    return _client('app', _initialize_app)
+
+def _firestore_client():
+    get_app()
+    from firebase_admin import firestore
+    return firestore.client()
+
+def get_db():
+    """Firestore client shared by all invocations of this instance."""
+    return _client('firestore', _firestore_client)
+
+def _messaging_module():
+    get_app()
+    from firebase_admin import messaging
+    return messaging
+
+def get_messaging():
+    return _client('messaging', _messaging_module)
+
+def get_pool():
+    """Thread pool bounding the per-document work of an invocation to MAX_WORKERS."""
+    def create():
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='documents')
+    return _client('pool', create)
 
 @scheduler_fn.on_schedule(schedule="0 13 * * *")  # Run at 13:00 UTC daily
-def send_parking_reminder():
+def send_parking_reminder(event: scheduler_fn.ScheduledEvent) -> None:
+    messaging = get_messaging()
     # Calculate the time for parking start (1 hour from now)
     parking_start_time = datetime.utcnow() + timedelta(hours=1)
     
@@ -23,72 +70,146 @@ def send_parking_reminder():
     except Exception as e:
         print(f"Error sending message: {e}")
 
+REMINDER_PAGE_SIZE = 250  # bookings per page; each needs up to 2 writes and a batch holds 500
+FCM_BATCH_SIZE = 500  # messaging.send_each limit
+REMINDER_TIME_BUDGET = 45  # seconds; bookings left over are picked up by the next run
+REMINDER_PAGES_IN_FLIGHT = 4  # pages sent while the next one is queried
+
+@functools.cache
+def permanent_send_errors():
+    """FCM errors that will not succeed on retry, so the booking is not scanned again."""
+    from firebase_admin import exceptions
+    messaging = get_messaging()
+    return (messaging.UnregisteredError, messaging.SenderIdMismatchError,
+            exceptions.InvalidArgumentError)
+
+@functools.lru_cache(maxsize=256)
+def reminder_notification(parking_time):
+    """Notifications are immutable, so bookings starting at the same time share one."""
+    messaging = get_messaging()
+    return messaging.Notification(
+        title="Parking Reminder",
+        body=f"Your parking starts at {parking_time}."
+    )
+
+def due_bookings(db, now, page_size=REMINDER_PAGE_SIZE):
+    """Yield pages of unsent bookings whose notificationTime has passed.
+
+    Needs the (sent, notificationTime) composite index in firestore.indexes.json.
+    """
+    query = (db.collection('bookings')
+             .where('sent', '==', False)
+             .where('notificationTime', '<=', now)
+             .order_by('notificationTime')
+             .limit(page_size))
+    last = None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+def send_reminders(db, page):
+    """Send one page of reminders and commit its booking/notification writes in one batch."""
+    messaging = get_messaging()
+    counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+    batch = db.batch()
+    notifications_ref = db.collection('notifications')
+    targets = []
+    for doc in page:
+        data = doc.to_dict()
+        fcm_token = data.get('fcmToken')
+        if not fcm_token:
+            print(f"No FCM token found for document {doc.id}")
+            batch.update(doc.reference, {'sent': True, 'sendError': 'missing-fcm-token'})
+            counts['skipped'] += 1
+            continue
+        try:
+            # Built before sending so a malformed booking cannot abort the page after the send
+            notification = reminder_notification(data['time'])
+            record = notification_record(
+                data["address"],
+                fcm_token,
+                data['notificationTime'].astimezone(timezone.utc),
+                data['time'],
+                True,
+                data.get('userId', ''),
+                'Zone : ' + data["zone"] + ', Level : ' + data["level"] + ', Row : ' + data["row"]
+            )
+        except (KeyError, TypeError, AttributeError) as e:
+            print(f"Invalid booking {doc.id}: {e}")
+            batch.update(doc.reference, {'sent': True, 'sendError': 'invalid-booking'})
+            counts['skipped'] += 1
+            continue
+        targets.append((doc, record, messaging.Message(
+            notification=notification,
+            token=fcm_token,
+        )))
+
+    results = []
+    for start in range(0, len(targets), FCM_BATCH_SIZE):
+        chunk = [message for *_, message in targets[start:start + FCM_BATCH_SIZE]]
+        try:
+            results.extend(messaging.send_each(chunk).responses)
+        except Exception as e:
+            # Whole chunk failed (e.g. network); the bookings stay unsent for the next run
+            print(f"Error sending messages: {e}")
+            results.extend([None] * len(chunk))
+
+    for (doc, record, _), result in zip(targets, results):
+        if result is None or not result.success:
+            counts['failed'] += 1
+            if result is not None and isinstance(result.exception, permanent_send_errors()):
+                batch.update(doc.reference, {'sent': True, 'sendError': result.exception.code})
+            continue
+        batch.update(doc.reference, {'sent': True})
+        batch.set(notifications_ref.document(), record)
+        counts['sent'] += 1
+
+    batch.commit()
+    return counts
+
 @scheduler_fn.on_schedule(schedule="*/5 * * * *")
 def check_and_send_notifications(event: scheduler_fn.ScheduledEvent) -> None:
-    print("Function started")
-    db = firestore.client()
+    db = get_db()
+    pool = get_pool()
     now = datetime.now(timezone.utc)  # Use timezone-aware UTC time
-    
-    print(f"Checking for notifications at {now}")
+    started = time.monotonic()
+    summary = {'due': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'batches': 0}
+    in_flight = []
 
-    # Query for unsent notifications
-    docs = db.collection('bookings').where('sent', '==', False).stream()
+    def collect(page, future):
+        try:
+            for key, value in future.result().items():
+                summary[key] += value
+            summary['batches'] += 1
+        except Exception as e:
+            print(f"Error processing reminder page: {e}")
+            summary['failed'] += len(page)
 
-    for doc in docs:
-        print(f"Processing document: {doc.id}")
-        data = doc.to_dict()
-        fcm_token = data.get('fcmToken')
-        parking_time = data['time']
-        address = data["address"]
-        parkingSlot = 'Zone : ' + data["zone"] + ', Level : ' + data["level"] + ', Row : ' + data["row"]
-        notification_time = data['notificationTime'].astimezone(timezone.utc)
-        parking_time_date = notification_time + timedelta(hours=2)
+    # Pages are disjoint (the cursor moves past them), so they can be sent
+    # while the next page is queried
+    for page in due_bookings(db, now):
+        summary['due'] += len(page)
+        in_flight.append((page, pool.submit(send_reminders, db, page)))
+        if len(in_flight) >= REMINDER_PAGES_IN_FLIGHT:
+            collect(*in_flight.pop(0))
+        if time.monotonic() - started > REMINDER_TIME_BUDGET:
+            print("Time budget reached, remaining reminders are left for the next run")
+            break
+    for page, future in in_flight:
+        collect(page, future)
 
-        print(f"Notification time: {notification_time}, Current time: {now}")
-        
-        if notification_time <= now:
-            print(f"Sending notification for parking at {parking_time}")
-
-            if fcm_token:
-                message = messaging.Message(
-                    notification=messaging.Notification(
-                        title="Parking Reminder",
-                        body=f"Your parking starts at {parking_time}."
-                    ),
-                    token=fcm_token,
-                )
-
-                try:
-                    response = messaging.send(message)
-                    print(f"Successfully sent message: {response}")
-                    doc.reference.update({'sent': True})
-
-                    # Add the notification in DB here:
-                    notification_id = add_notification(
-                        db,
-                        address,
-                        fcm_token,
-                        notification_time,
-                        parking_time,
-                        True,
-                        parking_time_date,
-                        data.get('userId', '')
-                    )
-                    if notification_id:
-                        print(f"Notification added to database with ID: {notification_id}")
-                    else:
-                        print("Failed to add notification to database")
-
-                except Exception as e:
-                    print(f"Error sending message: {e}")
-            else:
-                print(f"No FCM token found for document {doc.id}")
-
-    print("Function completed")
-
-def add_notification(db, address, fcm_token, notification_time, parking_time, sent, user_id, parkingSlot):
-    notifications_ref = db.collection('notifications')
-    new_notification = {
+    elapsed = time.monotonic() - started
+    summary['seconds'] = round(elapsed, 2)
+    summary['per_second'] = round(summary['sent'] / elapsed, 1) if elapsed else 0.0
+    print(f"Reminder run at {now}: {summary}")
+
+def notification_record(address, fcm_token, notification_time, parking_time, sent, user_id, parkingSlot):
+    return {
         'address': address,
         'fcmToken': fcm_token,
         'notificationTime': notification_time,
@@ -98,19 +219,124 @@ def add_notification(db, address, fcm_token, notification_time, parking_time, se
         'type': 'Reminder',
         'parkingSlot': parkingSlot
     }
-    
-    try:
-        doc_ref = notifications_ref.add(new_notification)
-        print(f"Notification added with ID: {doc_ref[1].id}")
-        return doc_ref[1].id
-    except Exception as e:
-        print(f"Error adding notification: {e}")
-        return None
 
 @firestore_fn.on_document_created(document="notifications/{notificationId}")
 def log_notification_created(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
     print(f"Notification created: {event.params['notificationId']}")
 
+def default_slots(data):
+    """Sensor field -> parking slot name (sN -> slot_N) when a device document has no "slots" map."""
+    return {key: f'slot_{key[1:]}' for key in data if key[:1] == 's' and key[1:].isdigit()}
+
+DEVICE_CACHE_TTL = 60  # seconds a warm instance reuses a devices/{id} lookup
+_device_cache = {}
+
+def resolve_device(db, device_id):
+    """Return the devices/{device_id} registry entry ({} if unregistered)."""
+    cached = _device_cache.get(device_id)
+    now = datetime.now(timezone.utc).timestamp()
+    if cached and now - cached[0] < DEVICE_CACHE_TTL:
+        return cached[1]
+    snapshot = db.collection('devices').document(device_id).get()
+    device = snapshot.to_dict() if snapshot.exists else {}
+    _device_cache[device_id] = (now, device)
+    return device
+
+def parking_capacity(parking_data):
+    """Total slots from the numeric field, falling back to the legacy "free/total" string."""
+    if parking_data.get('total_slots') is not None:
+        return int(parking_data['total_slots'])
+    slots_data = parking_data.get('slots_available')
+    if not slots_data:
+        return None
+    return int(str(slots_data).split('/')[1])
+
+def reading_slot_status(db, data):
+    """(parking_id, {slot: 'Full'|'Empty'}) of an arduino_data reading, or None if unregistered."""
+    # Resolve the single parking this gateway belongs to
+    device_id = data.get('device_id')
+    device = resolve_device(db, device_id) if device_id else {}
+    parking_id = data.get('parking_id') or device.get('parking_id')
+    if not parking_id:
+        return None
+    # Get sensor status for this device's slots
+    slots = device.get('slots') or default_slots(data)
+    return parking_id, {
+        slot: 'Full' if int(data.get(sensor, 0)) else 'Empty'
+        for sensor, slot in slots.items()
+    }
+
+NOTIFY_WINDOW = 60  # seconds; at most one parking_updates push per parking per window
+OCCUPANCY_REFRESH_INTERVAL = 10  # seconds; at most one shard-triggered summary write per parking
+OCCUPANCY_CATCH_UP = 180  # seconds; parkings summarized this recently are refreshed by the minute flush
+
+def parking_update_message(parking_id, state):
+    """Topic push carrying the latest availability of one parking."""
+    messaging = get_messaging()
+    return messaging.Message(
+        notification=messaging.Notification(
+            title="Parking Update",
+            body=f"Available spots: {state['available']}/{state['total_slots']}"
+        ),
+        data={
+            'parking_id': parking_id,
+            'available': str(state['available']),
+            'total': str(state['total_slots']),
+        },
+        topic="parking_updates"
+    )
+
+def apply_occupancy(db, parking_id, occupied, now):
+    """Materialize the summary fields of a parking and its notification state in one transaction.
+
+    Returns the state to push now, or None when availability did not change
+    or the push is deferred to flush_parking_notifications.
+    """
+    from firebase_admin import firestore
+    parking_ref = db.collection('parkings').document(parking_id)
+    notify_ref = db.collection('parking_notifications').document(parking_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        parking_doc = parking_ref.get(transaction=transaction)
+        notify_doc = notify_ref.get(transaction=transaction)
+        parking_data = parking_doc.to_dict() if parking_doc.exists else None
+        total_slots = parking_capacity(parking_data or {})
+        if total_slots is None:
+            raise ValueError(f"Parking {parking_id} has no slot capacity")
+
+        occupied_slots = max(0, min(occupied, total_slots))
+        available = total_slots - occupied_slots
+        updates = {
+            'total_slots': total_slots,
+            'occupied_slots': occupied_slots,
+            'available_slots': available,
+            'slots_available': f"{available}/{total_slots}",
+            'current_amount': occupied_slots * float(parking_data.get('price', 500)),
+        }
+        if any(parking_data.get(key) != value for key, value in updates.items()):
+            updates['last_updated'] = firestore.SERVER_TIMESTAMP
+            transaction.update(parking_ref, updates)
+
+        notify = notify_doc.to_dict() if notify_doc.exists else {}
+        if notify.get('available') == available:
+            return None
+        if notify.get('pending') and notify.get('sent_available') == available:
+            # Burst returned to the state already pushed; cancel the deferred push
+            transaction.update(notify_ref, {'available': available, 'pending': False})
+            return None
+        state = {'available': available, 'total_slots': total_slots}
+        last_sent = notify.get('last_sent')
+        send_now = last_sent is None or (now - last_sent).total_seconds() >= NOTIFY_WINDOW
+        transaction.set(notify_ref, {
+            **state,
+            'pending': not send_now,
+            **({'last_sent': now, 'sent_available': available} if send_now else {}),
+        }, merge=True)
+        return state if send_now else None
+
+    return apply(db.transaction())
+
 @firestore_fn.on_document_created(document="arduino_data/{dataId}")
 def process_arduino_data(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
     try:
@@ -118,53 +344,131 @@ def process_arduino_data(event: firestore_fn.Event[firestore_fn.DocumentSnapshot
         if not data:
             print("[ERROR] No data found in arduino_data document")
             return
-            
-        # Get sensor status
-        s1 = int(data.get('s1', 0))
-        s2 = int(data.get('s2', 0))
-        s3 = int(data.get('s3', 0))
-        total_occupied = s1 + s2 + s3
-        
-        # Update all parking documents
-        db = firestore.client()
-        parking_docs = db.collection('parkings').stream()
+
+        from occupancy import record_slot_states
+        db = get_db()
+        device_id = data.get('device_id')
+        resolved = reading_slot_status(db, data)
+        if resolved is None:
+            print(f"[ERROR] No parking registered for device {device_id}")
+            return
+        parking_id, slot_status = resolved
         
-        for doc in parking_docs:
-            try:
-                parking_data = doc.to_dict()
-                if not parking_data or 'slots_available' not in parking_data:
-                    continue
-                
-                slots_data = parking_data['slots_available']
-                total_slots = int(slots_data.split('/')[1])
-                available = total_slots - total_occupied
-                
-                # Update parking document
-                updates = {
-                    'slots_available': f"{available}/{total_slots}",
-                    'last_updated': firestore.SERVER_TIMESTAMP,
-                    'arduino_status': {
-                        'slot_1': 'Full' if s1 else 'Empty',
-                        'slot_2': 'Full' if s2 else 'Empty',
-                        'slot_3': 'Full' if s3 else 'Empty',
-                    }
-                }
-                doc.reference.update(updates)
-                
-                # Send notification if status changed
-                if available > 0:
-                    message = messaging.Message(
-                        notification=messaging.Notification(
-                            title="Parking Update",
-                            body=f"Available spots: {available}. Slots: 1-{'Full' if s1 else 'Empty'}, 2-{'Full' if s2 else 'Empty'}, 3-{'Full' if s3 else 'Empty'}"
-                        ),
-                        topic="parking_updates"
-                    )
-                    messaging.send(message)
-                
-            except Exception as e:
-                print(f"[ERROR] Failed to update parking {doc.id}: {e}")
-                continue
+        # Only slot documents and one counter shard are written; aggregate_occupancy
+        # materializes the parking summary from the shards
+        record_slot_states(db, parking_id, slot_status, device_id, data.get('captured_at'))
                 
     except Exception as e:
-        print(f"[ERROR] Processing arduino data failed: {e}")
\ No newline at end of file
+        print(f"[ERROR] Processing arduino data failed: {e}")
+
+def refresh_occupancy(db, parking_id, now):
+    """Summarize a parking from its counter shards and push the change if it is due."""
+    from occupancy import occupied_count
+    state = apply_occupancy(db, parking_id, occupied_count(db, parking_id), now)
+    if state is None:
+        return
+    try:
+        get_messaging().send(parking_update_message(parking_id, state))
+    except Exception as e:
+        # Leave it to the next flush instead of dropping the change
+        print(f"[ERROR] Parking update push failed: {e}")
+        db.collection('parking_notifications').document(parking_id).update({'pending': True})
+
+@firestore_fn.on_document_written(document="parkings/{parkingId}/occupancy_shards/{shardId}")
+def aggregate_occupancy(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    parking_id = event.params['parkingId']
+    try:
+        db = get_db()
+        now = datetime.now(timezone.utc)
+        # Every shard write fires this trigger; a parking summarized within the
+        # interval is left to flush_parking_notifications, which bounds the
+        # writes to parkings/{id} and parking_notifications/{id}
+        parking = db.collection('parkings').document(parking_id).get()
+        last_updated = (parking.to_dict() or {}).get('last_updated') if parking.exists else None
+        if last_updated and (now - last_updated).total_seconds() < OCCUPANCY_REFRESH_INTERVAL:
+            return
+        refresh_occupancy(db, parking_id, now)
+    except Exception as e:
+        print(f"[ERROR] Aggregating occupancy of {parking_id} failed: {e}")
+
+@scheduler_fn.on_schedule(schedule="*/10 * * * *")
+def reconcile_occupancy(event: scheduler_fn.ScheduledEvent) -> None:
+    """Correct counter shards that drifted from the per-slot documents."""
+    from occupancy import reconcile_counts
+    corrections = reconcile_counts(get_db(), pool=get_pool())
+    print(f"Occupancy corrections: {corrections or 'none'}")
+
+@scheduler_fn.on_schedule(schedule="* * * * *")
+def flush_parking_notifications(event: scheduler_fn.ScheduledEvent) -> None:
+    """Catch up summaries skipped by aggregate_occupancy and send the pushes coalesced by NOTIFY_WINDOW."""
+    from firebase_admin import firestore
+    db = get_db()
+    messaging = get_messaging()
+    now = datetime.now(timezone.utc)
+
+    def try_refresh(doc):
+        try:
+            refresh_occupancy(db, doc.id, now)
+        except Exception as e:
+            print(f"[ERROR] Refreshing occupancy of {doc.id} failed: {e}")
+
+    # A parking skipped by the trigger was summarized within the refresh
+    # interval, so it is among the recently updated ones; unchanged ones are not rewritten
+    recent = list(db.collection('parkings')
+                  .where('last_updated', '>=', now - timedelta(seconds=OCCUPANCY_CATCH_UP)).stream())
+    list(get_pool().map(try_refresh, recent))
+
+    @firestore.transactional
+    def claim(transaction, ref):
+        snapshot = ref.get(transaction=transaction)
+        notify = snapshot.to_dict() or {}
+        last_sent = notify.get('last_sent')
+        if not notify.get('pending') or (last_sent and (now - last_sent).total_seconds() < NOTIFY_WINDOW):
+            return None
+        transaction.update(ref, {'pending': False, 'last_sent': now, 'sent_available': notify.get('available')})
+        return notify
+
+    def try_claim(doc):
+        try:
+            return claim(db.transaction(), doc.reference)
+        except Exception as e:
+            print(f"[ERROR] Claiming parking update {doc.id} failed: {e}")
+            return None
+
+    # Each claim is its own transaction on its own document, so they run side by side
+    pending = list(db.collection('parking_notifications').where('pending', '==', True).stream())
+    claimed = [(doc, state) for doc, state in zip(pending, get_pool().map(try_claim, pending))
+               if state is not None]
+
+    for start in range(0, len(claimed), FCM_BATCH_SIZE):
+        chunk = claimed[start:start + FCM_BATCH_SIZE]
+        try:
+            responses = messaging.send_each(
+                [parking_update_message(doc.id, state) for doc, state in chunk]).responses
+        except Exception as e:
+            print(f"[ERROR] Parking update pushes failed: {e}")
+            responses = [None] * len(chunk)
+        batch = db.batch()
+        failed = 0
+        for (doc, _), response in zip(chunk, responses):
+            if response is None or not response.success:
+                batch.update(doc.reference, {'pending': True})
+                failed += 1
+        if failed:
+            batch.commit()
+    print(f"Refreshed {len(recent)} parkings, flushed {len(claimed)} coalesced parking updates")
+
+@scheduler_fn.on_schedule(schedule="*/5 * * * *")
+def rollup_arduino_data(event: scheduler_fn.ScheduledEvent) -> None:
+    """Compact new arduino_data readings into minute/hour/day occupancy buckets."""
+    from rollups import rollup_readings
+    db = get_db()
+    summary = rollup_readings(db, lambda data: reading_slot_status(db, data), pool=get_pool())
+    print(f"Rollup run: {summary}")
+
+@scheduler_fn.on_schedule(schedule="30 3 * * *")  # Run at 03:30 UTC daily
+def prune_arduino_data(event: scheduler_fn.ScheduledEvent) -> None:
+    """Delete raw readings past the retention window that are already rolled up."""
+    from rollups import prune_readings
+    deleted = prune_readings(get_db())
+    print(f"Deleted {deleted} raw arduino_data readings")
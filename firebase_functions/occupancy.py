@@ -0,0 +1,120 @@
+import random
+
+from firebase_admin import firestore
+
+# Occupancy is kept as one document per slot plus a sharded counter, so sensor
+# events never write the parkings/{id} document. aggregate_occupancy and
+# flush_parking_notifications in main.py are the only writers of the summary
+# fields readers use (slots_available, ...), at most once per
+# OCCUPANCY_REFRESH_INTERVAL from the trigger and once a minute from the flush.
+#
+#   parkings/{parking_id}/slot_state/{slot}        {'status': 'Full'|'Empty', 'captured_at', ...}
+#   parkings/{parking_id}/occupancy_shards/{n}     {'occupied': <int>}
+OCCUPANCY_SHARDS = 10  # each shard sustains ~1 write/sec
+SLOT_STATE = 'slot_state'
+OCCUPANCY_SHARDS_COLLECTION = 'occupancy_shards'
+
+def shard_ref(db, parking_id, shard):
+    return (db.collection('parkings').document(parking_id)
+            .collection(OCCUPANCY_SHARDS_COLLECTION).document(str(shard)))
+
+def record_slot_states(db, parking_id, slot_status, device_id=None, captured_at=None):
+    """Store slot transitions and add their net change to one random counter shard.
+
+    slot_status: {'slot_1': 'Full', ...}. A slot without a document counts as
+    Empty. captured_at is when the gateway read the sensors; readings of a
+    spooled batch share one commit time and their triggers may run in any
+    order, so a slot only takes a reading newer than the one it holds. Slots
+    whose status is unchanged only advance their captured_at. Returns the net
+    change in occupied slots.
+    """
+    parking_ref = db.collection('parkings').document(parking_id)
+    refs = {slot: parking_ref.collection(SLOT_STATE).document(slot) for slot in slot_status}
+    counter = shard_ref(db, parking_id, random.randrange(OCCUPANCY_SHARDS))
+
+    @firestore.transactional
+    def apply(transaction):
+        delta = 0
+        changed = {}
+        seen = []
+        # All reads happen before any write in a transaction
+        for slot, ref in refs.items():
+            snapshot = ref.get(transaction=transaction)
+            stored = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            last_captured = stored.get('captured_at')
+            if captured_at is not None and last_captured is not None and captured_at < last_captured:
+                continue  # an older reading delivered late
+            previous = stored.get('status', 'Empty')
+            if previous != slot_status[slot]:
+                changed[slot] = slot_status[slot]
+                delta += (slot_status[slot] == 'Full') - (previous == 'Full')
+            elif captured_at is not None and captured_at != last_captured:
+                seen.append(slot)
+        for slot, status in changed.items():
+            transaction.set(refs[slot], {
+                'status': status,
+                'device_id': device_id,
+                'captured_at': captured_at,
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+        for slot in seen:
+            # Keeps a later-arriving older reading from overturning this confirmation
+            transaction.set(refs[slot], {'captured_at': captured_at}, merge=True)
+        if delta:
+            # The shard is never read here, so concurrent increments do not conflict
+            transaction.set(counter, {'occupied': firestore.Increment(delta)}, merge=True)
+        return delta
+
+    return apply(db.transaction())
+
+def occupied_count(db, parking_id):
+    """Sum of all counter shards of a parking."""
+    shards = (db.collection('parkings').document(parking_id)
+              .collection(OCCUPANCY_SHARDS_COLLECTION).stream())
+    return sum(int((shard.to_dict() or {}).get('occupied', 0)) for shard in shards)
+
+def reconcile_counts(db, pool=None):
+    """Repair shard drift from the per-slot documents.
+
+    Collection group scans pick the parkings whose shards look off; each of
+    them is then recounted in its own transaction that reads its slot
+    documents and shards together, so a transition committing meanwhile is
+    not mistaken for drift. Returns {parking_id: correction}. The correction
+    goes to shard 0, which fires aggregate_occupancy again.
+    """
+    expected = {}
+    for slot in db.collection_group(SLOT_STATE).where('status', '==', 'Full').stream():
+        parking_id = slot.reference.parent.parent.id
+        expected[parking_id] = expected.get(parking_id, 0) + 1
+    counted = {}
+    for shard in db.collection_group(OCCUPANCY_SHARDS_COLLECTION).stream():
+        parking_id = shard.reference.parent.parent.id
+        counted[parking_id] = counted.get(parking_id, 0) + int((shard.to_dict() or {}).get('occupied', 0))
+    suspects = [parking_id for parking_id in set(expected) | set(counted)
+                if expected.get(parking_id, 0) != counted.get(parking_id, 0)]
+
+    corrections = {}
+    for parking_id, diff in zip(suspects, (pool.map if pool else map)(
+            lambda parking_id: reconcile_parking(db, parking_id), suspects)):
+        if diff:
+            corrections[parking_id] = diff
+    return corrections
+
+def reconcile_parking(db, parking_id):
+    """Recount one parking in a transaction and correct shard 0; returns the correction."""
+    parking_ref = db.collection('parkings').document(parking_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        # Every slot document is read, not only Full ones, so any transition
+        # of this parking conflicts with the transaction
+        slots = parking_ref.collection(SLOT_STATE).stream(transaction=transaction)
+        shards = parking_ref.collection(OCCUPANCY_SHARDS_COLLECTION).stream(transaction=transaction)
+        expected = sum((slot.to_dict() or {}).get('status') == 'Full' for slot in slots)
+        counted = sum(int((shard.to_dict() or {}).get('occupied', 0)) for shard in shards)
+        diff = expected - counted
+        if diff:
+            transaction.set(shard_ref(db, parking_id, 0), {'occupied': firestore.Increment(diff)}, merge=True)
+        return diff
+
+    return apply(db.transaction())
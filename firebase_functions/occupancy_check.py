@@ -0,0 +1,142 @@
+"""Check the sharded occupancy counters under concurrent sensor traffic.
+
+Runs process_arduino_data from many threads and aggregate_occupancy as the
+shard trigger would, then flush_parking_notifications once as the minute
+schedule would. It then verifies that every parking summary matches the
+slot states that were sent.
+
+    python occupancy_check.py
+    FIRESTORE_EMULATOR_HOST=localhost:8080 GCLOUD_PROJECT=demo-parking python occupancy_check.py --emulator
+
+Without --emulator an in-memory fake (fakes.py) is used and triggers run on
+a background thread. With --emulator aggregate_occupancy runs once per
+parking after the traffic, because this script does not deploy triggers.
+"""
+import argparse
+import queue
+import random
+import sys
+import threading
+import time
+import types
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--parkings', type=int, default=3)
+    parser.add_argument('--devices', type=int, default=4, help='devices per parking')
+    parser.add_argument('--slots', type=int, default=3, help='slots per device')
+    parser.add_argument('--events', type=int, default=3000)
+    parser.add_argument('--threads', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--emulator', action='store_true', help='use FIRESTORE_EMULATOR_HOST instead of the fake')
+    return parser.parse_args()
+
+
+def event(data=None, **params):
+    snapshot = types.SimpleNamespace(to_dict=lambda: data)
+    return types.SimpleNamespace(data=snapshot, params=params)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    triggers = queue.Queue()
+    counts = {'parking_writes': 0, 'shard_writes': 0}
+
+    if not args.emulator:
+        import fakes
+        db = fakes.install()
+
+        def on_write(path, before, after):
+            parts = path.split('/')
+            if len(parts) == 4 and parts[0] == 'parkings' and parts[2] == 'occupancy_shards':
+                counts['shard_writes'] += 1
+                triggers.put(parts[1])
+            elif len(parts) == 2 and parts[0] == 'parkings':
+                counts['parking_writes'] += 1
+        db.listeners.append(on_write)
+
+    import main as functions_main
+    from occupancy import occupied_count, reconcile_counts
+    from firebase_admin import messaging
+    if args.emulator:
+        db = functions_main.get_db()
+
+    def run_triggers():
+        while True:
+            parking_id = triggers.get()
+            if parking_id is None:
+                break
+            functions_main.aggregate_occupancy(event(parkingId=parking_id))
+
+    trigger_thread = threading.Thread(target=run_triggers, daemon=True)
+    trigger_thread.start()
+
+    # Each device is owned by one thread so its final state is well defined
+    devices = {}
+    for p in range(args.parkings):
+        parking_id = f'check-parking-{p}'
+        db.collection('parkings').document(parking_id).set({
+            'name': parking_id, 'price': 500, 'total_slots': args.devices * args.slots})
+        for d in range(args.devices):
+            device_id = f'{parking_id}-device-{d}'
+            slots = {f's{i}': f'd{d}_slot_{i}' for i in range(1, args.slots + 1)}
+            db.collection('devices').document(device_id).set({'parking_id': parking_id, 'slots': slots})
+            devices[device_id] = parking_id
+    state = {device_id: [0] * args.slots for device_id in devices}
+    owners = [list(devices)[i::args.threads] for i in range(args.threads)]
+
+    def worker(owned, seed, events):
+        worker_rng = random.Random(seed)
+        for _ in range(events):
+            if not owned:
+                return
+            device_id = worker_rng.choice(owned)
+            sensors = state[device_id]
+            sensors[worker_rng.randrange(len(sensors))] ^= 1
+            functions_main.process_arduino_data(event({
+                **{f's{i}': value for i, value in enumerate(sensors, 1)},
+                'device_id': device_id,
+                'parking_id': devices[device_id],
+            }))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(owned, rng.random(), args.events // args.threads))
+               for owned in owners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if args.emulator:
+        for parking_id in set(devices.values()):
+            triggers.put(parking_id)
+    triggers.put(None)
+    trigger_thread.join()
+    # Catches up the parkings whose last triggers fell inside OCCUPANCY_REFRESH_INTERVAL
+    functions_main.flush_parking_notifications(None)
+    elapsed = time.perf_counter() - started
+
+    failures = 0
+    for parking_id in sorted(set(devices.values())):
+        expected = sum(sum(state[d]) for d, p in devices.items() if p == parking_id)
+        total = args.devices * args.slots
+        parking = db.collection('parkings').document(parking_id).get().to_dict()
+        counted = occupied_count(db, parking_id)
+        ok = counted == expected and parking.get('slots_available') == f'{total - expected}/{total}'
+        failures += not ok
+        print(f"{'[OK]' if ok else '[ERROR]'} {parking_id}: expected {expected} occupied, "
+              f"shards {counted}, summary {parking.get('slots_available')}")
+
+    drift = reconcile_counts(db)
+    failures += bool(drift)
+    print(f"Reconcile corrections: {drift or 'none'}")
+    sent = len(getattr(messaging, 'sent', []))
+    print(f"{args.events} events in {elapsed:.2f}s ({args.events / elapsed:.0f}/s), "
+          f"parking document writes: {counts['parking_writes']}, shard writes: {counts['shard_writes']}, "
+          f"pushes: {sent}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+# Slot occupancy is compacted from raw arduino_data readings into buckets:
+#
+#   parkings/{parking_id}/occupancy_by_minute/{YYYYMMDDTHHMMZ}
+#   parkings/{parking_id}/occupancy_by_hour/{...}
+#   parkings/{parking_id}/occupancy_by_day/{...}
+#
+# Each bucket holds time-weighted seconds per slot: 'observed' is how long
+# the slot state was known and 'occupied' how much of that it was Full.
+# Readings are only sent on change, so a slot keeps its last state until the
+# next reading; rollup_state/{parking_id} carries that state between runs.
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+ROLLUP_LAG = timedelta(seconds=60)      # let concurrent commits land before moving the watermark
+MAX_ROLLUP_SPAN = timedelta(hours=6)    # keeps one parking's buckets in a single batch (<500 writes)
+MAX_ROLLUP_READINGS = 5000
+RAW_RETENTION = timedelta(days=30)
+PRUNE_BATCH_SIZE = 500
+MAX_PRUNE_DELETES = 20000
+PAGE_SIZE = 500
+WATERMARK_REF = ('rollup_watermarks', 'arduino_data')
+
+def bucket_collection(resolution):
+    return f'occupancy_by_{resolution}'
+
+def bucket_start(moment, resolution):
+    seconds = RESOLUTIONS[resolution]
+    epoch = int(moment.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+def bucket_id(start):
+    return start.strftime('%Y%m%dT%H%MZ')
+
+def split_interval(start, end, resolution):
+    """Yield (bucket_start, seconds) for the part of [start, end) in each bucket."""
+    step = timedelta(seconds=RESOLUTIONS[resolution])
+    current = bucket_start(start, resolution)
+    while current < end:
+        overlap = (min(end, current + step) - max(start, current)).total_seconds()
+        if overlap > 0:
+            yield current, overlap
+        current += step
+
+class OccupancyAccumulator:
+    """Integrates slot states of one parking over time into in-memory buckets."""
+
+    def __init__(self, slots=None, floor=None):
+        # {slot: {'status': 'Full'|'Empty', 'since': datetime}}
+        self.slots = {slot: dict(state) for slot, state in (slots or {}).items()}
+        self.buckets = {}
+        # Start of the run; older readings and carried-over states are counted
+        # from here, so the buckets stay within the run's span
+        self.floor = floor
+        if floor is not None:
+            for state in self.slots.values():
+                state['since'] = max(state['since'], floor)
+
+    def _bucket(self, resolution, start):
+        return self.buckets.setdefault((resolution, start), {
+            'observed': {}, 'occupied': {}, 'readings': 0, 'transitions': 0})
+
+    def _add(self, slot, status, start, end):
+        if end <= start:
+            return
+        for resolution in RESOLUTIONS:
+            for bucket, seconds in split_interval(start, end, resolution):
+                totals = self._bucket(resolution, bucket)
+                totals['observed'][slot] = totals['observed'].get(slot, 0) + seconds
+                if status == 'Full':
+                    totals['occupied'][slot] = totals['occupied'].get(slot, 0) + seconds
+
+    def observe(self, moment, slot_status):
+        """Apply one reading taken at moment: {'slot_1': 'Full', ...}."""
+        # A spooled reading can be days old; counted as of the run's start it
+        # cannot spread its slots over more buckets than the run spans
+        if self.floor is not None:
+            moment = max(moment, self.floor)
+        changed = 0
+        for slot, status in slot_status.items():
+            state = self.slots.get(slot)
+            if state is None:
+                self.slots[slot] = {'status': status, 'since': moment}
+                continue
+            # Late (spooled) readings are applied at the carried-over time
+            at = max(moment, state['since'])
+            self._add(slot, state['status'], state['since'], at)
+            changed += state['status'] != status
+            state.update(status=status, since=at)
+        for resolution in RESOLUTIONS:
+            totals = self._bucket(resolution, bucket_start(moment, resolution))
+            totals['readings'] += 1
+            totals['transitions'] += changed
+
+    def advance(self, until):
+        """Extend every slot's current state up to until."""
+        for slot, state in self.slots.items():
+            if until > state['since']:
+                self._add(slot, state['status'], state['since'], until)
+                state['since'] = until
+
+    def writes(self, parking_id):
+        """(collection, document id, merge data) for every touched bucket."""
+        for (resolution, start), totals in sorted(self.buckets.items(), key=lambda item: item[0][1]):
+            yield bucket_collection(resolution), bucket_id(start), {
+                'parking_id': parking_id,
+                'start': start,
+                'end': start + timedelta(seconds=RESOLUTIONS[resolution]),
+                'readings': firestore.Increment(totals['readings']),
+                'transitions': firestore.Increment(totals['transitions']),
+                'observed_seconds': firestore.Increment(sum(totals['observed'].values())),
+                'occupied_seconds': firestore.Increment(sum(totals['occupied'].values())),
+                'slots': {
+                    slot: {
+                        'observed_seconds': firestore.Increment(observed),
+                        'occupied_seconds': firestore.Increment(totals['occupied'].get(slot, 0)),
+                    }
+                    for slot, observed in totals['observed'].items()
+                },
+            }
+
+def _readings(db, since, until):
+    """Raw readings committed in (since, until], oldest first, bounded by MAX_ROLLUP_READINGS.
+
+    Returns (readings, until) where until may be pulled back to the last
+    complete commit timestamp when the bound is hit.
+    """
+    query = db.collection('arduino_data').order_by('timestamp').limit(PAGE_SIZE)
+    if since is not None:
+        query = query.where('timestamp', '>', since)
+    query = query.where('timestamp', '<=', until)
+    readings = []
+    last = None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        readings.extend(page)
+        if len(page) < PAGE_SIZE:
+            return readings, until
+        last = page[-1]
+        if len(readings) >= MAX_ROLLUP_READINGS:
+            # A gateway batch shares one commit timestamp; finish that batch before stopping
+            cutoff = last.get('timestamp')
+            readings = [doc for doc in readings if doc.get('timestamp') < cutoff]
+            readings.extend(db.collection('arduino_data').where('timestamp', '==', cutoff).stream())
+            return readings, cutoff
+
+def rollup_readings(db, resolve_slots, now=None, pool=None):
+    """Fold readings committed since the watermark into occupancy buckets.
+
+    resolve_slots(data) -> (parking_id, {slot: 'Full'|'Empty'}) or None.
+    Each parking's buckets and carried-over state are committed in one batch,
+    and the parking's own watermark makes a retried run skip readings it has
+    already counted. Nothing is counted before the run's start, so the
+    buckets never outgrow MAX_ROLLUP_SPAN. Parkings are independent, so with
+    an executor as pool they are folded concurrently. Returns a summary of
+    the run.
+    """
+    now = now or datetime.now(timezone.utc)
+    watermark_ref = db.collection(WATERMARK_REF[0]).document(WATERMARK_REF[1])
+    snapshot = watermark_ref.get()
+    since = (snapshot.to_dict() or {}).get('watermark') if snapshot.exists else None
+    if since is None:
+        since = now - RAW_RETENTION
+    until = min(now - ROLLUP_LAG, since + MAX_ROLLUP_SPAN)
+    if until <= since:
+        return {'readings': 0, 'parkings': 0, 'buckets': 0, 'watermark': since}
+
+    readings, until = _readings(db, since, until)
+    by_parking = {}
+    skipped = 0
+    for doc in readings:
+        data = doc.to_dict()
+        resolved = resolve_slots(data)
+        if resolved is None:
+            skipped += 1
+            continue
+        parking_id, slot_status = resolved
+        moment = data.get('captured_at') or data['timestamp']
+        by_parking.setdefault(parking_id, []).append((data['timestamp'], moment, slot_status))
+
+    # Parkings without new readings still accrue time in their current state
+    for state_doc in db.collection('rollup_state').stream():
+        by_parking.setdefault(state_doc.id, [])
+
+    def fold(item):
+        parking_id, parking_readings = item
+        state_ref = db.collection('rollup_state').document(parking_id)
+        state_snapshot = state_ref.get()
+        state = state_snapshot.to_dict() if state_snapshot.exists else {}
+        parking_watermark = state.get('watermark')
+        if parking_watermark is not None and parking_watermark >= until:
+            return 0
+        accumulator = OccupancyAccumulator(state.get('slots'), floor=since)
+        for committed, moment, slot_status in parking_readings:
+            if parking_watermark is None or committed > parking_watermark:
+                # A gateway clock running ahead must not reach past the run either
+                accumulator.observe(min(moment, until), slot_status)
+        accumulator.advance(until)
+
+        written = 0
+        batch = db.batch()
+        parking_ref = db.collection('parkings').document(parking_id)
+        for collection, document_id, data in accumulator.writes(parking_id):
+            batch.set(parking_ref.collection(collection).document(document_id), data, merge=True)
+            written += 1
+        batch.set(state_ref, {'watermark': until, 'slots': accumulator.slots})
+        batch.commit()
+        return written
+
+    # The global watermark only moves once every parking has committed
+    buckets = sum((pool.map if pool else map)(fold, by_parking.items()))
+
+    watermark_ref.set({'watermark': until, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+    return {'readings': len(readings), 'skipped': skipped, 'parkings': len(by_parking),
+            'buckets': buckets, 'watermark': until}
+
+def prune_readings(db, now=None):
+    """Delete raw readings older than RAW_RETENTION that the rollup has already counted."""
+    now = now or datetime.now(timezone.utc)
+    snapshot = db.collection(WATERMARK_REF[0]).document(WATERMARK_REF[1]).get()
+    watermark = (snapshot.to_dict() or {}).get('watermark') if snapshot.exists else None
+    if watermark is None:
+        return 0
+    cutoff = min(now - RAW_RETENTION, watermark)
+    query = (db.collection('arduino_data')
+             .where('timestamp', '<', cutoff)
+             .order_by('timestamp')
+             .limit(PRUNE_BATCH_SIZE))
+    deleted = 0
+    while deleted < MAX_PRUNE_DELETES:
+        page = list(query.stream())
+        if not page:
+            break
+        batch = db.batch()
+        for doc in page:
+            batch.delete(doc.reference)
+        batch.commit()
+        deleted += len(page)
+    return deleted
+
+def occupancy_history(db, parking_id, start, end, resolution=None, slot=None):
+    """Occupancy buckets of a parking in [start, end) from the rollups.
+
+    resolution defaults to minute for spans up to 6 hours, hour up to 14 days
+    and day beyond. Each row: {'start', 'end', 'occupancy', 'occupied_seconds',
+    'observed_seconds', 'readings', 'transitions'}; occupancy is the fraction
+    of observed slot time that was Full (None when nothing was observed).
+    With slot, the seconds are those of that slot only.
+    """
+    if resolution is None:
+        span = end - start
+        resolution = 'minute' if span <= timedelta(hours=6) else 'hour' if span <= timedelta(days=14) else 'day'
+    query = (db.collection('parkings').document(parking_id)
+             .collection(bucket_collection(resolution))
+             .where('start', '>=', bucket_start(start, resolution))
+             .where('start', '<', end)
+             .order_by('start'))
+    history = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        totals = (data.get('slots') or {}).get(slot, {}) if slot else data
+        observed = totals.get('observed_seconds', 0)
+        occupied = totals.get('occupied_seconds', 0)
+        history.append({
+            'start': data['start'],
+            'end': data['end'],
+            'occupancy': occupied / observed if observed else None,
+            'occupied_seconds': occupied,
+            'observed_seconds': observed,
+            'readings': data.get('readings', 0),
+            'transitions': data.get('transitions', 0),
+        })
+    return history
@@ -133,6 +133,8 @@ Future<void> addParkingToFirestore({
       'longitude': posLongitude,
       'price': pricePerHour,
       'slots_available': "$totalSlots/$totalSlots", // Total slots available
+      'total_slots': totalSlots,
+      'available_slots': totalSlots,
     });
 
     showToast(message: 'Success: Parking area added successfully!');
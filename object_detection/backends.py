@@ -0,0 +1,188 @@
+import os
+
+import cv2
+import numpy as np
+
+from detection import INPUT_SIZE, base_path, load_yolo
+
+DEFAULT_BACKEND = 'yolov3'
+
+# Backend бүрийн тохиргоо. Файлын замыг base_path-аас хайна.
+#   engine: 'darknet' (cv2.dnn cfg/weights), 'onnx' (cv2.dnn), 'onnxruntime'
+#   input_size: ONNX загвар тогтмол оролттой бол түүний хэмжээ
+#   quantized: INT8 жинтэй эсэх (зөвхөн мэдээлэлд)
+#   batching: нэг forward-д олон frame (N > 1) авах эсэх. YOLOv5-ийн энгийн
+#       ONNX export тогтмол batch=1 тул ONNX загварт анхдагчаар идэвхгүй;
+#       dynamic batch-тай export-д 'batching': True нэмнэ.
+BACKENDS = {
+    'yolov3': {'engine': 'darknet', 'cfg': 'yolov3.cfg', 'weights': 'yolov3.weights',
+               'batching': True},
+    'yolov3-tiny': {'engine': 'darknet', 'cfg': 'yolov3-tiny.cfg',
+                    'weights': 'yolov3-tiny.weights', 'batching': True},
+    'onnx': {'engine': 'onnx', 'model': 'yolov5s.onnx', 'input_size': (640, 640)},
+    'onnx-int8': {'engine': 'onnx', 'model': 'yolov5s-int8.onnx', 'input_size': (640, 640),
+                  'quantized': True},
+    'onnxruntime': {'engine': 'onnxruntime', 'model': 'yolov5s.onnx', 'input_size': (640, 640)},
+    'onnxruntime-int8': {'engine': 'onnxruntime', 'model': 'yolov5s-int8.onnx',
+                         'input_size': (640, 640), 'quantized': True},
+}
+
+
+def backend_spec(name):
+    if name not in BACKENDS:
+        raise Exception(f"'{name}' backend олдсонгүй ({', '.join(BACKENDS)})")
+    return BACKENDS[name]
+
+
+def supports_batching(name):
+    """Backend олон frame-тэй blob-ийг нэг forward-оор боловсруулж чадах эсэх"""
+    return bool(backend_spec(name).get('batching', False))
+
+
+class YoloOnnxNet:
+    """YOLOv5 хэлбэрийн ONNX загварыг cv2.dnn.Net-тэй ижил интерфейсээр ажиллуулах
+
+    Гаралт (N, rows, 5 + classes) нь оролтын пикселээр илэрхийлэгдсэн
+    cx, cy, w, h, objectness, ангийн магадлалтай байдаг. Үүнийг darknet
+    YOLO давхаргын гаралттай адил (0-1 координат, objectness-оор үржсэн
+    магадлал) болгож хөрвүүлэх тул detection.py-ийн decode өөрчлөгдөхгүй.
+    """
+
+    def __init__(self, run, output_names, fixed_input_size=None, supports_batching=False):
+        # run(blob) -> гаралтын жагсаалт
+        self._run = run
+        self._output_names = output_names
+        self._blob = None
+        self.fixed_input_size = fixed_input_size
+        # False бол detect_objects_batch frame бүрийг тусад нь forward хийнэ
+        self.supports_batching = supports_batching
+
+    def setInput(self, blob):
+        self._blob = blob
+
+    def forward(self, output_layers=None):
+        height, width = self._blob.shape[2:4]
+        outputs = []
+        for out in self._run(self._blob):
+            out = out.reshape(self._blob.shape[0], -1, out.shape[-1]).astype(np.float32, copy=True)
+            out[..., 0:4] /= np.array([width, height, width, height], dtype=np.float32)
+            out[..., 5:] *= out[..., 4:5]
+            outputs.append(out)
+        return outputs
+
+    def getUnconnectedOutLayersNames(self):
+        return list(self._output_names)
+
+    def setPreferableBackend(self, backend_id):
+        pass
+
+    def setPreferableTarget(self, target_id):
+        pass
+
+
+def _load_classes(names_path):
+    with open(names_path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def load_backend(name=DEFAULT_BACKEND, weights_path=None, cfg_path=None, names_path=None,
+                 model_path=None, threads=None):
+    """Backend-ийн нэрээр загвар ачаалж (net, classes, output_layers) буцаах"""
+    spec = backend_spec(name)
+    names_path = names_path or os.path.join(base_path, 'coco.names')
+
+    if spec['engine'] == 'darknet':
+        return load_yolo(weights_path or os.path.join(base_path, spec['weights']),
+                         cfg_path or os.path.join(base_path, spec['cfg']),
+                         names_path)
+
+    model_path = model_path or weights_path or os.path.join(base_path, spec['model'])
+    if not os.path.exists(model_path):
+        raise Exception(f"ONNX загвар олдсонгүй: {model_path}")
+    classes = _load_classes(names_path)
+
+    if spec['engine'] == 'onnx':
+        dnn_net = cv2.dnn.readNetFromONNX(model_path)
+        output_names = dnn_net.getUnconnectedOutLayersNames()
+
+        def run(blob):
+            dnn_net.setInput(blob)
+            return dnn_net.forward(output_names)
+    else:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise Exception("onnxruntime суулгаагүй байна (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        output_names = [output.name for output in session.get_outputs()]
+
+        def run(blob):
+            return session.run(output_names, {input_name: blob})
+
+    net = YoloOnnxNet(run, output_names, spec.get('input_size'), supports_batching(name))
+    print(f"[OK] {name} ({model_path}) загвар амжилттай ачааллалаа")
+    return net, classes, list(output_names)
+
+
+def input_size_for(name, requested=None):
+    """Тогтмол оролттой загварт хүссэн хэмжээг үл тоомсорлоно"""
+    fixed = backend_spec(name).get('input_size')
+    if fixed:
+        return tuple(fixed)
+    if requested:
+        return (requested, requested) if isinstance(requested, int) else tuple(requested)
+    return INPUT_SIZE
+
+
+def quantize_onnx(src_path, dst_path):
+    """ONNX загварыг onnxruntime-ийн dynamic quantization-аар INT8 болгох (offline)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8)
+    return dst_path
+
+
+class AdaptiveResolution:
+    """Камерын frame дараалал хуримтлагдвал оролтын хэмжээг багасгаж,
+    чөлөөтэй болбол буцааж нэмэх бодлого
+
+    Хэлбэлзэхээс сэргийлж хэд хэдэн удаа дараалан ижил дохио ирсэн үед л
+    хэмжээг өөрчилнө.
+    """
+
+    SIZES = (416, 320, 256)
+
+    def __init__(self, sizes=SIZES, high_water=3, low_water=1, patience=5):
+        self.sizes = tuple(sizes)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.patience = patience
+        self._level = 0
+        self._pressure = 0
+
+    @property
+    def input_size(self):
+        size = self.sizes[self._level]
+        return (size, size)
+
+    def observe(self, backlog):
+        """Inference хийх хооронд ирсэн frame-ийн тоог (backlog) бүртгэх"""
+        if backlog > self.high_water:
+            self._pressure = max(self._pressure, 0) + 1
+        elif backlog <= self.low_water:
+            self._pressure = min(self._pressure, 0) - 1
+        else:
+            self._pressure = 0
+
+        if self._pressure >= self.patience and self._level < len(self.sizes) - 1:
+            self._level += 1
+            self._pressure = 0
+            print(f"[INFO] Оролтын хэмжээг {self.sizes[self._level]} болгож багасгалаа")
+        elif self._pressure <= -self.patience and self._level > 0:
+            self._level -= 1
+            self._pressure = 0
+            print(f"[INFO] Оролтын хэмжээг {self.sizes[self._level]} болгож нэмэгдүүллээ")
+        return self.input_size
@@ -0,0 +1,355 @@
+"""Машин илрүүлэх pipeline-ийн offline benchmark
+
+Камер, сүлжээгүй CPU орчинд бичлэг эсвэл synthetic frame-ийг pipeline-аар
+давтан оруулж, үе шат бүрийн (capture, blob, forward, decode, nms,
+annotate, encode) p50/p95/p99 хугацаа, frames/second-ийг тохиргоо бүрээр
+JSON хэлбэрээр гаргана. Загвар (backends.py), оролтын хэмжээ бүрийн
+нарийвчлалыг эхний загварын үр дүн эсвэл --ground-truth файлтай харьцуулна.
+
+Жишээ:
+    python benchmark.py --frames 40 --input-sizes 256,320,416 --batch-sizes 1,4 \\
+        --models yolov3,yolov3-tiny,onnx --threads 1,4 --output bench.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from backends import (DEFAULT_BACKEND, backend_spec, input_size_for, load_backend,
+                      supports_batching)
+from detection import (CONF_THRESHOLD, NMS_THRESHOLD, VEHICLE_CLASSES, class_indices,
+                       decode_outputs, detect_objects, draw_detections, non_max_suppression,
+                       split_batch_outputs)
+from snapshots import encode_jpeg
+
+STAGES = ('capture', 'blob', 'forward', 'decode', 'nms', 'annotate', 'encode')
+IOU_THRESHOLD = 0.5     # Илрүүлэлтийг таарсан гэж үзэх IoU
+
+# cv2.dnn-ийн backend/target хослолууд
+BACKENDS = {
+    'opencv': (cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU),
+    'openvino': (getattr(cv2.dnn, 'DNN_BACKEND_INFERENCE_ENGINE', None), cv2.dnn.DNN_TARGET_CPU),
+}
+
+
+class SyntheticSource:
+    """Камергүй орчинд ашиглах санамсаргүй frame-ууд (тогтмол seed)"""
+
+    def __init__(self, width=640, height=480, seed=0, pool_size=16):
+        rng = np.random.default_rng(seed)
+        self._frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                        for _ in range(pool_size)]
+        self._index = 0
+
+    def read(self):
+        frame = self._frames[self._index % len(self._frames)].copy()
+        self._index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class VideoSource:
+    """Бичлэгийг дуустал уншаад эхнээс нь дахин давтах frame source"""
+
+    def __init__(self, path):
+        self._path = path
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise SystemExit(f"[ERROR] Бичлэг нээж чадсангүй: {path}")
+
+    def read(self):
+        ret, frame = self._cap.read()
+        if not ret:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def close(self):
+        self._cap.release()
+
+
+def make_source(args):
+    if args.video:
+        return VideoSource(args.video)
+    width, height = (int(v) for v in args.frame_size.split('x'))
+    return SyntheticSource(width, height)
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+    }
+
+
+def run_config(source, model, num_frames, input_size, batch_size, warmup_batches=1):
+    """Нэг тохиргоог ажиллуулж үе шат бүрийн хугацааг цуглуулах
+
+    blob, forward нь batch тутамд, бусад нь frame тутамд хэмжигдэнэ.
+    """
+    net, classes, output_layers = model
+    class_filter = class_indices(classes, VEHICLE_CLASSES)
+    timings = {stage: [] for stage in STAGES}
+    processed = 0
+    total = 0.0
+
+    batches = warmup_batches + -(-num_frames // batch_size)
+    for batch_index in range(batches):
+        measuring = batch_index >= warmup_batches
+        batch_start = time.perf_counter()
+        samples = {stage: [] for stage in STAGES}
+
+        frames = []
+        for _ in range(batch_size):
+            start = time.perf_counter()
+            frame = source.read()
+            samples['capture'].append(time.perf_counter() - start)
+            if frame is None:
+                break
+            frames.append(frame)
+        if not frames:
+            break
+
+        start = time.perf_counter()
+        blob = cv2.dnn.blobFromImages(frames, 1/255.0, input_size, swapRB=True, crop=False)
+        samples['blob'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        net.setInput(blob)
+        outputs = net.forward(output_layers)
+        samples['forward'].append(time.perf_counter() - start)
+
+        for frame, frame_outputs in zip(frames, split_batch_outputs(outputs, len(frames))):
+            height, width = frame.shape[:2]
+
+            start = time.perf_counter()
+            class_ids, confidences, boxes = decode_outputs(
+                frame_outputs, width, height, CONF_THRESHOLD, class_filter)
+            samples['decode'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            keep = non_max_suppression(class_ids, confidences, boxes,
+                                       CONF_THRESHOLD, NMS_THRESHOLD)
+            samples['nms'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            draw_detections(frame, class_ids[keep].tolist(), confidences[keep].tolist(),
+                            boxes[keep].tolist(), classes)
+            samples['annotate'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            encode_jpeg(frame)
+            samples['encode'].append(time.perf_counter() - start)
+
+        if measuring:
+            total += time.perf_counter() - batch_start
+            processed += len(frames)
+            for stage, values in samples.items():
+                timings[stage].extend(values)
+
+    return {
+        'frames': processed,
+        'seconds': round(total, 4),
+        'fps': round(processed / total, 2) if total else 0.0,
+        'stages': {stage: percentiles(values) for stage, values in timings.items()},
+    }
+
+
+def collect_detections(frames, model, input_size):
+    """Frame бүрийн тээврийн хэрэгслийн илрүүлэлт [(анги, хайрцаг), ...]"""
+    net, classes, output_layers = model
+    class_filter = class_indices(classes, VEHICLE_CLASSES)
+    detections = []
+    for frame in frames:
+        class_ids, _, boxes = detect_objects(frame, net, output_layers,
+                                             class_filter=class_filter, input_size=input_size)
+        detections.append([(classes[class_id], box) for class_id, box in zip(class_ids, boxes)])
+    return detections
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def accuracy(predicted, expected, iou_threshold=IOU_THRESHOLD):
+    """Ижил ангийн хайрцгийг IoU-оор greedy тааруулж precision/recall тооцох"""
+    tp = fp = fn = 0
+    for frame_pred, frame_expected in zip(predicted, expected):
+        unmatched = list(frame_expected)
+        for label, box in frame_pred:
+            scores = [(iou(box, other), i) for i, (other_label, other) in enumerate(unmatched)
+                      if other_label == label]
+            best = max(scores, default=(0.0, None))
+            if best[0] >= iou_threshold:
+                unmatched.pop(best[1])
+                tp += 1
+            else:
+                fp += 1
+        fn += len(unmatched)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+        'f1': round(f1, 4),
+        'true_positives': tp,
+        'false_positives': fp,
+        'false_negatives': fn,
+    }
+
+
+def load_ground_truth(path):
+    """{"frames": [[{"class": "car", "box": [x, y, w, h]}, ...], ...]} хэлбэрийн файл"""
+    with open(path, 'r') as f:
+        frames = json.load(f)['frames']
+    return [[(item['class'], item['box']) for item in frame] for frame in frames]
+
+
+def parse_list(value, cast=int):
+    return [cast(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', default=DEFAULT_BACKEND,
+                        help='Харьцуулах backend-ууд (эхнийх нь нарийвчлалын жишиг)')
+    parser.add_argument('--weights', help='Ганц загвар хэмжих үед жингийн файл')
+    parser.add_argument('--cfg')
+    parser.add_argument('--names')
+    parser.add_argument('--video', help='Synthetic frame-ийн оронд ашиглах бичлэг')
+    parser.add_argument('--frame-size', default='640x480', help='Synthetic frame-ийн хэмжээ')
+    parser.add_argument('--frames', type=int, default=40, help='Тохиргоо бүрт хэмжих frame')
+    parser.add_argument('--input-sizes', default='416')
+    parser.add_argument('--batch-sizes', default='1,2,5,10')
+    parser.add_argument('--threads', default='0',
+                        help='cv2.setNumThreads утгууд (0 бол OpenCV-ийн анхдагч)')
+    parser.add_argument('--backends', default='opencv', help=','.join(BACKENDS))
+    parser.add_argument('--accuracy-frames', type=int, default=20,
+                        help='Нарийвчлал харьцуулах frame-ийн тоо (0 бол алгасна)')
+    parser.add_argument('--ground-truth', help='Frame бүрийн зөв хайрцагтай JSON файл')
+    parser.add_argument('--output', help='JSON үр дүнг бичих файл')
+    args = parser.parse_args()
+
+    model_names = parse_list(args.models, str)
+    for name in model_names:
+        try:
+            backend_spec(name)
+        except Exception as e:
+            raise SystemExit(f"[ERROR] {e}")
+
+    # Нарийвчлалыг бүх загварт ижил frame-үүд дээр хэмжинэ
+    eval_source = make_source(args)
+    eval_frames = [frame for frame in (eval_source.read() for _ in range(args.accuracy_frames))
+                   if frame is not None]
+    eval_source.close()
+    expected = load_ground_truth(args.ground_truth) if args.ground_truth else None
+    reference = args.ground_truth
+
+    source = make_source(args)
+    results = []
+    accuracies = {}
+    try:
+        for model_name in model_names:
+            # --weights/--cfg зөвхөн ганц загвар хэмжих үед хамаарна
+            paths = {}
+            if len(model_names) == 1:
+                paths = {'weights_path': args.weights, 'cfg_path': args.cfg}
+            try:
+                model = load_backend(model_name, names_path=args.names, **paths)
+            except Exception as e:
+                print(f"[INFO] {model_name} загвар ачаалж чадсангүй, алгаслаа: {e}")
+                continue
+            net = model[0]
+            engine = backend_spec(model_name)['engine']
+
+            seen = set()
+            grid = itertools.product(parse_list(args.backends, str), parse_list(args.threads),
+                                     parse_list(args.input_sizes), parse_list(args.batch_sizes))
+            for backend, threads, requested_size, batch_size in grid:
+                # Тогтмол оролттой загварт хэмжээний давталт ижил тохиргоо болно
+                input_size = input_size_for(model_name, requested_size)
+                if (backend, threads, input_size, batch_size) in seen:
+                    continue
+                seen.add((backend, threads, input_size, batch_size))
+                if engine == 'onnxruntime' and backend != 'opencv':
+                    continue
+                if batch_size > 1 and not supports_batching(model_name):
+                    # Тогтмол batch=1 загвар олон frame-тэй blob-ийг хүлээж авахгүй
+                    continue
+                backend_id, target_id = BACKENDS[backend]
+                try:
+                    net.setPreferableBackend(backend_id)
+                    net.setPreferableTarget(target_id)
+                except (cv2.error, TypeError):
+                    print(f"[INFO] {backend} backend энэ OpenCV-д байхгүй, алгаслаа")
+                    continue
+                cv2.setNumThreads(threads if threads else -1)
+
+                result = run_config(source, model, args.frames, input_size, batch_size)
+                result['config'] = {
+                    'model': model_name,
+                    'backend': backend,
+                    'threads': threads or cv2.getNumThreads(),
+                    'input_size': input_size[0],
+                    'batch_size': batch_size,
+                }
+
+                # Батч, thread нь үр дүнг өөрчлөхгүй тул загвар, хэмжээ тутамд нэг удаа
+                accuracy_key = (model_name, input_size)
+                if eval_frames and accuracy_key not in accuracies:
+                    predicted = collect_detections(eval_frames, model, input_size)
+                    if expected is None:
+                        # Эхний хэмжсэн тохиргоо жишиг болно
+                        expected = predicted
+                        reference = f'{model_name}@{input_size[0]}'
+                    accuracies[accuracy_key] = accuracy(predicted, expected)
+                if accuracy_key in accuracies:
+                    result['accuracy'] = accuracies[accuracy_key]
+                results.append(result)
+                print(f"[OK] {result['config']}: {result['fps']} fps")
+    finally:
+        source.close()
+
+    report = {
+        'timestamp': time.time(),
+        'host': {
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+        },
+        'source': args.video or f'synthetic:{args.frame_size}',
+        'accuracy_reference': reference,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        print(f"[OK] Үр дүнг {args.output} файлд хадгаллаа")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from metrics import CAMERA_OPEN_FAILURES, STAGE_LATENCY
+
+BUFFER_SIZE = 30        # Камер бүрийн ring buffer-ийн хэмжээ
+MAX_FRAME_AGE = 2.0     # Үүнээс хуучин frame-ийг stale гэж үзнэ (секунд)
+READ_TIMEOUT = 5.0      # Шинэ frame хүлээх дээд хугацаа (секунд)
+MIN_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+
+def camera_source(camera_type, camera_id=0, ip_address=None):
+    """Request-ийн камерын мэдээллээс (key, VideoCapture source) гаргах"""
+    if camera_type == 'USB':
+        return f'USB:{int(camera_id)}', int(camera_id)
+    if not ip_address:
+        raise Exception('IP хаяг заагаагүй байна')
+    return f'IP:{ip_address}', f'http://{ip_address}/video'
+
+
+class CameraWorker(threading.Thread):
+    """Нэг камерыг байнга нээлттэй байлгаж, frame-уудыг ring buffer-т хийдэг thread
+
+    Холболт тасарвал exponential backoff-оор дахин холбогдоно.
+    """
+
+    def __init__(self, key, source, buffer_size=BUFFER_SIZE, max_frame_age=MAX_FRAME_AGE,
+                 open_capture=cv2.VideoCapture):
+        super().__init__(name=f'capture-{key}', daemon=True)
+        self.key = key
+        self.source = source
+        self.max_frame_age = max_frame_age
+        self._open_capture = open_capture
+        self._frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self.connected = False
+        self.frames_read = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    def _open(self):
+        with STAGE_LATENCY.time(stage='capture_open'):
+            cap = self._open_capture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            CAMERA_OPEN_FAILURES.inc(camera=self.key)
+            return None
+        # Драйверын дотоод буферийг багасгаж хуучин frame-ээс сэргийлэх
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def run(self):
+        backoff = MIN_BACKOFF
+        while not self._stop_event.is_set():
+            try:
+                cap = self._open()
+            except Exception as e:
+                cap = None
+                self.last_error = str(e)
+                CAMERA_OPEN_FAILURES.inc(camera=self.key)
+
+            if cap is None:
+                self.last_error = self.last_error or "Камер нээж чадсангүй"
+                print(f"[RETRY] {self.key} камер {backoff:.1f}с дараа дахин холбогдоно")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            backoff = MIN_BACKOFF
+            self.connected = True
+            self.last_error = None
+            print(f"[OK] {self.key} камер амжилттай нээгдлээ")
+
+            try:
+                while not self._stop_event.is_set():
+                    start = time.perf_counter()
+                    ret, frame = cap.read()
+                    STAGE_LATENCY.observe(time.perf_counter() - start, stage='frame_read')
+                    if not ret:
+                        self.last_error = "Frame уншиж чадсангүй"
+                        break
+                    with self._cond:
+                        self._frames.append((time.monotonic(), frame))
+                        self.frames_read += 1
+                        self._cond.notify_all()
+            finally:
+                cap.release()
+                self.connected = False
+                with self._cond:
+                    # Дахин холбогдоход өмнөх stale frame-ууд хэрэггүй
+                    self._frames.clear()
+
+            if not self._stop_event.is_set():
+                self.reconnects += 1
+                print(f"[ERROR] {self.key} камерын холболт тасарлаа: {self.last_error}")
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _fresh_frames(self):
+        cutoff = time.monotonic() - self.max_frame_age
+        return [frame for ts, frame in self._frames if ts >= cutoff]
+
+    def latest(self, count=1, stride=1, timeout=READ_TIMEOUT):
+        """Buffer-ээс хамгийн сүүлийн `count` frame-ийг (stride алхамтай) хуулж авах
+
+        Хангалттай шинэ frame цугларах хүртэл timeout хүртэл хүлээнэ. Хугацаа
+        дуусвал байгаа frame-уудаа буцаана.
+        """
+        needed = (count - 1) * stride + 1
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            frames = self._fresh_frames()
+            while len(frames) < needed and not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                frames = self._fresh_frames()
+
+        # Илрүүлэлт frame дээр зурдаг тул buffer-ийн frame-ийг хуулна
+        selected = frames[::-1][::stride][:count][::-1]
+        return [frame.copy() for frame in selected]
+
+    def wait_frame(self, after=0, timeout=READ_TIMEOUT):
+        """after-аас хойш уншигдсан хамгийн сүүлийн frame-ийг хүлээж (дугаар, хуулбар) авах
+
+        Хугацаа дуусвал (after, None) буцаана.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.frames_read <= after or not self._frames:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    return after, None
+                self._cond.wait(remaining)
+            return self.frames_read, self._frames[-1][1].copy()
+
+    def status(self):
+        with self._cond:
+            buffered = len(self._frames)
+        return {
+            'key': self.key,
+            'source': str(self.source),
+            'connected': self.connected,
+            'buffered_frames': buffered,
+            'frames_read': self.frames_read,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+        }
+
+
+class CaptureManager:
+    """Бүртгэгдсэн камер бүрт нэг CameraWorker ажиллуулах"""
+
+    def __init__(self, buffer_size=BUFFER_SIZE, max_frame_age=MAX_FRAME_AGE):
+        self._buffer_size = buffer_size
+        self._max_frame_age = max_frame_age
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, key, source):
+        """Камерыг бүртгэж (бүртгэгдээгүй бол) ажиллаж буй worker-ийг буцаах"""
+        with self._lock:
+            worker = self._workers.get(key)
+            if worker is None or not worker.is_alive():
+                worker = CameraWorker(key, source, self._buffer_size, self._max_frame_age)
+                worker.start()
+                self._workers[key] = worker
+            return worker
+
+    def get(self, key):
+        with self._lock:
+            return self._workers.get(key)
+
+    def remove(self, key):
+        with self._lock:
+            worker = self._workers.pop(key, None)
+        if worker is not None:
+            worker.stop()
+            worker.join(timeout=2)
+        return worker is not None
+
+    def keys(self):
+        with self._lock:
+            return list(self._workers)
+
+    def connected_keys(self):
+        """Камераа одоо нээлттэй барьж буй worker-уудын түлхүүр"""
+        with self._lock:
+            return [key for key, worker in self._workers.items() if worker.connected]
+
+    def status(self):
+        with self._lock:
+            workers = list(self._workers.values())
+        return [worker.status() for worker in workers]
+
+    def stop_all(self):
+        for key in self.keys():
+            self.remove(key)
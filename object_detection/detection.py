@@ -0,0 +1,176 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from metrics import STAGE_LATENCY
+
+# Тээврийн хэрэгслийн ангиуд (coco.names)
+VEHICLE_CLASSES = ('car', 'truck', 'bus', 'motorbike')
+
+CONF_THRESHOLD = 0.5
+NMS_THRESHOLD = 0.4
+INPUT_SIZE = (416, 416)
+
+# Get absolute base path
+base_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_yolo(weights_path=None, cfg_path=None, names_path=None):
+    """YOLO загварыг ачааллах"""
+    try:
+        # Файлуудын замыг зөв зааж өгөх
+        weights_path = weights_path or os.path.join(base_path, "yolov3.weights")
+        cfg_path = cfg_path or os.path.join(base_path, "yolov3.cfg")
+        names_path = names_path or os.path.join(base_path, "coco.names")
+
+        # Файлууд байгаа эсэхийг шалгах
+        if not all(os.path.exists(f) for f in [weights_path, cfg_path, names_path]):
+            raise Exception("YOLO файлууд олдсонгүй")
+
+        net = cv2.dnn.readNet(weights_path, cfg_path)
+        with open(names_path, "r") as f:
+            classes = [line.strip() for line in f.readlines()]
+        
+        layer_names = net.getLayerNames()
+        try:
+            output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers().flatten()]
+        except:
+            output_layers = [layer_names[i[0] - 1] for i in net.getUnconnectedOutLayers()]
+        
+        print("[OK] YOLO модел амжилттай ачааллалаа")
+        return net, classes, output_layers
+    except Exception as e:
+        print(f"[ERROR] YOLO ачааллахад алдаа гарлаа: {str(e)}")
+        raise
+
+
+def class_indices(classes, names=VEHICLE_CLASSES):
+    """Ангийн нэрсийг coco.names доторх индекс рүү хөрвүүлэх"""
+    return np.array([classes.index(name) for name in names if name in classes], dtype=np.int64)
+
+
+def decode_outputs(outputs, width, height, conf_threshold=CONF_THRESHOLD, class_filter=None):
+    """YOLO гаралтыг бүхэл массив дээр NumPy-гаар задлах
+
+    Бүх output давхаргыг нэгтгэж, мөр бүрийн argmax, итгэлийн маск,
+    хайрцгийн хөрвүүлэлтийг нэг дор хийнэ.
+    """
+    preds = np.concatenate([out.reshape(-1, out.shape[-1]) for out in outputs])
+    scores = preds[:, 5:]
+
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+
+    mask = confidences > conf_threshold
+    if class_filter is not None:
+        mask &= np.isin(class_ids, class_filter)
+
+    preds = preds[mask]
+    class_ids = class_ids[mask]
+    confidences = confidences[mask].astype(np.float32)
+
+    scale = np.array([width, height], dtype=np.float32)
+    centers = (preds[:, 0:2] * scale).astype(np.int32)
+    sizes = (preds[:, 2:4] * scale).astype(np.int32)
+    corners = (centers - sizes / 2).astype(np.int32)
+    boxes = np.hstack([corners, sizes])
+
+    return class_ids, confidences, boxes
+
+
+def non_max_suppression(class_ids, confidences, boxes,
+                        conf_threshold=CONF_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+    """Анги тус бүрээр NMS хийж, үлдэх мөрүүдийн индексийг буцаах"""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    box_list = boxes.tolist()
+    score_list = confidences.tolist()
+    if hasattr(cv2.dnn, 'NMSBoxesBatched'):
+        keep = cv2.dnn.NMSBoxesBatched(box_list, score_list, class_ids.tolist(),
+                                       conf_threshold, nms_threshold)
+    else:
+        # Анги бүрийн хайрцгийг тусдаа орон зайд шилжүүлж нэг удаа NMS хийх
+        offset = 2 * int((np.abs(boxes[:, :2]) + boxes[:, 2:]).max()) + 1
+        shifted = boxes.copy()
+        shifted[:, :2] += (class_ids * offset)[:, None]
+        keep = cv2.dnn.NMSBoxes(shifted.tolist(), score_list, conf_threshold, nms_threshold)
+
+    return np.asarray(keep, dtype=np.int64).reshape(-1)
+
+
+def postprocess(outputs, width, height, conf_threshold=CONF_THRESHOLD,
+                nms_threshold=NMS_THRESHOLD, class_filter=None):
+    """Нэг frame-ийн гаралтыг задалж, NMS хийгээд жагсаалт болгох"""
+    start = time.perf_counter()
+    class_ids, confidences, boxes = decode_outputs(
+        outputs, width, height, conf_threshold, class_filter)
+    decoded = time.perf_counter()
+    keep = non_max_suppression(class_ids, confidences, boxes, conf_threshold, nms_threshold)
+    STAGE_LATENCY.observe(decoded - start, stage='decode')
+    STAGE_LATENCY.observe(time.perf_counter() - decoded, stage='nms')
+
+    return class_ids[keep].tolist(), confidences[keep].tolist(), boxes[keep].tolist()
+
+
+def detect_objects(frame, net, output_layers, conf_threshold=CONF_THRESHOLD,
+                   nms_threshold=NMS_THRESHOLD, class_filter=None, input_size=INPUT_SIZE):
+    """Нэг frame дээр объект илрүүлэх
+
+    class_filter өгвөл зөвхөн тэдгээр ангийн (жишээ нь тээврийн хэрэгсэл)
+    илрүүлэлтийг үлдээнэ.
+    """
+    height, width = frame.shape[:2]
+    with STAGE_LATENCY.time(stage='forward'):
+        blob = cv2.dnn.blobFromImage(frame, 1/255.0, input_size, swapRB=True, crop=False)
+        net.setInput(blob)
+        outputs = net.forward(output_layers)
+
+    return postprocess(outputs, width, height, conf_threshold, nms_threshold, class_filter)
+
+
+def split_batch_outputs(outputs, batch_size):
+    """Batch forward-ын гаралтыг frame бүрээр салгах
+
+    OpenCV-ийн хувилбараас хамаарч YOLO давхарга (N, rows, 85) эсвэл
+    (N*rows, 85) хэлбэртэй гаралт өгдөг.
+    """
+    per_layer = [out.reshape(batch_size, -1, out.shape[-1]) for out in outputs]
+    return [[layer[i] for layer in per_layer] for i in range(batch_size)]
+
+
+def detect_objects_batch(frames, net, output_layers, conf_threshold=CONF_THRESHOLD,
+                         nms_threshold=NMS_THRESHOLD, class_filter=None, input_size=INPUT_SIZE):
+    """Олон frame-ийг нэг 4-D blob болгож, нэг forward-оор илрүүлэх
+
+    Тогтмол batch=1 оролттой загварт (net.supports_batching False) frame
+    бүрийг тусад нь forward хийнэ. cv2.dnn-ийн darknet сүлжээ batch дэмжинэ.
+    """
+    if not frames:
+        return []
+    if len(frames) > 1 and not getattr(net, 'supports_batching', True):
+        return [detect_objects(frame, net, output_layers, conf_threshold, nms_threshold,
+                               class_filter, input_size) for frame in frames]
+
+    with STAGE_LATENCY.time(stage='forward'):
+        blob = cv2.dnn.blobFromImages(frames, 1/255.0, input_size, swapRB=True, crop=False)
+        net.setInput(blob)
+        outputs = net.forward(output_layers)
+
+    results = []
+    for frame, frame_outputs in zip(frames, split_batch_outputs(outputs, len(frames))):
+        height, width = frame.shape[:2]
+        results.append(postprocess(frame_outputs, width, height,
+                                   conf_threshold, nms_threshold, class_filter))
+    return results
+
+
+def draw_detections(frame, class_ids, confidences, boxes, classes, color=(0, 255, 0)):
+    """Илрүүлсэн объектуудыг frame дээр тэмдэглэх"""
+    for class_id, confidence, (x, y, w, h) in zip(class_ids, confidences, boxes):
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame, f'{classes[class_id]} {confidence:.2f}', (x, y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return frame
@@ -0,0 +1,121 @@
+import glob
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+
+MAX_CAMERA_INDEX = 10   # 0-9 хүртэлх камер шалгах
+PROBE_WORKERS = 4       # Зэрэг шалгах thread-ийн тоо
+PROBE_TIMEOUT = 2.0     # Нэг камер шалгах дээд хугацаа (секунд)
+CACHE_TTL = 60.0        # Үр дүнг cache-д хадгалах хугацаа (секунд)
+DEVICE_GLOB = '/dev/video*'
+
+
+def probe_camera(index, open_capture=cv2.VideoCapture):
+    """Нэг USB камерыг нээж frame уншиж чадаж байгаа эсэхийг шалгах"""
+    cap = open_capture(index)
+    try:
+        if not cap.isOpened():
+            return False
+        ret, _ = cap.read()
+        return bool(ret)
+    finally:
+        cap.release()
+
+
+def device_fingerprint():
+    """/dev/video* төхөөрөмжүүдийн жагсаалт (hot-plug илрүүлэхэд)
+
+    Linux биш орчинд хоосон tuple буцаах тул cache зөвхөн TTL-ээр шинэчлэгдэнэ.
+    """
+    return tuple(sorted(glob.glob(DEVICE_GLOB)))
+
+
+class CameraDiscovery:
+    """Камеруудыг зэрэгцээ шалгаж, үр дүнг TTL-тэй cache-д хадгалах
+
+    Capture worker-т аль хэдийн нээгдсэн камерыг дахин нээхгүй, шууд
+    боломжтой гэж тооцно.
+    """
+
+    def __init__(self, in_use=lambda: set(), max_index=MAX_CAMERA_INDEX, workers=PROBE_WORKERS,
+                 probe_timeout=PROBE_TIMEOUT, ttl=CACHE_TTL, probe=probe_camera):
+        # in_use() -> capture worker-т байгаа USB индексүүд
+        self._in_use = in_use
+        self._max_index = max_index
+        self._probe_timeout = probe_timeout
+        self._ttl = ttl
+        self._probe = probe
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='camera-probe')
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._cameras = None
+        self._cached_at = 0.0
+        self._fingerprint = None
+        self._pending = {}
+
+    def _candidates(self, fingerprint):
+        # /dev/video* байгаа бол зөвхөн тэдгээр индексийг шалгана
+        indices = set()
+        for path in fingerprint:
+            suffix = path[len(DEVICE_GLOB) - 1:]
+            if suffix.isdigit() and int(suffix) < self._max_index:
+                indices.add(int(suffix))
+        return sorted(indices) if fingerprint else list(range(self._max_index))
+
+    def _is_stale(self, fingerprint):
+        return (self._cameras is None
+                or time.monotonic() - self._cached_at > self._ttl
+                or fingerprint != self._fingerprint)
+
+    def invalidate(self):
+        with self._lock:
+            self._cameras = None
+
+    def refresh(self):
+        """Бүх камерыг дахин шалгаж cache шинэчлэх"""
+        with self._refresh_lock:
+            fingerprint = device_fingerprint()
+            in_use = set(self._in_use())
+
+            found = set(index for index in in_use if index < self._max_index)
+            futures = {}
+            for index in self._candidates(fingerprint):
+                if index in found:
+                    continue
+                # Өмнөх удаа timeout болж дуусаагүй probe-ийг давхар эхлүүлэхгүй
+                future = self._pending.get(index)
+                if future is None or future.done():
+                    future = self._executor.submit(self._probe, index)
+                    self._pending[index] = future
+                futures[future] = index
+
+            done, _ = wait(futures, timeout=self._probe_timeout)
+            for future in done:
+                try:
+                    if future.result():
+                        found.add(futures[future])
+                except Exception as e:
+                    print(f"[ERROR] Камер {futures[future]} шалгахад алдаа гарлаа: {e}")
+
+            cameras = [{
+                'id': index,
+                'type': 'USB',
+                'name': f'USB Camera {index}',
+                'in_use': index in in_use,
+            } for index in sorted(found)]
+
+            with self._lock:
+                self._cameras = cameras
+                self._cached_at = time.monotonic()
+                self._fingerprint = fingerprint
+            return cameras
+
+    def cameras(self):
+        """Cache хүчинтэй бол шууд, үгүй бол дахин шалгаж буцаах"""
+        fingerprint = device_fingerprint()
+        with self._lock:
+            if not self._is_stale(fingerprint):
+                return list(self._cameras)
+        return self.refresh()
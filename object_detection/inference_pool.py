@@ -0,0 +1,394 @@
+import itertools
+import multiprocessing as mp
+import queue
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+CV_THREADS = 1          # Worker процесс бүрийн OpenCV thread-ийн тоо
+SCHEDULE_INTERVAL = 0.01
+LIVENESS_INTERVAL = 0.5 # Worker процессууд амьд эсэхийг шалгах давтамж (секунд)
+MAX_RESTARTS = 5        # Унасан worker-ийг дахин эхлүүлэх дээд тоо
+MAX_SEGMENTS = 64       # Worker бүрийн нээлттэй байлгах камерын shared memory-ийн тоо
+
+_main_lock = threading.Lock()
+
+
+@contextmanager
+def _bare_main():
+    """spawn worker-ууд эх процессын __main__ скриптийг дахин ажиллуулахгүй байх
+
+    spawn нь sys.modules['__main__']-ийн файлыг хүүхэд процесст '__mp_main__'
+    нэрээр дахин импортолдог тул `python vehicle_detection.py` үед worker бүр
+    Flask app, capture, snapshot thread-үүдээ үүсгэнэ. Process.start() хийх
+    зуур __main__-ийг хоосон модулиар солиход worker зөвхөн энэ модулийг
+    (_worker_main-ийн хамаарлуудтай нь) импортолно.
+    """
+    with _main_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+
+def _worker_main(worker_id, tasks, results, backend, model_paths, cv_threads):
+    """Worker процесс: өөрийн сүлжээг ачаалж, shared memory-ээс frame уншиж илрүүлнэ"""
+    import cv2
+    from backends import input_size_for, load_backend
+    from detection import VEHICLE_CLASSES, class_indices, detect_objects
+
+    cv2.setNumThreads(cv_threads)
+    try:
+        net, classes, output_layers = load_backend(backend, threads=cv_threads, **model_paths)
+        input_size = input_size_for(backend)
+    except Exception as e:
+        results.put(('failed', worker_id, str(e)))
+        return
+    class_filter = class_indices(classes, VEHICLE_CLASSES)
+    results.put(('ready', worker_id, None))
+
+    segments = OrderedDict()    # камер -> SharedMemory, хамгийн сүүлд ашигласан нь төгсгөлд
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, key, shm_name, shape = task
+            try:
+                shm = segments.get(key)
+                if shm is not None and shm.name != shm_name:
+                    # Эх процесс камерын segment-ийг шинээр үүсгэсэн: хуучныг нь чөлөөлнө
+                    shm.close()
+                    shm = None
+                if shm is None:
+                    # spawn процессууд эх процессын resource tracker-ийг хуваалцдаг
+                    shm = segments[key] = shared_memory.SharedMemory(name=shm_name)
+                    while len(segments) > MAX_SEGMENTS:
+                        segments.popitem(last=False)[1].close()
+                segments.move_to_end(key)
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+                start = time.perf_counter()
+                class_ids, confidences, boxes = detect_objects(
+                    frame, net, output_layers, class_filter=class_filter, input_size=input_size)
+                del frame
+                results.put(('done', worker_id, (task_id, {
+                    'class_ids': class_ids,
+                    'classes': [classes[i] for i in class_ids],
+                    'confidences': confidences,
+                    'boxes': boxes,
+                    'inference_ms': round((time.perf_counter() - start) * 1000, 1),
+                })))
+            except Exception as e:
+                frame = None    # Segment-ийг хаахад view үлдэхгүй байх
+                results.put(('error', worker_id, (task_id, str(e))))
+    finally:
+        for shm in segments.values():
+            shm.close()
+
+
+class _FrameSlot:
+    """Нэг камерын frame-ийг процесс хооронд дамжуулах shared memory"""
+
+    def __init__(self, key):
+        self.key = key
+        self.shm = None
+        self.busy = False
+        self.worker_id = None
+
+    def write(self, frame):
+        if self.shm is None or self.shm.size < frame.nbytes:
+            # Том frame ирвэл segment-ийг шинээр үүсгэнэ (worker ажиллаагүй үед л)
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf)
+        view[...] = frame
+        del view
+        return self.shm.name
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class InferencePool:
+    """Олон камерын inference-ийг worker процессуудад хуваарилах
+
+    Worker бүр өөрийн сүлжээтэй тул GIL-ээр хязгаарлагдахгүй. Frame-ийг
+    pickle хийлгүйгээр shared memory-ээр дамжуулж, камер бүрт нэгээс олон
+    task зэрэг явуулахгүй (шинэ frame-ийг worker завгүй үед алгасна).
+
+    Унасан worker-ийн хүлээгдэж буй task-ууд алдаатай дуусч, камерууд нь
+    бусад worker-т шилжинэ. Унасан worker-ийг MAX_RESTARTS хүртэл дахин
+    эхлүүлнэ; модел ачаалж чадаагүй worker-ийг дахин эхлүүлэхгүй.
+    """
+
+    def __init__(self, num_workers, model_paths=None, cv_threads=CV_THREADS,
+                 policy='least_loaded', backend='yolov3'):
+        if policy not in ('round_robin', 'least_loaded'):
+            raise ValueError(f'Unknown policy: {policy}')
+        self.policy = policy
+        self.backend = backend
+        self._model_paths = model_paths or {}
+        self._cv_threads = cv_threads
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._tasks = [None] * num_workers
+        self._processes = [None] * num_workers
+        self._load = [0] * num_workers
+        self._restarts = [0] * num_workers
+        self._ready = set()
+        self._down = set()          # Модел ачаалж чадаагүй эсвэл MAX_RESTARTS хэтэрсэн
+        self._assignments = {}
+        self._round_robin = itertools.cycle(range(num_workers))
+        self._slots = {}
+        self._pending = {}
+        self._task_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.completed = 0
+        self.errors = 0
+
+        for worker_id in range(num_workers):
+            self._spawn(worker_id)
+
+        self._collector = threading.Thread(target=self._collect, name='inference-results',
+                                           daemon=True)
+        self._collector.start()
+
+    def _spawn(self, worker_id):
+        # Хуучин queue-д үлдсэн task-уудыг шинэ процесс авахгүй
+        tasks = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main, name=f'inference-worker-{worker_id}', daemon=True,
+            args=(worker_id, tasks, self._results, self.backend, self._model_paths,
+                  self._cv_threads))
+        with _bare_main():
+            process.start()
+        self._tasks[worker_id] = tasks
+        self._processes[worker_id] = process
+
+    def _check_workers(self):
+        """Унасан worker-уудын task-ыг алдаатай дуусгаж, боломжтой бол дахин эхлүүлэх"""
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive() or self._closed:
+                continue
+            with self._lock:
+                down = worker_id in self._down
+                if down and self._load[worker_id] == 0:
+                    continue
+                lost = [(task_id, future, slot) for task_id, (future, slot, owner)
+                        in self._pending.items() if owner == worker_id]
+                for task_id, _, slot in lost:
+                    del self._pending[task_id]
+                    slot.busy = False
+                self._load[worker_id] = 0
+                self._ready.discard(worker_id)
+                self.errors += len(lost)
+                # round_robin: энэ worker-т оноосон камеруудыг дараагийн удаа шинээр хуваарилна
+                for key in [k for k, w in self._assignments.items() if w == worker_id]:
+                    del self._assignments[key]
+                restart = not down and self._restarts[worker_id] < MAX_RESTARTS
+                if restart:
+                    self._restarts[worker_id] += 1
+                else:
+                    self._down.add(worker_id)
+            for _, future, _ in lost:
+                future.set_exception(RuntimeError(f'Inference worker {worker_id} унасан'))
+            if restart:
+                print(f"[RETRY] Inference worker {worker_id} унасан (exit {process.exitcode}), "
+                      f"дахин эхлүүлж байна ({self._restarts[worker_id]}/{MAX_RESTARTS})")
+                self._spawn(worker_id)
+            else:
+                print(f"[ERROR] Inference worker {worker_id} зогслоо, {len(lost)} task алдаатай дууслаа")
+
+    def _collect(self):
+        checked = time.monotonic()
+        while True:
+            if time.monotonic() - checked >= LIVENESS_INTERVAL:
+                self._check_workers()
+                checked = time.monotonic()
+            try:
+                kind, worker_id, payload = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+
+            if kind == 'ready':
+                with self._lock:
+                    self._ready.add(worker_id)
+                print(f"[OK] Inference worker {worker_id} бэлэн боллоо")
+                continue
+            if kind == 'failed':
+                # Дахин эхлүүлсэн ч мөн л ачаалж чадахгүй; процесс гарахад task-ууд нь шилжинэ
+                with self._lock:
+                    self._down.add(worker_id)
+                print(f"[ERROR] Inference worker {worker_id} модел ачаалж чадсангүй: {payload}")
+                continue
+
+            task_id, result = payload
+            with self._lock:
+                # Унасан гэж тооцсон worker-ийн хоцорсон үр дүнг алгасна
+                future, slot, _ = self._pending.pop(task_id, (None, None, None))
+                if future is None:
+                    continue
+                self._load[worker_id] -= 1
+                slot.busy = False
+                if kind == 'done':
+                    self.completed += 1
+                else:
+                    self.errors += 1
+            if kind == 'done':
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _pick_worker(self, key):
+        live = [i for i in range(len(self._processes)) if i not in self._down]
+        if not live:
+            raise RuntimeError('Ажиллах боломжтой inference worker алга')
+        if self.policy == 'round_robin':
+            # Камер бүрийг нэг worker-т тогтмол оноох (зогссон worker-ийг алгасна)
+            if self._assignments.get(key) not in live:
+                worker_id = next(self._round_robin)
+                while worker_id in self._down:
+                    worker_id = next(self._round_robin)
+                self._assignments[key] = worker_id
+            return self._assignments[key]
+        return min(live, key=lambda i: (i not in self._ready, self._load[i]))
+
+    def submit(self, key, frame):
+        """Камерын frame-ийг илрүүлэлтэд илгээх
+
+        Тухайн камерын өмнөх frame боловсруулагдаж байвал None буцаана.
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Inference pool хаагдсан')
+            slot = self._slots.setdefault(key, _FrameSlot(key))
+            if slot.busy:
+                return None
+            worker_id = self._pick_worker(key)
+            shm_name = slot.write(frame)
+            task_id = next(self._task_ids)
+            future = Future()
+            slot.busy = True
+            slot.worker_id = worker_id
+            self._pending[task_id] = (future, slot, worker_id)
+            self._load[worker_id] += 1
+            tasks = self._tasks[worker_id]
+        tasks.put((task_id, key, shm_name, frame.shape))
+        return future
+
+    def is_busy(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            return slot is not None and slot.busy
+
+    def detect(self, key, frame, timeout=None):
+        future = self.submit(key, frame)
+        if future is None:
+            raise RuntimeError(f'{key} камерын өмнөх frame боловсруулагдаж байна')
+        return future.result(timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                'policy': self.policy,
+                'backend': self.backend,
+                'workers': [{
+                    'id': worker_id,
+                    'alive': process.is_alive(),
+                    'ready': worker_id in self._ready,
+                    'down': worker_id in self._down,
+                    'restarts': self._restarts[worker_id],
+                    'in_flight': self._load[worker_id],
+                } for worker_id, process in enumerate(self._processes)],
+                'cameras': len(self._slots),
+                'completed': self.completed,
+                'errors': self.errors,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            for slot in self._slots.values():
+                slot.close()
+            self._slots.clear()
+            for future, _, _ in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+
+class CameraScheduler(threading.Thread):
+    """Бүх capture worker-ийн хамгийн сүүлийн frame-ийг pool руу тасралтгүй илгээх"""
+
+    def __init__(self, capture_manager, pool):
+        super().__init__(name='camera-scheduler', daemon=True)
+        self._capture_manager = capture_manager
+        self._pool = pool
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._submitted = {}
+
+    def _store(self, key, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'error': str(e)}
+        result['timestamp'] = time.time()
+        with self._lock:
+            self._latest[key] = result
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for key in self._capture_manager.keys():
+                worker = self._capture_manager.get(key)
+                if worker is None or not worker.connected or self._pool.is_busy(key):
+                    continue
+                # Өмнө илгээсэн frame-ийг дахин илгээхгүй
+                if self._submitted.get(key) == worker.frames_read:
+                    continue
+                self._submitted[key] = worker.frames_read
+                frames = worker.latest(1, timeout=0)
+                if not frames:
+                    continue
+                try:
+                    future = self._pool.submit(key, frames[0])
+                except RuntimeError as e:
+                    # Бүх worker зогссон: алдааг үр дүнд харуулж, дараагийн камер руу шилжинэ
+                    with self._lock:
+                        self._latest[key] = {'error': str(e), 'timestamp': time.time()}
+                    continue
+                if future is not None:
+                    future.add_done_callback(lambda f, key=key: self._store(key, f))
+            self._stop_event.wait(SCHEDULE_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def results(self):
+        with self._lock:
+            return dict(self._latest)
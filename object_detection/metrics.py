@@ -0,0 +1,229 @@
+import bisect
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Секундээр (Prometheus-ийн анхдагч bucket-уудад ойролцоо)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_items(items))
+        return lines
+
+    def _render_items(self, items):
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [bucket тус бүрийн тоо..., +Inf], нийлбэр
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_items(self, items):
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', bound)])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'vehicle_detection_stage_seconds',
+    'Latency of each detection pipeline stage',
+    ('stage',)))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'vehicle_detection_request_seconds',
+    'HTTP request latency by endpoint',
+    ('endpoint', 'status')))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'vehicle_detection_requests_in_flight',
+    'Requests currently being served'))
+FRAMES_PROCESSED = REGISTRY.register(Counter(
+    'vehicle_detection_frames_processed_total',
+    'Frames run through the detector'))
+DETECTIONS = REGISTRY.register(Counter(
+    'vehicle_detection_detections_total',
+    'Detections after NMS by class',
+    ('class',)))
+CAMERA_OPEN_FAILURES = REGISTRY.register(Counter(
+    'vehicle_detection_camera_open_failures_total',
+    'Failed attempts to open a camera',
+    ('camera',)))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    'vehicle_detection_singleflight_total',
+    'Detection requests by how they were served (computed, coalesced, cached)',
+    ('outcome',)))
+
+
+def record_detections(classes, class_ids):
+    """Frame-ийн илрүүлэлтийг ангиар тоолох"""
+    FRAMES_PROCESSED.inc()
+    for class_id in class_ids:
+        DETECTIONS.inc(**{'class': classes[class_id]})
+
+
+class SlowRequestProfiler:
+    """Сонгосон request-үүдийг cProfile-оор профайлдаж, хамгийн удааныг хадгалах
+
+    Зөвхөн sample_rate хувийн request профайлдагдах тул байнга асаалттай
+    байлгаж болно. cProfile нэг зэрэг нэг л профайл ажиллуулж чадна.
+    """
+
+    def __init__(self, sample_rate=0.0, keep=5):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._active = False
+        self._slowest = []    # (duration, seq, entry) min-heap
+        self._seq = itertools.count()
+
+    @contextmanager
+    def profile(self, name):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            yield
+            return
+        with self._lock:
+            if self._active:
+                busy = True
+            else:
+                busy = False
+                self._active = True
+        if busy:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            with self._lock:
+                self._active = False
+            self._record(name, duration, profiler)
+
+    def _record(self, name, duration, profiler):
+        with self._lock:
+            if len(self._slowest) >= self.keep and duration <= self._slowest[0][0]:
+                return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        entry = {
+            'name': name,
+            'duration_ms': round(duration * 1000, 1),
+            'timestamp': time.time(),
+            'profile': out.getvalue(),
+        }
+        with self._lock:
+            item = (duration, next(self._seq), entry)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import STAGE_LATENCY
+
+
+class ModelRegistry:
+    """Процесс даяар нэг удаа ачаалж, бэлэн (warm) байлгадаг YOLO моделийн бүртгэл.
+
+    cv2.dnn сүлжээг олон thread зэрэг ашиглах нь аюултай тул бүртгэл нь
+    сүлжээнүүдийн pool хадгална: нэг сүлжээг нэг удаад зөвхөн нэг thread
+    ашиглана. Шинэ жин ачаалахад (hot-reload) хуучин сүлжээнүүд ажиллаж
+    байгаа хүсэлтээ дуусгаад хаягдана. Хуучин generation-ий ашиглагдаж буй
+    сүлжээнүүд ч max_nets-д тоологдоно.
+    """
+
+    def __init__(self, loader, max_nets=4, warmup_size=(416, 416), name='yolov3'):
+        # loader(**model_paths) -> (net, classes, output_layers)
+        self._loader = loader
+        self.name = name
+        self._max_nets = max_nets
+        self._warmup_size = warmup_size
+        self._cond = threading.Condition()
+        # Ачаалалт (warm_up/reload) нэг зэрэг зөвхөн нэг удаа явагдана
+        self._load_lock = threading.Lock()
+        self._idle = []
+        self._in_use = {}       # generation -> гаргаж өгсөн (эсвэл үүсгэж буй) сүлжээний тоо
+        self._generation = 0
+        self._model_paths = {}
+        self._info = None
+
+    def _build(self, model_paths):
+        """Сүлжээ ачаалж, хоосон зургаар нэг удаа forward хийж халаах"""
+        start = time.perf_counter()
+        net, classes, output_layers = self._loader(**model_paths)
+        load_time = time.perf_counter() - start
+
+        width, height = self._warmup_size
+        dummy = np.zeros((1, 3, height, width), dtype=np.float32)
+        start = time.perf_counter()
+        net.setInput(dummy)
+        net.forward(output_layers)
+        warmup_time = time.perf_counter() - start
+        STAGE_LATENCY.observe(load_time, stage='model_load')
+        STAGE_LATENCY.observe(warmup_time, stage='model_warmup')
+
+        stats = {
+            'load_time_ms': round(load_time * 1000, 1),
+            'warmup_latency_ms': round(warmup_time * 1000, 1),
+        }
+        return (net, classes, output_layers), stats
+
+    def _nets(self):
+        """Амьд сүлжээний тоо: сул байгаа болон бүх generation-д гаргаж өгсөн"""
+        return len(self._idle) + sum(self._in_use.values())
+
+    def _check_in(self, generation):
+        count = self._in_use.get(generation, 0) - 1
+        if count > 0:
+            self._in_use[generation] = count
+        else:
+            self._in_use.pop(generation, None)
+
+    def warm_up(self, **model_paths):
+        """Эхлэх үед моделийг ачаалж бэлэн болгох"""
+        with self._load_lock:
+            # Зэрэг ирсэн анхны хүсэлтүүдээс зөвхөн нэг нь ачаална
+            if self._info is not None and not model_paths:
+                return self.info()
+            return self._reload(model_paths)
+
+    def reload(self, **model_paths):
+        """Шинэ жинг ачаалж, бэлэн болсны дараа л солих (downtime-гүй)"""
+        with self._load_lock:
+            return self._reload(model_paths)
+
+    def _reload(self, model_paths):
+        with self._cond:
+            paths = dict(self._model_paths)
+        paths.update({k: v for k, v in model_paths.items() if v})
+
+        # Шинэ моделийг lock-гүйгээр ачаална, хуучин нь энэ хооронд ажилласаар байна
+        model, stats = self._build(paths)
+
+        with self._cond:
+            self._generation += 1
+            self._model_paths = paths
+            self._idle = [(self._generation, model)]
+            self._info = {
+                'name': paths.get('model_path') or paths.get('weights_path') or self.name,
+                'backend': self.name,
+                'generation': self._generation,
+                'classes': len(model[1]),
+                'loaded_at': time.time(),
+                **stats,
+            }
+            self._cond.notify_all()
+        print(f"[OK] YOLO модел бэлэн боллоо (generation {self._generation})")
+        return self.info()
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Thread-д зориулсан бэлэн сүлжээ олгох
+
+        Сул сүлжээ байхгүй бөгөөд дээд хязгаарт хүрээгүй бол шинээр үүсгэнэ,
+        хүрсэн бол аль нэг нь чөлөөлөгдөхийг хүлээнэ.
+        """
+        with self._cond:
+            loaded = self._info is not None
+        if not loaded:
+            self.warm_up()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    generation, model = self._idle.pop()
+                    break
+                if self._nets() < self._max_nets:
+                    generation, model = self._generation, None
+                    paths = dict(self._model_paths)
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Чөлөөтэй YOLO сүлжээ олдсонгүй")
+                self._cond.wait(remaining)
+            self._in_use[generation] = self._in_use.get(generation, 0) + 1
+
+        if model is None:
+            try:
+                model, _ = self._build(paths)
+            except Exception:
+                with self._cond:
+                    self._check_in(generation)
+                    self._cond.notify()
+                raise
+
+        try:
+            yield model
+        finally:
+            with self._cond:
+                self._check_in(generation)
+                # Hot-reload хийгдсэн бол хуучин generation-ий сүлжээг хаяна
+                if generation == self._generation:
+                    self._idle.append((generation, model))
+                self._cond.notify()
+
+    def info(self):
+        """Ачаалагдсан моделийн мэдээлэл"""
+        with self._cond:
+            if self._info is None:
+                return {'loaded': False}
+            return {
+                'loaded': True,
+                **self._info,
+                'nets_total': self._nets(),
+                'nets_idle': len(self._idle),
+                'nets_retiring': sum(count for generation, count in self._in_use.items()
+                                     if generation != self._generation),
+                'max_nets': self._max_nets,
+            }
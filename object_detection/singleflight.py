@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import COALESCED_REQUESTS
+
+
+class SingleFlight:
+    """Ижил түлхүүртэй зэрэг ирсэн дуудлагуудыг нэг тооцоололд нэгтгэх
+
+    Эхний дуудлага тооцоолж, бусад нь түүний үр дүнг хүлээж хуваалцана.
+    Амжилттай үр дүнг ttl секундын турш cache-ээс шууд буцаана. Алдааг
+    хүлээж буй бүх дуудлагад дамжуулах боловч cache-д хадгалахгүй.
+    invalidate()-ээс өмнө эхэлсэн тооцооллын үр дүн cache-д орохгүй, шинэ
+    дуудлагууд түүнд нэгдэхгүй.
+    """
+
+    def __init__(self, ttl=0.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._cache = {}    # key -> (monotonic хугацаа, үр дүн)
+        self._generation = 0
+
+    def do(self, key, fn):
+        """fn()-ийн үр дүнг (result, 'computed'|'coalesced'|'cached') хэлбэрээр буцаах"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                COALESCED_REQUESTS.inc(outcome='cached')
+                return entry[1], 'cached'
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                generation = self._generation
+
+        if not leader:
+            COALESCED_REQUESTS.inc(outcome='coalesced')
+            return future.result(), 'coalesced'
+
+        COALESCED_REQUESTS.inc(outcome='computed')
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._forget(key, future)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._forget(key, future)
+            # invalidate() дуудагдсан бол үр дүн хуучин (жишээ нь өмнөх моделийнх)
+            if self.ttl > 0 and generation == self._generation:
+                self._cache[key] = (time.monotonic(), result)
+                self._prune()
+        future.set_result(result)
+        return result, 'computed'
+
+    def _forget(self, key, future):
+        # invalidate()-ийн дараа энэ key-д шинэ тооцоолол эхэлсэн байж болно
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def _prune(self):
+        if len(self._cache) <= self.max_entries:
+            return
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, (ts, _) in self._cache.items() if ts < cutoff]:
+            del self._cache[key]
+        # Бүгд шинэ хэвээр бол хамгийн хуучнаас нь хаяна
+        for key in sorted(self._cache, key=lambda k: self._cache[k][0])[:-self.max_entries]:
+            del self._cache[key]
+
+    def invalidate(self, key=None):
+        """Cache-ийг цэвэрлэж, явагдаж буй тооцооллыг хуучин гэж тэмдэглэх"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._cache.clear()
+                self._calls.clear()
+            else:
+                self._cache.pop(key, None)
+                self._calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'in_flight': len(self._calls),
+                'cached': len(self._cache),
+            }
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MOTION_SCALE = 0.25         # Хөдөлгөөн шалгахдаа frame-ийг жижигрүүлэх харьцаа
+PIXEL_THRESHOLD = 25        # Пикселийн өөрчлөлтийн босго (0-255)
+MOTION_RATIO = 0.02         # Слотын талбайн хэдэн хувь өөрчлөгдвөл YOLO ажиллуулах
+OCCUPANCY_RATIO = 0.3       # Машины хайрцаг слотын талбайн хэдэн хувийг эзэлбэл "Full"
+MAX_INFERENCE_INTERVAL = 60.0  # Хөдөлгөөнгүй байсан ч хамгийн ихдээ ийм хугацаанд нэг удаа YOLO ажиллуулах
+
+
+def load_slot_map(path):
+    """{camera_key: {slot_name: [[x, y], ...]}} хэлбэрийн слотын тохиргоо унших"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_slot_map(path, slot_map):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(slot_map, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class SlotMonitor:
+    """Нэг камерын слот бүрийн эзэмшлийг polygon-оор тодорхойлох
+
+    Слотын пиксел өөрчлөгдөөгүй бол YOLO ажиллуулалгүй өмнөх төлөвийг
+    буцаана.
+    """
+
+    def __init__(self, polygons, max_inference_interval=MAX_INFERENCE_INTERVAL):
+        # polygons: {slot_name: [[x, y], ...]} камерын координатаар
+        self.polygons = {name: np.array(points, dtype=np.int32) for name, points in polygons.items()}
+        self._max_inference_interval = max_inference_interval
+        self._lock = threading.Lock()
+        self._shape = None
+        self._masks = {}
+        self._small_masks = {}
+        self._reference = None
+        self._last_inference = 0.0
+        self.status = {name: 'Empty' for name in self.polygons}
+        self.frames_seen = 0
+        self.inference_calls = 0
+
+    def _prepare(self, shape):
+        height, width = shape[:2]
+        small_size = (max(1, int(width * MOTION_SCALE)), max(1, int(height * MOTION_SCALE)))
+        self._masks = {}
+        self._small_masks = {}
+        for name, polygon in self.polygons.items():
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [polygon], 1)
+            self._masks[name] = mask.astype(bool)
+            small = cv2.resize(mask, small_size, interpolation=cv2.INTER_NEAREST)
+            self._small_masks[name] = small.astype(bool)
+        self._shape = shape[:2]
+        self._small_size = small_size
+        self._reference = None
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, self._small_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_slots(self, gray):
+        """Сүүлийн YOLO-оос хойш пиксел нь өөрчлөгдсөн слотууд"""
+        if self._reference is None:
+            return set(self.polygons)
+        changed = cv2.absdiff(gray, self._reference) > PIXEL_THRESHOLD
+        result = set()
+        for name, mask in self._small_masks.items():
+            area = mask.sum()
+            if area and changed[mask].sum() / area > MOTION_RATIO:
+                result.add(name)
+        return result
+
+    def occupancy(self, boxes):
+        """Машины хайрцгуудыг слотын polygon-той давхцуулж төлөв гаргах"""
+        height, width = self._shape
+        status = {}
+        for name, mask in self._masks.items():
+            area = mask.sum()
+            occupied = False
+            for x, y, w, h in boxes:
+                x0, y0 = max(0, x), max(0, y)
+                x1, y1 = min(width, x + w), min(height, y + h)
+                if x1 <= x0 or y1 <= y0 or not area:
+                    continue
+                if mask[y0:y1, x0:x1].sum() / area >= OCCUPANCY_RATIO:
+                    occupied = True
+                    break
+            status[name] = 'Full' if occupied else 'Empty'
+        return status
+
+    def update(self, frame, detect):
+        """Frame-ийг шалгаж, шаардлагатай үед л detect(frame) -> boxes дуудна"""
+        with self._lock:
+            if self._shape != frame.shape[:2]:
+                self._prepare(frame.shape)
+
+            self.frames_seen += 1
+            gray = self._gray(frame)
+            changed = self.changed_slots(gray)
+            expired = time.monotonic() - self._last_inference > self._max_inference_interval
+
+            inference_ran = False
+            if changed or expired:
+                boxes = detect(frame)
+                self.status = self.occupancy(boxes)
+                self._reference = gray
+                self._last_inference = time.monotonic()
+                self.inference_calls += 1
+                inference_ran = True
+
+            return {
+                'slots': dict(self.status),
+                'changed_slots': sorted(changed),
+                'inference_ran': inference_ran,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frames_seen': self.frames_seen,
+                'inference_calls': self.inference_calls,
+                'slots': dict(self.status),
+            }
@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+
+from metrics import STAGE_LATENCY
+
+JPEG_QUALITY = 85
+MEMORY_SNAPSHOTS = 50               # Санах ойд хадгалах сүүлийн зургийн тоо
+WRITE_QUEUE_SIZE = 100              # Диск рүү бичих дарааллын дээд хэмжээ
+MAX_COUNT = 500                     # Диск дээр хадгалах зургийн дээд тоо
+MAX_BYTES = 200 * 1024 * 1024       # Диск дээрх зургуудын нийт дээд хэмжээ
+MAX_AGE = 7 * 24 * 3600             # Зургийг хадгалах дээд хугацаа (секунд)
+RETENTION_INTERVAL = 60.0           # Хадгалах бодлогыг шалгах давтамж (секунд)
+FILE_PREFIX = 'detected_cars_'
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    """Frame-ийг санах ойд JPEG болгох"""
+    with STAGE_LATENCY.time(stage='image_encode'):
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise Exception("Зургийг JPEG болгож чадсангүй")
+    return jpeg.tobytes()
+
+
+class SnapshotStore:
+    """Тэмдэглэгдсэн зургуудыг санах ойд хадгалж, дискэнд ар талд бичих
+
+    Request-ийн thread зөвхөн JPEG encode хийнэ. Бичилт нь background
+    thread-д хийгдэж, max_count / max_bytes / max_age бодлогоор хуучин
+    файлуудыг устгана. Дараалал дүүрвэл зургийг зөвхөн санах ойд үлдээнэ.
+    """
+
+    def __init__(self, storage_dir, max_count=MAX_COUNT, max_bytes=MAX_BYTES, max_age=MAX_AGE,
+                 memory_snapshots=MEMORY_SNAPSHOTS, queue_size=WRITE_QUEUE_SIZE):
+        self.storage_dir = storage_dir
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._memory_snapshots = memory_snapshots
+        self._memory = OrderedDict()
+        self._files = OrderedDict()   # snapshot_id -> (path, size, created)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.dropped_writes = 0
+        self._writer = None
+
+    def start(self):
+        """Хуучин файлуудыг бүртгэж, background writer эхлүүлэх"""
+        os.makedirs(self.storage_dir, exist_ok=True)
+        existing = []
+        for name in os.listdir(self.storage_dir):
+            if name.startswith(FILE_PREFIX) and name.endswith('.jpg'):
+                path = os.path.join(self.storage_dir, name)
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name[len(FILE_PREFIX):-4], path, stat.st_size))
+        with self._lock:
+            for created, snapshot_id, path, size in sorted(existing):
+                self._files[snapshot_id] = (path, size, created)
+                self._total_bytes += size
+        self._writer = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+        self._writer.start()
+        self._enforce_retention()
+        return self
+
+    def path_for(self, snapshot_id):
+        return os.path.join(self.storage_dir, f'{FILE_PREFIX}{snapshot_id}.jpg')
+
+    def save(self, jpeg):
+        """JPEG-ийг санах ойд хадгалж, дискэнд бичих дараалалд оруулах"""
+        snapshot_id = f'{int(time.time() * 1000)}_{os.urandom(3).hex()}'
+        with self._lock:
+            self._memory[snapshot_id] = jpeg
+            while len(self._memory) > self._memory_snapshots:
+                self._memory.popitem(last=False)
+        try:
+            self._queue.put_nowait((snapshot_id, jpeg))
+        except queue.Full:
+            self.dropped_writes += 1
+            print(f"[ERROR] Зураг бичих дараалал дүүрсэн, {snapshot_id} дискэнд бичигдсэнгүй")
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        """Санах ой эсвэл дискнээс JPEG авах"""
+        with self._lock:
+            jpeg = self._memory.get(snapshot_id)
+            entry = self._files.get(snapshot_id)
+        if jpeg is not None:
+            return jpeg
+        if entry is not None and os.path.exists(entry[0]):
+            with open(entry[0], 'rb') as f:
+                return f.read()
+        return None
+
+    def _run(self):
+        while True:
+            try:
+                snapshot_id, jpeg = self._queue.get(timeout=RETENTION_INTERVAL)
+            except queue.Empty:
+                # Шинэ зураг ирэхгүй байсан ч хугацаа хэтэрсэн файлуудыг цэвэрлэнэ
+                self._enforce_retention()
+                continue
+            try:
+                path = self.path_for(snapshot_id)
+                tmp_path = f'{path}.tmp'
+                with STAGE_LATENCY.time(stage='image_write'):
+                    with open(tmp_path, 'wb') as f:
+                        f.write(jpeg)
+                    os.replace(tmp_path, path)
+                with self._lock:
+                    self._files[snapshot_id] = (path, len(jpeg), time.time())
+                    self._total_bytes += len(jpeg)
+                self._enforce_retention()
+            except Exception as e:
+                print(f"[ERROR] Зураг хадгалахад алдаа гарлаа: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _enforce_retention(self):
+        """Хадгалах бодлогоос хэтэрсэн хамгийн хуучин файлуудыг устгах"""
+        cutoff = time.time() - self.max_age
+        expired = []
+        with self._lock:
+            while self._files:
+                snapshot_id, (path, size, created) = next(iter(self._files.items()))
+                if (len(self._files) > self.max_count or self._total_bytes > self.max_bytes
+                        or created < cutoff):
+                    self._files.popitem(last=False)
+                    self._total_bytes -= size
+                    expired.append(path)
+                else:
+                    break
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def flush(self):
+        """Дараалалд байгаа бүх зургийг бичигдтэл хүлээх"""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'storage_dir': self.storage_dir,
+                'files': len(self._files),
+                'bytes': self._total_bytes,
+                'in_memory': len(self._memory),
+                'pending_writes': self._queue.qsize(),
+                'dropped_writes': self.dropped_writes,
+            }
@@ -0,0 +1,263 @@
+import json
+import threading
+import time
+
+import cv2
+
+from backends import AdaptiveResolution, backend_spec, input_size_for
+from detection import VEHICLE_CLASSES, class_indices, detect_objects
+from metrics import record_detections
+from tracker import Tracker, draw_tracks
+
+JPEG_QUALITY = 80
+DETECT_EVERY = 3        # Tracker хооронд нь таамагладаг тул детекторыг k frame тутамд ажиллуулна
+IDLE_TIMEOUT = 10.0     # Subscriber үлдээгүй үед inference loop зогсох хугацаа (секунд)
+SUBSCRIBER_TIMEOUT = 5.0
+
+
+class InferenceLoop(threading.Thread):
+    """Нэг камерт нэг inference loop: үр дүнг бүх subscriber-т тарааж өгнө
+
+    Subscriber бүр хамгийн сүүлийн үр дүнг уншдаг тул удаан subscriber
+    frame алгасна, loop-ийг саатуулахгүй. Frame бүрийг tracker-аар дамжуулж,
+    детекторыг detect_every frame тутамд л ажиллуулна. adaptive өгөгдвөл
+    inference-ийн хооронд хуримтлагдсан frame-ийн тоогоор оролтын хэмжээг
+    тохируулна.
+    """
+
+    def __init__(self, key, worker, registry, on_idle=None, adaptive=None,
+                 detect_every=DETECT_EVERY, line=None):
+        super().__init__(name=f'inference-{key}', daemon=True)
+        self.key = key
+        self._worker = worker
+        self._registry = registry
+        self._on_idle = on_idle
+        self._adaptive = adaptive
+        self.backend = registry.name
+        self.input_size = input_size_for(registry.name)
+        self.detect_every = max(1, detect_every)
+        self._tracker = Tracker(line=line)
+        self._tracker_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._subscribers = 0
+        self._idle_since = time.monotonic()
+        self._seq = 0
+        self._result = None
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def subscribe(self):
+        """Subscriber нэмэх; loop зогсож байгаа бол False буцаана"""
+        with self._cond:
+            if self._stop_event.is_set():
+                return False
+            self._subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_result(self, last_seq, timeout=SUBSCRIBER_TIMEOUT):
+        """last_seq-ээс шинэ үр дүн гарахыг хүлээх"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._seq <= last_seq and not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._result if self._seq > last_seq else None
+
+    def _idle(self):
+        with self._cond:
+            if self._subscribers == 0 and time.monotonic() - self._idle_since > IDLE_TIMEOUT:
+                # Шинэ subscriber энэ loop-д холбогдохгүйн тулд lock дотор зогсооно
+                self._stop_event.set()
+            return self._stop_event.is_set()
+
+    def set_line(self, line):
+        with self._tracker_lock:
+            self._tracker.line = line
+
+    def tracks(self):
+        """Tracker-ийн идэвхтэй track, dwell, шугам гаталсан үйл явдлууд"""
+        with self._tracker_lock:
+            return self._tracker.state()
+
+    def _detect(self, frame):
+        """Frame дээр детектор ажиллуулж (tracker-ийн [(box, анги), ...], SSE-ийн detections) буцаах"""
+        with self._registry.acquire() as (net, classes, output_layers):
+            class_filter = class_indices(classes, VEHICLE_CLASSES)
+            class_ids, confidences, boxes = detect_objects(
+                frame, net, output_layers, class_filter=class_filter,
+                input_size=self.input_size)
+        record_detections(classes, class_ids)
+        return [(box, classes[class_id]) for class_id, box in zip(class_ids, boxes)], [{
+            'class': classes[class_id],
+            'confidence': round(confidence, 3),
+            'box': box,
+        } for class_id, confidence, box in zip(class_ids, confidences, boxes)]
+
+    def _process(self, frame, detections, detected_objects=None):
+        timestamp = time.time()
+        with self._tracker_lock:
+            tracks, events = self._tracker.step(detections, timestamp)
+            draw_tracks(frame, tracks, self._tracker.line)
+            summary = {
+                'camera': self.key,
+                'timestamp': timestamp,
+                'car_count': sum(1 for track in tracks if track.label == 'car'),
+                'input_size': self.input_size[0],
+                'detected': detections is not None,
+                # /stream/events-ийн анхны schema: детектор ажилласан frame-д түүний
+                # гаралт, бусад frame-д track-уудын таамагласан хайрцаг (confidence None)
+                'detections': detected_objects if detections is not None else [{
+                    'class': track.label,
+                    'confidence': None,
+                    'box': track.box,
+                } for track in tracks],
+                'tracks': [track.to_dict(timestamp) for track in tracks],
+                'events': events,
+                'entries': self._tracker.entries,
+                'exits': self._tracker.exits,
+            }
+
+        cv2.putText(frame, f'Cars: {summary["car_count"]}', (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return summary, jpeg.tobytes() if ok else None
+
+    def run(self):
+        print(f"[OK] {self.key} камерын inference loop эхэллээ")
+        last_read = self._worker.frames_read
+        last_detect_read = last_read
+        step = 0
+        try:
+            while not self._idle():
+                frames_read, frame = self._worker.wait_frame(last_read)
+                if frame is None:
+                    continue
+                last_read = frames_read
+
+                detections = detected_objects = None
+                if step % self.detect_every == 0:
+                    if self._adaptive is not None:
+                        # Өмнөх илрүүлэлтээс хойш боловсруулж амжаагүй frame-ийн тоо
+                        backlog = frames_read - last_detect_read - self.detect_every
+                        self.input_size = self._adaptive.observe(max(0, backlog))
+                    last_detect_read = frames_read
+                    detections, detected_objects = self._detect(frame)
+                step += 1
+                summary, jpeg = self._process(frame, detections, detected_objects)
+                with self._cond:
+                    self._seq += 1
+                    summary['seq'] = self._seq
+                    self._result = (self._seq, summary, jpeg)
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"[ERROR] {self.key} inference loop алдаа: {e}")
+        finally:
+            self._stop_event.set()
+            with self._cond:
+                self._cond.notify_all()
+            if self._on_idle:
+                self._on_idle(self)
+            print(f"[INFO] {self.key} камерын inference loop зогслоо")
+
+
+class StreamHub:
+    """Камер бүрийн inference loop-ийг олон subscriber-т хуваалцуулах"""
+
+    def __init__(self, capture_manager, registry_for, detect_every=DETECT_EVERY):
+        # registry_for(key) -> камерт сонгогдсон backend-ийн ModelRegistry
+        self._capture_manager = capture_manager
+        self._registry_for = registry_for
+        self._detect_every = detect_every
+        self._lines = {}
+        self._loops = {}
+        self._lock = threading.Lock()
+
+    def _discard(self, loop):
+        with self._lock:
+            if self._loops.get(loop.key) is loop:
+                del self._loops[loop.key]
+
+    def _loop(self, key, source):
+        with self._lock:
+            loop = self._loops.get(key)
+            if loop is not None and loop.subscribe():
+                return loop
+            worker = self._capture_manager.ensure(key, source)
+            registry = self._registry_for(key)
+            # Тогтмол оролттой (ONNX) загварын хэмжээг өөрчлөх боломжгүй
+            adaptive = None if backend_spec(registry.name).get('input_size') else AdaptiveResolution()
+            loop = InferenceLoop(key, worker, registry, on_idle=self._discard,
+                                 adaptive=adaptive, detect_every=self._detect_every,
+                                 line=self._lines.get(key))
+            loop.subscribe()
+            loop.start()
+            self._loops[key] = loop
+            return loop
+
+    def results(self, key, source):
+        """Шинэ үр дүн бүрийг (seq, summary, jpeg) хэлбэрээр гаргах generator"""
+        loop = self._loop(key, source)
+        try:
+            last_seq = 0
+            while True:
+                result = loop.wait_result(last_seq)
+                if result is None:
+                    if loop.stopped:
+                        return
+                    continue
+                last_seq = result[0]
+                yield result
+        finally:
+            loop.unsubscribe()
+
+    def mjpeg(self, key, source):
+        """multipart/x-mixed-replace MJPEG урсгал"""
+        for _, _, jpeg in self.results(key, source):
+            if jpeg is None:
+                continue
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                   + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+
+    def events(self, key, source):
+        """Server-Sent Events хэлбэрийн машины тоо, хайрцгийн урсгал"""
+        for seq, summary, _ in self.results(key, source):
+            yield f"id: {seq}\ndata: {json.dumps(summary)}\n\n"
+
+    def set_line(self, key, line):
+        """Камерын орох/гарах тоолох шугамыг тохируулах (ажиллаж буй loop-д шууд)"""
+        with self._lock:
+            self._lines[key] = line
+            loop = self._loops.get(key)
+        if loop is not None:
+            loop.set_line(line)
+
+    def tracks(self, key):
+        with self._lock:
+            loop = self._loops.get(key)
+        return loop.tracks() if loop is not None else None
+
+    def status(self):
+        with self._lock:
+            return [{'key': key, 'subscribers': loop.subscribers,
+                     'backend': loop.backend, 'input_size': loop.input_size[0]}
+                    for key, loop in self._loops.items()]
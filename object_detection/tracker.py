@@ -0,0 +1,243 @@
+import itertools
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+MAX_MISSES = 3          # Дараалан хэдэн илрүүлэлтэд олдохгүй бол track-ийг устгах
+MIN_HITS = 2            # Track-ийг баталгаажсан гэж үзэх илрүүлэлтийн тоо
+IOU_THRESHOLD = 0.3
+MAX_FINISHED = 500      # Хадгалах дууссан track-ийн (dwell) бичлэгийн тоо
+MAX_EVENTS = 500
+
+# Тогтмол хурдны загвар: [cx, cy, талбай, харьцаа, vx, vy, v_талбай]
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1
+_H = np.eye(4, 7)
+_Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 0.0001])
+_R = np.diag([1, 1, 10, 10])
+
+
+def _to_z(box):
+    x, y, w, h = box
+    return np.array([x + w / 2, y + h / 2, w * h, w / max(h, 1e-6)], dtype=float)
+
+
+def _to_box(state):
+    cx, cy, area, ratio = state[:4]
+    w = np.sqrt(max(area * ratio, 0))
+    h = area / w if w > 0 else 0
+    return [int(cx - w / 2), int(cy - h / 2), int(w), int(h)]
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """[x, y, w, h] хайрцгуудын хос бүрийн IoU"""
+    a = np.asarray(boxes_a, dtype=float).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=float).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2) - np.maximum(a[:, 0:1], b[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2) - np.maximum(a[:, 1:2], b[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def associate(track_boxes, detection_boxes, iou_threshold=IOU_THRESHOLD):
+    """IoU-г буурах дарааллаар greedy тааруулж (matches, unmatched_detections) буцаах"""
+    if not len(track_boxes) or not len(detection_boxes):
+        return [], list(range(len(detection_boxes)))
+    ious = iou_matrix(track_boxes, detection_boxes)
+    matches = []
+    used_tracks, used_detections = set(), set()
+    for flat in np.argsort(-ious, axis=None):
+        t, d = np.unravel_index(flat, ious.shape)
+        if ious[t, d] < iou_threshold:
+            break
+        if t in used_tracks or d in used_detections:
+            continue
+        used_tracks.add(t)
+        used_detections.add(d)
+        matches.append((int(t), int(d)))
+    unmatched = [d for d in range(len(detection_boxes)) if d not in used_detections]
+    return matches, unmatched
+
+
+class Track:
+    """Нэг тээврийн хэрэгслийн Kalman filter-тэй track"""
+
+    def __init__(self, track_id, box, label, timestamp):
+        self.id = track_id
+        self.label = label
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.misses = 0
+        self.side = 0
+        self._x = np.zeros(7)
+        self._x[:4] = _to_z(box)
+        self._P = np.diag([10, 10, 10, 10, 1e4, 1e4, 1e4])
+
+    @property
+    def box(self):
+        return _to_box(self._x)
+
+    @property
+    def center(self):
+        return float(self._x[0]), float(self._x[1])
+
+    def predict(self):
+        # Талбай сөрөг болохоос сэргийлнэ
+        if self._x[2] + self._x[6] <= 0:
+            self._x[6] = 0
+        self._x = _F @ self._x
+        self._P = _F @ self._P @ _F.T + _Q
+
+    def update(self, box, label, timestamp):
+        y = _to_z(box) - _H @ self._x
+        S = _H @ self._P @ _H.T + _R
+        K = self._P @ _H.T @ np.linalg.inv(S)
+        self._x = self._x + K @ y
+        self._P = (np.eye(7) - K @ _H) @ self._P
+        self.label = label
+        self.last_seen = timestamp
+        self.hits += 1
+        self.misses = 0
+
+    def to_dict(self, timestamp):
+        return {
+            'id': self.id,
+            'class': self.label,
+            'box': self.box,
+            'dwell': round(timestamp - self.first_seen, 2),
+        }
+
+
+class Tracker:
+    """SORT хэлбэрийн IoU + Kalman tracker
+
+    step(detections)-ийг frame бүрт дуудна. Илрүүлэлт ажиллуулаагүй frame-д
+    detections=None өгвөл track-ууд зөвхөн урьдчилан таамаглагдана, тиймээс
+    детекторыг k frame тутамд ажиллуулж болно. line=((x1, y1), (x2, y2))
+    өгвөл түүнийг гаталсан track-ийн орох/гарах үйл явдлыг бүртгэнэ.
+    """
+
+    def __init__(self, max_misses=MAX_MISSES, min_hits=MIN_HITS, iou_threshold=IOU_THRESHOLD,
+                 line=None):
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.line = line
+        self.entries = 0
+        self.exits = 0
+        self._tracks = []
+        self._ids = itertools.count(1)
+        self._events = deque(maxlen=MAX_EVENTS)
+        self._finished = deque(maxlen=MAX_FINISHED)
+
+    def _side(self, point):
+        """Цэг шугамын аль талд байгаа (-1, 0, 1); сегментийн гадна бол 0"""
+        (x1, y1), (x2, y2) = self.line
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        if length == 0:
+            return 0
+        px, py = point[0] - x1, point[1] - y1
+        if not 0 <= (px * dx + py * dy) / length <= 1:
+            return 0
+        return int(np.sign(dx * py - dy * px))
+
+    def _check_line(self, track, timestamp):
+        side = self._side(track.center)
+        if side == 0:
+            return []
+        previous, track.side = track.side, side
+        if previous == 0 or previous == side or track.hits < self.min_hits:
+            return []
+        # (x1, y1) -> (x2, y2) чиглэлийн дагуу харахад баруун гар тал руу гарах нь entry
+        direction = 'entry' if side > 0 else 'exit'
+        if side > 0:
+            self.entries += 1
+        else:
+            self.exits += 1
+        event = {'track_id': track.id, 'class': track.label, 'direction': direction,
+                 'timestamp': timestamp}
+        self._events.append(event)
+        return [event]
+
+    def step(self, detections=None, timestamp=None):
+        """Нэг frame ахиулах. detections: [(box, label), ...] эсвэл None
+
+        (баталгаажсан track-ууд, энэ алхамд гарсан шугам гаталсан үйл явдлууд) буцаана.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for track in self._tracks:
+            track.predict()
+
+        if detections is not None:
+            matches, unmatched = associate([track.box for track in self._tracks],
+                                           [box for box, _ in detections], self.iou_threshold)
+            matched = set()
+            for t, d in matches:
+                box, label = detections[d]
+                self._tracks[t].update(box, label, timestamp)
+                matched.add(t)
+            for t, track in enumerate(self._tracks):
+                if t not in matched:
+                    track.misses += 1
+            for d in unmatched:
+                box, label = detections[d]
+                self._tracks.append(Track(next(self._ids), box, label, timestamp))
+
+            alive = []
+            for track in self._tracks:
+                if track.misses > self.max_misses:
+                    if track.hits >= self.min_hits:
+                        self._finished.append({
+                            'id': track.id,
+                            'class': track.label,
+                            'first_seen': track.first_seen,
+                            'last_seen': track.last_seen,
+                            'dwell': round(track.last_seen - track.first_seen, 2),
+                        })
+                else:
+                    alive.append(track)
+            self._tracks = alive
+
+        events = []
+        if self.line is not None:
+            for track in self._tracks:
+                events.extend(self._check_line(track, timestamp))
+        return self.confirmed(), events
+
+    def confirmed(self):
+        return [track for track in self._tracks if track.hits >= self.min_hits]
+
+    def count(self, label=None):
+        return sum(1 for track in self.confirmed() if label is None or track.label == label)
+
+    def state(self, timestamp=None):
+        """Идэвхтэй track, сүүлийн үйл явдал, дууссан dwell бичлэгүүд"""
+        timestamp = time.time() if timestamp is None else timestamp
+        return {
+            'tracks': [track.to_dict(timestamp) for track in self.confirmed()],
+            'entries': self.entries,
+            'exits': self.exits,
+            'line': self.line,
+            'events': list(self._events),
+            'finished': list(self._finished),
+        }
+
+
+def draw_tracks(frame, tracks, line=None, color=(0, 255, 0)):
+    """Track-уудыг ID-тай нь, гаталсан шугамыг frame дээр тэмдэглэх"""
+    if line is not None:
+        (x1, y1), (x2, y2) = line
+        cv2.line(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+    for track in tracks:
+        x, y, w, h = track.box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame, f'{track.label} #{track.id}', (x, y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return frame
@@ -1,95 +1,145 @@
-import cv2
-import numpy as np
+import base64
+from functools import partial, wraps
 import os
 from flask import Flask, jsonify, Response, request
+import threading
 import time
 
+from backends import DEFAULT_BACKEND, backend_spec, input_size_for, load_backend
+from capture import BUFFER_SIZE, CaptureManager, camera_source
+from detection import VEHICLE_CLASSES, class_indices, detect_objects_batch
+from discovery import CameraDiscovery
+from inference_pool import CameraScheduler, InferencePool
+from metrics import (REGISTRY, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, SlowRequestProfiler,
+                     record_detections)
+from model_registry import ModelRegistry
+from slots import SlotMonitor, load_slot_map, save_slot_map
+from singleflight import SingleFlight
+from snapshots import SnapshotStore, encode_jpeg
+from stream import DETECT_EVERY, StreamHub
+from tracker import MIN_HITS, Tracker, draw_tracks
+
 app = Flask(__name__)
 
+# Удаан request-үүдийн профайл (PROFILE_SAMPLE_RATE=0.05 гэх мэтээр асаана)
+profiler = SlowRequestProfiler(sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')))
+
+@app.before_request
+def start_request_timer():
+    request.environ['metrics.start'] = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+@app.after_request
+def observe_request(response):
+    start = request.environ.get('metrics.start')
+    if start is not None:
+        REQUEST_LATENCY.observe(time.perf_counter() - start,
+                                endpoint=request.endpoint or 'unknown',
+                                status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request(exc=None):
+    # Алдаа гарсан ч in-flight тоолуурыг буцааж бууруулна
+    if request.environ.pop('metrics.start', None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+def profiled(view):
+    """Сонгогдсон request-ийг cProfile-оор профайлдах"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with profiler.profile(request.path):
+            return view(*args, **kwargs)
+    return wrapper
+
 # Get absolute base path
 base_path = os.path.dirname(os.path.abspath(__file__))
 
-def load_yolo():
-    """YOLO загварыг ачааллах"""
-    try:
-        # Файлуудын замыг зөв зааж өгөх
-        weights_path = os.path.join(base_path, "yolov3.weights")
-        cfg_path = os.path.join(base_path, "yolov3.cfg")
-        names_path = os.path.join(base_path, "coco.names")
-
-        # Файлууд байгаа эсэхийг шалгах
-        if not all(os.path.exists(f) for f in [weights_path, cfg_path, names_path]):
-            raise Exception("YOLO файлууд олдсонгүй")
-
-        net = cv2.dnn.readNet(weights_path, cfg_path)
-        with open(names_path, "r") as f:
-            classes = [line.strip() for line in f.readlines()]
-        
-        layer_names = net.getLayerNames()
-        try:
-            output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers().flatten()]
-        except:
-            output_layers = [layer_names[i[0] - 1] for i in net.getUnconnectedOutLayers()]
-        
-        print("[OK] YOLO модел амжилттай ачааллалаа")
-        return net, classes, output_layers
-    except Exception as e:
-        print(f"[ERROR] YOLO ачааллахад алдаа гарлаа: {str(e)}")
-        raise
-
-# Объект илрүүлэх
-def detect_objects(frame, net, output_layers):
-    height, width = frame.shape[:2]
-    blob = cv2.dnn.blobFromImage(frame, 1/255.0, (416, 416), swapRB=True, crop=False)
-    net.setInput(blob)
-    outputs = net.forward(output_layers)
-
-    class_ids = []
-    confidences = []
-    boxes = []
-
-    for output in outputs:
-        for detection in output:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            if confidence > 0.5:
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-
-                boxes.append([x, y, w, h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
-
-    return class_ids, confidences, boxes
+# Backend бүрт процесс даяар нэг удаа ачаалагдсан моделийн бүртгэл
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', DEFAULT_BACKEND)
+model_registries = {}
+camera_backends = {}    # Камер бүрт сонгосон backend (key -> нэр)
+backend_lock = threading.Lock()
+
+def get_registry(backend=None):
+    """Backend-ийн моделийн бүртгэлийг (анх удаа бол үүсгэж) авах"""
+    backend = backend or INFERENCE_BACKEND
+    backend_spec(backend)
+    with backend_lock:
+        if backend not in model_registries:
+            model_registries[backend] = ModelRegistry(
+                partial(load_backend, backend), warmup_size=input_size_for(backend),
+                name=backend)
+        return model_registries[backend]
+
+def camera_backend(key, requested=None):
+    """Request-д заасан, эсвэл камерт бүртгэсэн backend-ийн нэр"""
+    with backend_lock:
+        return requested or camera_backends.get(key, INFERENCE_BACKEND)
+
+model_registry = get_registry()
+
+# Камер бүрийн байнгын capture worker-ууд
+capture_manager = CaptureManager()
+
+# Олон үзэгчид нэг inference loop хуваалцуулах
+DETECT_EVERY = int(os.environ.get('DETECT_EVERY', str(DETECT_EVERY)))
+stream_hub = StreamHub(capture_manager, lambda key: get_registry(camera_backend(key)),
+                       detect_every=DETECT_EVERY)
+
+# Камер бүрийн слотын polygon тохиргоо
+SLOT_MAP_PATH = os.path.join(base_path, "slot_map.json")
+slot_map = load_slot_map(SLOT_MAP_PATH)
+slot_monitors = {}
+slot_lock = threading.Lock()
+
+# Тэмдэглэгдсэн зургуудыг санах ойд, дискэнд ар талд хадгалах
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(base_path, "snapshots"))
+snapshot_store = SnapshotStore(
+    SNAPSHOT_DIR,
+    max_count=int(os.environ.get('SNAPSHOT_MAX_COUNT', '500')),
+    max_bytes=int(os.environ.get('SNAPSHOT_MAX_BYTES', str(200 * 1024 * 1024))),
+    max_age=float(os.environ.get('SNAPSHOT_MAX_AGE', str(7 * 24 * 3600))),
+).start()
+
+# Нэг камерын давхцсан хүсэлтүүдийг нэгтгэх, үр дүнг богино хугацаанд cache-лэх
+DETECT_CACHE_TTL = float(os.environ.get('DETECT_CACHE_TTL', '2.0'))
+detection_flights = SingleFlight(ttl=DETECT_CACHE_TTL)
+
+# Олон камерын inference-ийг процессуудад хуваарилах (0 бол идэвхгүй)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0'))
+INFERENCE_POLICY = os.environ.get('INFERENCE_POLICY', 'least_loaded')
+inference_pool = None
+camera_scheduler = None
+
+def start_inference_pool(num_workers=INFERENCE_WORKERS, policy=INFERENCE_POLICY):
+    """Worker процессуудыг эхлүүлж бүх камерыг тасралтгүй боловсруулах"""
+    global inference_pool, camera_scheduler
+    inference_pool = InferencePool(num_workers, policy=policy, backend=INFERENCE_BACKEND)
+    camera_scheduler = CameraScheduler(capture_manager, inference_pool)
+    camera_scheduler.start()
+
+def usb_cameras_in_use():
+    """Capture worker-т нээлттэй байгаа USB камерын индексүүд
+
+    Тасарсан эсвэл дахин холбогдохыг хүлээж буй worker камерыг барьдаггүй
+    тул тэдгээрийн индексийг discovery дахин шалгана.
+    """
+    return {int(key.split(':', 1)[1]) for key in capture_manager.connected_keys() if key.startswith('USB:')}
+
+# Камер хайлтын cache
+camera_discovery = CameraDiscovery(in_use=usb_cameras_in_use)
 
 def get_available_cameras():
     """Боломжтой камеруудыг олох"""
-    available_cameras = []
-    
-    # USB камерууд шалгах
-    for i in range(10):  # 0-9 хүртэлх камер шалгах
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            ret, _ = cap.read()
-            if ret:
-                available_cameras.append({
-                    'id': i,
-                    'type': 'USB',
-                    'name': f'USB Camera {i}'
-                })
-            cap.release()
-    
-    return available_cameras
+    return camera_discovery.cameras()
 
 @app.route('/list-cameras', methods=['GET'])
 def list_cameras():
     """Боломжтой камеруудын жагсаалт авах"""
     try:
+        if request.args.get('refresh'):
+            camera_discovery.invalidate()
         cameras = get_available_cameras()
         return jsonify({
             'success': True,
@@ -101,7 +151,338 @@ def list_cameras():
             'error': str(e)
         }), 500
 
+@app.route('/cameras', methods=['GET'])
+def camera_workers():
+    """Ажиллаж буй capture worker-уудын төлөв"""
+    return jsonify({
+        'success': True,
+        'workers': capture_manager.status(),
+        'detect_cache': detection_flights.stats()
+    })
+
+@app.route('/cameras', methods=['POST'])
+def register_camera():
+    """Камерыг бүртгэж байнгын capture worker эхлүүлэх"""
+    try:
+        data = request.get_json(silent=True) or {}
+        key, source = camera_source(data.get('type', 'USB'), data.get('camera_id', 0),
+                                    data.get('ip_address'))
+        if data.get('backend'):
+            backend_spec(data['backend'])
+            with backend_lock:
+                camera_backends[key] = data['backend']
+        worker = capture_manager.ensure(key, source)
+        return jsonify({
+            'success': True,
+            'worker': worker.status(),
+            'backend': camera_backend(key)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/cameras/<path:key>', methods=['DELETE'])
+def unregister_camera(key):
+    """Камерын capture worker-ийг зогсоож төхөөрөмжийг чөлөөлөх"""
+    removed = capture_manager.remove(key)
+    with backend_lock:
+        camera_backends.pop(key, None)
+    return jsonify({
+        'success': removed
+    }), 200 if removed else 404
+
+def stream_source():
+    """Stream endpoint-ийн query параметрээс камер тодорхойлох"""
+    return camera_source(request.args.get('type', 'USB'),
+                         request.args.get('camera_id', 0),
+                         request.args.get('ip_address'))
+
+@app.route('/stream/mjpeg', methods=['GET'])
+def stream_mjpeg():
+    """Тэмдэглэгдсэн frame-уудын MJPEG урсгал"""
+    try:
+        key, source = stream_source()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return Response(stream_hub.mjpeg(key, source),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/stream/events', methods=['GET'])
+def stream_events():
+    """Frame бүрийн машины тоо, хайрцгийг Server-Sent Events-ээр дамжуулах"""
+    try:
+        key, source = stream_source()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return Response(stream_hub.events(key, source), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stream/status', methods=['GET'])
+def stream_status():
+    """Ажиллаж буй inference loop, subscriber-ийн тоо"""
+    return jsonify({
+        'success': True,
+        'streams': stream_hub.status()
+    })
+
+@app.route('/track-line', methods=['POST'])
+def set_track_line():
+    """Камерын орох/гарах тоолох шугамыг тохируулах"""
+    try:
+        data = request.get_json(silent=True) or {}
+        key, _ = camera_source(data.get('type', 'USB'), data.get('camera_id', 0),
+                               data.get('ip_address'))
+        line = data.get('line')
+        if line is not None and (len(line) != 2 or not all(len(point) == 2 for point in line)):
+            raise Exception('Шугам [[x1, y1], [x2, y2]] хэлбэртэй байх ёстой')
+        stream_hub.set_line(key, line)
+        return jsonify({
+            'success': True,
+            'camera': key,
+            'line': line
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/tracks', methods=['GET'])
+def get_tracks():
+    """Stream-ийн tracker: идэвхтэй машин, dwell хугацаа, шугам гаталсан үйл явдлууд"""
+    try:
+        key, _ = stream_source()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    tracks = stream_hub.tracks(key)
+    if tracks is None:
+        return jsonify({'success': False, 'error': f'{key} камерын stream ажиллахгүй байна'}), 404
+    return jsonify({
+        'success': True,
+        'camera': key,
+        **tracks
+    })
+
+def get_slot_monitor(key):
+    """Камерын слот monitor-ийг (тохиргоо байвал) авах"""
+    with slot_lock:
+        if key not in slot_map:
+            return None
+        if key not in slot_monitors:
+            slot_monitors[key] = SlotMonitor(slot_map[key])
+        return slot_monitors[key]
+
+def detect_vehicle_boxes(frame, backend=None):
+    """Frame дээрх тээврийн хэрэгслийн хайрцгууд"""
+    backend = backend or INFERENCE_BACKEND
+    with get_registry(backend).acquire() as (net, classes, output_layers):
+        class_filter = class_indices(classes, VEHICLE_CLASSES)
+        _, _, boxes = detect_objects_batch([frame], net, output_layers,
+                                           class_filter=class_filter,
+                                           input_size=input_size_for(backend))[0]
+    return boxes
+
+@app.route('/slot-map', methods=['GET'])
+def get_slot_map():
+    """Слотын polygon тохиргоо"""
+    with slot_lock:
+        return jsonify({
+            'success': True,
+            'slot_map': slot_map
+        })
+
+@app.route('/slot-map', methods=['POST'])
+def set_slot_map():
+    """Камерын слот бүрт polygon оноох"""
+    try:
+        data = request.get_json(silent=True) or {}
+        key, _ = camera_source(data.get('type', 'USB'), data.get('camera_id', 0),
+                               data.get('ip_address'))
+        slots = data.get('slots')
+        if not slots or not all(len(points) >= 3 for points in slots.values()):
+            raise Exception('Слот бүр хамгийн багадаа 3 цэгтэй polygon байх ёстой')
+        with slot_lock:
+            slot_map[key] = slots
+            slot_monitors.pop(key, None)
+            save_slot_map(SLOT_MAP_PATH, slot_map)
+        return jsonify({
+            'success': True,
+            'camera': key,
+            'slots': slots
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/detect-slots', methods=['POST'])
+@profiled
+def detect_slots():
+    """Слот бүрийн эзэмшлийг тодорхойлох (хөдөлгөөнгүй үед YOLO ажиллуулахгүй)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        key, source = camera_source(data.get('type', 'USB'), data.get('camera_id', 0),
+                                    data.get('ip_address'))
+        monitor = get_slot_monitor(key)
+        if monitor is None:
+            raise Exception(f'{key} камерт слотын тохиргоо алга')
+        
+        worker = capture_manager.ensure(key, source)
+        frames = worker.latest(1)
+        if not frames:
+            raise Exception(worker.last_error or "Камер нээж чадсангүй")
+        
+        backend = camera_backend(key, data.get('backend'))
+        result = monitor.update(frames[0], partial(detect_vehicle_boxes, backend=backend))
+        return jsonify({
+            'success': True,
+            'camera': key,
+            **result,
+            'stats': monitor.stats()
+        })
+    except Exception as e:
+        print(f"[ERROR] Алдаа гарлаа: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/pool/status', methods=['GET'])
+def pool_status():
+    """Inference worker процессуудын төлөв"""
+    if inference_pool is None:
+        return jsonify({'success': False, 'error': 'Inference pool идэвхгүй байна'}), 404
+    return jsonify({
+        'success': True,
+        'pool': inference_pool.status()
+    })
+
+@app.route('/pool/results', methods=['GET'])
+def pool_results():
+    """Камер бүрийн хамгийн сүүлийн илрүүлэлтийн үр дүн"""
+    if camera_scheduler is None:
+        return jsonify({'success': False, 'error': 'Inference pool идэвхгүй байна'}), 404
+    return jsonify({
+        'success': True,
+        'results': camera_scheduler.results()
+    })
+
+@app.route('/snapshots/<snapshot_id>', methods=['GET'])
+def get_snapshot(snapshot_id):
+    """Илрүүлэлтийн зургийг JPEG хэлбэрээр авах"""
+    jpeg = snapshot_store.get(snapshot_id)
+    if jpeg is None:
+        return jsonify({'success': False, 'error': 'Зураг олдсонгүй'}), 404
+    return Response(jpeg, mimetype='image/jpeg')
+
+@app.route('/snapshots', methods=['GET'])
+def snapshot_stats():
+    """Хадгалсан зургуудын статистик"""
+    return jsonify({
+        'success': True,
+        'snapshots': snapshot_store.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format-оор хэмжүүрүүд"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/slow-requests', methods=['GET'])
+def slow_requests():
+    """Профайлдсан хамгийн удаан request-үүд"""
+    return jsonify({
+        'success': True,
+        'sample_rate': profiler.sample_rate,
+        'requests': profiler.slowest()
+    })
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Ачаалагдсан моделийн мэдээлэл авах"""
+    with backend_lock:
+        registries = dict(model_registries)
+        cameras = dict(camera_backends)
+    return jsonify({
+        'success': True,
+        'model': model_registry.info(),
+        'backends': {name: registry.info() for name, registry in registries.items()},
+        'cameras': cameras
+    })
+
+@app.route('/models/reload', methods=['POST'])
+def reload_model():
+    """Шинэ жинг downtime-гүйгээр ачааллах"""
+    try:
+        data = request.get_json(silent=True) or {}
+        info = get_registry(data.get('backend')).reload(
+            weights_path=data.get('weights_path'),
+            cfg_path=data.get('cfg_path'),
+            names_path=data.get('names_path'),
+            model_path=data.get('model_path'),
+        )
+        # Хуучин моделийн үр дүнг дахин өгөхгүй
+        detection_flights.invalidate()
+        return jsonify({
+            'success': True,
+            'model': info
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def count_cars(worker, backend, input_size, vehicles_only, max_frames, batch_size, frame_stride,
+               detect_every):
+    """Камерын сүүлийн frame-уудаас машин тоолж, тэмдэглэсэн зургийг хадгалах"""
+    # Ring buffer-ээс хамгийн сүүлийн frame-уудыг авах
+    frame_stride = min(frame_stride, max(1, (BUFFER_SIZE - 1) // max(1, max_frames - 1)))
+    frames = worker.latest(max_frames, stride=frame_stride)
+    if not frames:
+        raise Exception(worker.last_error or "Камер нээж чадсангүй")
+    
+    # Детекторыг сүүлийн frame-ээс эхлэн k frame тутамд, бусдыг tracker таамаглана
+    detect_indices = list(range(len(frames) - 1, -1, -detect_every))[::-1]
+    detections = {}
+    
+    # Бүртгэлээс бэлэн YOLO сүлжээ авах
+    with get_registry(backend).acquire() as (net, classes, output_layers):
+        class_filter = class_indices(classes, VEHICLE_CLASSES) if vehicles_only else None
+        for start in range(0, len(detect_indices), batch_size):
+            indices = detect_indices[start:start + batch_size]
+            
+            # Batch-ийг нэг forward-оор боловсруулах
+            results = detect_objects_batch(
+                [frames[i] for i in indices], net, output_layers, class_filter=class_filter,
+                input_size=input_size)
+            
+            for index, (class_ids, confidences, boxes) in zip(indices, results):
+                record_detections(classes, class_ids)
+                detections[index] = [(box, classes[class_id])
+                                     for class_id, box in zip(class_ids, boxes)]
+    
+    # Frame тус бүрийн тоог дундажлахын оронд track-уудаар тогтвортой тоолно
+    tracker = Tracker(min_hits=min(MIN_HITS, len(detect_indices)))
+    tracks = []
+    for index in range(len(frames)):
+        tracks, _ = tracker.step(detections.get(index), timestamp=index)
+    final_count = tracker.count('car')
+    draw_tracks(frames[-1], tracks)
+        
+    # Хамгийн сүүлийн frame-ийг санах ойд JPEG болгож, дискэнд ар талд бичих
+    jpeg = encode_jpeg(frames[-1])
+    snapshot_id = snapshot_store.save(jpeg)
+        
+    print(f"[INFO] Нийт {final_count} машин илрүүллээ")
+    return {'car_count': final_count, 'frames_detected': len(detect_indices),
+            'snapshot_id': snapshot_id, 'jpeg': jpeg}
+
 @app.route('/detect-cars-camera', methods=['POST'])
+@profiled
 def detect_cars_camera():
     """Сонгосон камераас машин илрүүлэх"""
     try:
@@ -109,77 +490,44 @@ def detect_cars_camera():
         data = request.get_json()
         camera_id = data.get('camera_id', 0)
         camera_type = data.get('type', 'USB')
-        
-        # YOLO загварыг ачааллах
-        net, classes, output_layers = load_yolo()
-        
-        # Камер нээх
-        if camera_type == 'USB':
-            cap = cv2.VideoCapture(camera_id)
-        else:
-            # IP камерын хаяг
-            ip_address = data.get('ip_address')
-            if not ip_address:
-                raise Exception('IP хаяг заагаагүй байна')
-            cap = cv2.VideoCapture(f'http://{ip_address}/video')
-            
-        if not cap.isOpened():
-            raise Exception("Камер нээж чадсангүй")
-            
-        print(f"[OK] {camera_type} камер амжилттай нээгдлээ")
-        
-        # Тохиргоонууд
-        frame_count = 0
+        vehicles_only = data.get('vehicles_only', True)
         max_frames = 10  # 10 frame авах
-        car_counts = []
-        detected_frames = []
+        # Нэг forward-д орох frame-ийн тоо, frame хооронд алгасах алхам
+        batch_size = max(1, min(int(data.get('batch_size', max_frames)), max_frames))
+        frame_stride = max(1, int(data.get('frame_stride', 1)))
+        # Детектор ажиллуулах frame-ийн давтамж (хооронд нь tracker таамаглана)
+        detect_every = max(1, min(int(data.get('detect_every', DETECT_EVERY)), max_frames))
         
-        while frame_count < max_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Frame боловсруулах
-            class_ids, confidences, boxes = detect_objects(frame, net, output_layers)
-            
-            # Машин тоолох
-            if "car" in classes:
-                car_index = classes.index("car")
-                cars_in_frame = class_ids.count(car_index)
-                car_counts.append(cars_in_frame)
-                
-                # Илрүүлсэн машинуудыг тэмдэглэх
-                for i in range(len(boxes)):
-                    if class_ids[i] == car_index:
-                        x, y, w, h = boxes[i]
-                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                        
-                detected_frames.append(frame)
-            
-            frame_count += 1
-            
-        cap.release()
+        # Камерын capture worker-ийг (шаардлагатай бол) эхлүүлэх
+        key, source = camera_source(camera_type, camera_id, data.get('ip_address'))
+        worker = capture_manager.ensure(key, source)
         
-        # Дундаж машины тоо
-        if car_counts:
-            avg_cars = sum(car_counts) / len(car_counts)
-            final_count = round(avg_cars)
-        else:
-            final_count = 0
-            
-        # Хамгийн сүүлийн frame хадгалах
-        if detected_frames:
-            output_path = os.path.join(base_path, f"detected_cars_{int(time.time())}.jpg")
-            cv2.imwrite(output_path, detected_frames[-1])
-            
-        print(f"[INFO] Нийт {final_count} машин илрүүллээ")
+        # Камерт сонгосон backend, оролтын хэмжээ (тогтмол оролттой загварт үл хамаарна)
+        backend = camera_backend(key, data.get('backend'))
+        input_size = input_size_for(backend, int(data.get('input_size') or 0))
         
-        return jsonify({
+        # Нэг камерын зэрэг ирсэн ижил хүсэлтүүд нэг тооцоолол хуваалцана
+        flight_key = (key, backend, input_size, bool(vehicles_only), frame_stride, detect_every)
+        result, served = detection_flights.do(flight_key, partial(
+            count_cars, worker, backend, input_size, vehicles_only, max_frames, batch_size,
+            frame_stride, detect_every))
+        snapshot_id = result['snapshot_id']
+        
+        response = {
             'success': True,
-            'car_count': final_count,
+            'car_count': result['car_count'],
+            'backend': backend,
+            'input_size': input_size[0],
+            'frames_detected': result['frames_detected'],
+            'served': served,
             'message': 'Машин тоолох үйл явц амжилттай',
-            'image_path': output_path if detected_frames else None
-        })
+            'snapshot_id': snapshot_id,
+            'snapshot_url': f'/snapshots/{snapshot_id}' if snapshot_id else None,
+            'image_path': snapshot_store.path_for(snapshot_id) if snapshot_id else None
+        }
+        if snapshot_id and data.get('inline_image'):
+            response['image_base64'] = base64.b64encode(result['jpeg']).decode('ascii')
+        return jsonify(response)
 
     except Exception as e:
         print(f"[ERROR] Алдаа гарлаа: {str(e)}")
@@ -189,5 +537,26 @@ def detect_cars_camera():
             'message': 'Машин тоолоход алдаа гарлаа'
         }), 500
 
+startup_lock = threading.Lock()
+started = False
+
+def startup():
+    """Моделийг халааж, inference pool-ийг эхлүүлэх (процесст нэг удаа)"""
+    global started
+    with startup_lock:
+        if started:
+            return
+        model_registry.warm_up()
+        if INFERENCE_WORKERS > 0:
+            start_inference_pool()
+        started = True
+
+def create_app():
+    """WSGI серверт зориулсан: gunicorn 'vehicle_detection:create_app()'"""
+    startup()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    startup()
+    # Reloader нь моделийг, worker процессуудыг хоёр дахь процесст дахин ачаалах тул унтраана
+    app.run(debug=True, use_reloader=False)